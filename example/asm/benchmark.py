@@ -0,0 +1,97 @@
+#! /usr/bin/env python
+"""Measure the assembler throughput on listings (front-end and back-end)"""
+import glob
+import logging
+import os
+import time
+from argparse import ArgumentParser
+from pdb import pm
+
+from miasm2.core import parse_asm, asmbloc
+from miasm2.analysis.machine import Machine
+
+
+# Sample name prefix -> architecture
+SAMPLE2ARCH = [("x86_32_", "x86_32"),
+               ("x86_64", "x86_64"),
+               ("aarch64", "aarch64l"),
+               ("armt", "armtl"),
+               ("arm", "arml"),
+               ("mips32", "mips32l"),
+               ("msp430", "msp430"),
+               ]
+
+samples_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                           "..", "samples")
+
+parser = ArgumentParser("Assembler throughput benchmark")
+parser.add_argument("source", nargs="*", help="Source files to assemble "
+                    "(default: example/samples/*.S)")
+parser.add_argument("-r", "--repeat", type=int, default=20,
+                    help="Number of times each listing is assembled")
+args = parser.parse_args()
+
+sources = args.source
+if not sources:
+    sources = sorted(glob.glob(os.path.join(samples_dir, "*.S")))
+
+
+def guess_arch(path):
+    "Return the architecture name of the listing @path"
+    name = os.path.basename(path)
+    for prefix, arch in SAMPLE2ARCH:
+        if name.startswith(prefix):
+            return arch
+    raise ValueError("Unknown architecture for %r" % path)
+
+
+def assemble(machine, path):
+    """Assemble the listing @path
+    Return the number of instructions, and the time spent in the front-end
+    and the back-end"""
+    try:
+        attrib = machine.dis_engine.attrib
+    except AttributeError:
+        attrib = None
+
+    start = time.time()
+    with open(path) as fstream:
+        blocks, symbol_pool = parse_asm.parse_txt(machine.mn, attrib, fstream)
+    parsed = time.time()
+
+    # Pin the listing and its external symbols
+    symbol_pool.set_offset(symbol_pool.getby_name("main"), 0)
+    defined = set(block.label for block in blocks)
+    for i, label in enumerate(symbol_pool.items):
+        if label not in defined and label.offset is None:
+            symbol_pool.set_offset(label, 0x1000000 + 0x10 * i)
+    asmbloc.asm_resolve_final(machine.mn, blocks, symbol_pool)
+    assembled = time.time()
+
+    instr_count = sum(len(block.lines) for block in blocks)
+    return instr_count, parsed - start, assembled - parsed
+
+
+print "%-24s %8s %14s %14s" % ("listing", "lines", "parse (l/s)",
+                                "asm (l/s)")
+total_count = total_parse = total_asm = 0
+for path in sources:
+    machine = Machine(guess_arch(path))
+    machine.log_arch.setLevel(logging.ERROR)
+    count = time_parse = time_asm = 0
+    for _ in xrange(args.repeat):
+        instr_count, t_parse, t_asm = assemble(machine, path)
+        count += instr_count
+        time_parse += t_parse
+        time_asm += t_asm
+    print "%-24s %8d %14.1f %14.1f" % (os.path.basename(path),
+                                       count / args.repeat,
+                                       count / time_parse,
+                                       count / time_asm)
+    total_count += count
+    total_parse += time_parse
+    total_asm += time_asm
+
+print "%-24s %8d %14.1f %14.1f" % ("total", total_count / args.repeat,
+                                   total_count / total_parse,
+                                   total_count / total_asm)
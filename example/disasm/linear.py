@@ -0,0 +1,38 @@
+#! /usr/bin/env python
+"""Linear sweep disassembly of a raw file, mapped in memory"""
+import logging
+from argparse import ArgumentParser
+from pdb import pm
+
+from miasm2.analysis.machine import Machine
+from miasm2.core.asmbloc import log_asmbloc, asm_block_bad
+from miasm2.core.bin_stream import bin_stream_mmap
+
+parser = ArgumentParser("Linear sweep disassembly of a raw file")
+parser.add_argument("filename", help="File to disassemble")
+parser.add_argument("architecture", help="Architecture: " +
+                    ",".join(Machine.available_machine()))
+parser.add_argument("-s", "--start", default=0, type=lambda x: int(x, 0),
+                    help="Starting offset")
+parser.add_argument("-e", "--end", default=None, type=lambda x: int(x, 0),
+                    help="Ending offset (default: end of file)")
+parser.add_argument("-b", "--blocks", action="store_true",
+                    help="Output blocks instead of instructions")
+args = parser.parse_args()
+
+log_asmbloc.setLevel(logging.ERROR)
+
+machine = Machine(args.architecture)
+bs = bin_stream_mmap(args.filename)
+mdis = machine.dis_engine(bs)
+
+if args.blocks:
+    for block in mdis.dis_bloc_linear(args.start, args.end):
+        if isinstance(block, asm_block_bad):
+            continue
+        print block
+else:
+    for instr in mdis.dis_instr_linear(args.start, args.end):
+        print "%.8X %-16s %s" % (instr.offset, instr.b.encode("hex"), instr)
+
+bs.close()
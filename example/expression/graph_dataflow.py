@@ -5,7 +5,7 @@ from pprint import pprint
 from miasm2.expression.expression import get_expr_mem
 from miasm2.arch.x86.ira import ir_a_x86_32
 from miasm2.arch.x86.disasm import dis_x86_32
-from miasm2.analysis.data_analysis import intra_bloc_flow_raw, inter_bloc_flow
+from miasm2.analysis.data_analysis import inter_bloc_flow, DataFlowGraph
 from miasm2.core.graph import DiGraph
 from miasm2.ir.symbexec import symbexec
 
@@ -122,19 +122,35 @@ def gen_bloc_data_flow_graph(ir_arch, ad, block_flow_cb):
             irbloc_0 = irbloc
             break
     assert(irbloc_0 is not None)
-    flow_graph = DiGraph()
-    flow_graph.node2str = lambda n: node2str(flow_graph, n)
-
-    for irbloc in ir_arch.blocs.values():
-        block_flow_cb(ir_arch, flow_graph, irbloc)
 
-    for irbloc in ir_arch.blocs.values():
-        print irbloc
-        print 'IN', [str(x) for x in irbloc.in_nodes]
-        print 'OUT', [str(x) for x in irbloc.out_nodes]
-
-    print '*' * 20, 'interbloc', '*' * 20
-    inter_bloc_flow(ir_arch, flow_graph, irbloc_0.label)
+    if block_flow_cb is None:
+        # Raw IR expressions: use the compact data flow graph
+        data_flow = DataFlowGraph(ir_arch)
+        for irbloc in ir_arch.blocs.values():
+            data_flow.add_block(irbloc)
+
+        for irbloc in ir_arch.blocs.values():
+            print irbloc
+            print 'IN', [str(x) for x in data_flow.in_nodes(irbloc.label)]
+            print 'OUT', [str(x) for x in data_flow.out_nodes(irbloc.label)]
+
+        print '*' * 20, 'interbloc', '*' * 20
+        data_flow.link_blocks(irbloc_0.label)
+        flow_graph = data_flow.to_digraph()
+    else:
+        flow_graph = DiGraph()
+
+        for irbloc in ir_arch.blocs.values():
+            block_flow_cb(ir_arch, flow_graph, irbloc)
+
+        for irbloc in ir_arch.blocs.values():
+            print irbloc
+            print 'IN', [str(x) for x in irbloc.in_nodes]
+            print 'OUT', [str(x) for x in irbloc.out_nodes]
+
+        print '*' * 20, 'interbloc', '*' * 20
+        inter_bloc_flow(ir_arch, flow_graph, irbloc_0.label)
+    flow_graph.node2str = lambda n: node2str(flow_graph, n)
 
     # from graph_qt import graph_qt
     # graph_qt(flow_graph)
@@ -167,7 +183,7 @@ for irbloc in ir_arch.blocs.values():
 if args.symb:
     block_flow_cb = intra_bloc_flow_symb
 else:
-    block_flow_cb = intra_bloc_flow_raw
+    block_flow_cb = None
 
 gen_bloc_data_flow_graph(ir_arch, ad, block_flow_cb)
 
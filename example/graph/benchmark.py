@@ -0,0 +1,77 @@
+#! /usr/bin/env python
+"""Measure the graph algorithms throughput on generated control flow graphs"""
+import random
+import time
+from argparse import ArgumentParser
+from pdb import pm
+
+from miasm2.core.graph import DiGraph
+
+parser = ArgumentParser("Graph algorithms benchmark")
+parser.add_argument("size", nargs="*", type=int,
+                    default=[10000, 30000, 100000],
+                    help="Number of nodes of the generated graphs")
+parser.add_argument("-s", "--seed", type=int, default=0,
+                    help="Random seed of the generator")
+args = parser.parse_args()
+
+
+def gen_cfg(size, rnd):
+    """Generate a control flow graph-like DiGraph of @size nodes, with head
+    0 and leaf @size - 1: each node falls through to the next one, or jumps
+    (mostly forward, sometimes backward) to another one"""
+    graph = DiGraph()
+    for node in xrange(size - 1):
+        graph.add_edge(node, node + 1)
+        choice = rnd.random()
+        if choice < 0.3:
+            # Conditional jump forward
+            dst = min(node + rnd.randint(2, 50), size - 1)
+            graph.add_edge(node, dst)
+        elif choice < 0.4:
+            # Loop
+            graph.add_edge(node, rnd.randint(max(0, node - 100), node))
+        elif choice < 0.42:
+            # Far jump
+            graph.add_edge(node, rnd.randint(0, size - 1))
+    return graph
+
+
+def churn(graph):
+    """Delete and add back each edge, then delete each node"""
+    graph = graph.copy()
+    for src, dst in graph.edges():
+        graph.del_edge(src, dst)
+        graph.add_uniq_edge(src, dst)
+    for node in list(graph.nodes()):
+        graph.del_node(node)
+
+
+BENCHS = [("idoms", lambda graph, head, leaf:
+           graph.compute_immediate_dominators(head)),
+          ("postidoms", lambda graph, head, leaf:
+           graph.compute_immediate_postdominators(leaf)),
+          ("domtree", lambda graph, head, leaf:
+           graph.compute_dominator_tree(head)),
+          ("frontier", lambda graph, head, leaf:
+           graph.compute_dominance_frontier(head)),
+          ("backedges", lambda graph, head, leaf:
+           list(graph.compute_back_edges(head))),
+          ("sccs", lambda graph, head, leaf:
+           list(graph.compute_strongly_connected_components())),
+          ("loops", lambda graph, head, leaf:
+           graph.compute_loop_nesting_forest(head)),
+          ("churn", lambda graph, head, leaf: churn(graph)),
+          ]
+
+rnd = random.Random(args.seed)
+print "%-8s %8s" % ("nodes", "edges"),
+print " ".join("%10s" % name for name, _ in BENCHS)
+for size in args.size:
+    graph = gen_cfg(size, rnd)
+    print "%-8d %8d" % (size, len(graph.edges())),
+    for name, bench in BENCHS:
+        start = time.time()
+        bench(graph, 0, size - 1)
+        print "%9.2fs" % (time.time() - start),
+    print
@@ -0,0 +1,28 @@
+import sys
+from argparse import ArgumentParser
+
+from miasm2.analysis.batch import load_manifest, run_batch
+
+parser = ArgumentParser(description="Run sandboxes on the binaries of a "
+                        "JSON lines manifest")
+parser.add_argument("manifest", help="JSON lines manifest, one job per line")
+parser.add_argument("-o", "--output",
+                    help="JSON lines results (default: stdout)")
+parser.add_argument("-p", "--processes", type=int,
+                    help="Number of worker processes (default: CPUs count)")
+parser.add_argument("-j", "--jitter", default="gcc",
+                    help="Jitter engine (default: gcc)")
+parser.add_argument("-t", "--max-time", type=float,
+                    help="Wall-clock limit per job, in seconds")
+parser.add_argument("-n", "--max-blocks", type=int,
+                    help="Maximum number of blocks run per job")
+args = parser.parse_args()
+
+output = sys.stdout if args.output is None else open(args.output, "w")
+with open(args.manifest) as fstream:
+    count = run_batch(load_manifest(fstream), output,
+                      processes=args.processes, jitter=args.jitter,
+                      max_time=args.max_time, max_blocks=args.max_blocks)
+if output is not sys.stdout:
+    output.close()
+print >> sys.stderr, "%d jobs run" % count
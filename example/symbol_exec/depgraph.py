@@ -25,10 +25,15 @@ parser.add_argument("--do-not-simplify", help="Do not simplify expressions",
 parser.add_argument("--rename-args",
                     help="Rename common arguments (@32[ESP_init] -> Arg1)",
                     action="store_true")
+parser.add_argument("-j", "--jobs", type=int, default=None,
+                    help="Solve path constraints in JOBS processes (implies "
+                    "implicit tracking)")
 parser.add_argument("--json",
                     help="Output solution in JSON",
                     action="store_true")
 args = parser.parse_args()
+if args.jobs:
+    args.implicit = True
 
 # Get architecture
 with open(args.filename) as fstream:
@@ -80,8 +85,17 @@ for line_nb, line in enumerate(current_block.lines):
         break
 
 # Enumerate solutions
+if args.jobs:
+    # Path constraints are solved in a pool of processes
+    solutions = dg.get_solutions(current_block.label, elements, line_nb,
+                                 set(), ctx=init_ctx, processes=args.jobs)
+    results = ((solution.result, solution) for solution in solutions)
+else:
+    results = ((sol, None) for sol in dg.get(current_block.label, elements,
+                                               line_nb, set()))
+
 json_solutions = []
-for sol_nb, sol in enumerate(dg.get(current_block.label, elements, line_nb, set())):
+for sol_nb, (sol, solution) in enumerate(results):
     fname = "sol_%d.dot" % sol_nb
     with open(fname, "w") as fdesc:
             fdesc.write(sol.graph.dot())
@@ -96,7 +110,19 @@ for sol_nb, sol in enumerate(dg.get(current_block.label, elements, line_nb, set(
         if sol.has_loop:
             print '\tLoop involved'
 
-    if args.implicit:
+    if solution is not None:
+        sat = solution.satisfiable
+        constraints = {}
+        for name, value in solution.model.iteritems():
+            if isinstance(value, (int, long)):
+                value = hex(value)
+            constraints[name] = value
+        if args.json:
+            tokens["satisfiability"] = sat
+            tokens["constraints"] = constraints
+        else:
+            print "\tSatisfiability: %s %s" % (sat, constraints)
+    elif args.implicit:
         sat = sol.is_satisfiable
         constraints = {}
         if sat:
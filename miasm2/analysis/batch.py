@@ -0,0 +1,301 @@
+"""Run sandboxes on many binaries, in a pool of worker processes.
+
+Each job runs in its own forked process, with optional wall-clock and block
+count limits enforced by the JiT dispatch loop. Results are written as JSON
+lines. Linux only.
+"""
+
+import os
+import json
+import time
+import errno
+import select
+import signal
+import logging
+import multiprocessing
+
+from miasm2.analysis import sandbox
+from miasm2.jitter.csts import BREAK_SIGALARM, BREAK_BLOCK_LIMIT
+
+log = logging.getLogger("batch")
+hnd = logging.StreamHandler()
+hnd.setFormatter(logging.Formatter("[%(levelname)s]: %(message)s"))
+log.addHandler(hnd)
+log.setLevel(logging.INFO)
+
+# Delay (in seconds) after the wall-clock limit of a job before killing it, if
+# it has not stopped by itself (for instance, if it is stuck in Python code)
+KILL_DELAY = 5
+
+
+def load_manifest(fstream):
+    """Iterator on the jobs of the JSON lines manifest @fstream. Each line is a
+    JSON object:
+        - "fname": binary path
+        - "sandbox": Sandbox class name, from miasm2.analysis.sandbox
+        - "address": (optional) start address (int, or str)
+        - "options": (optional) list of extra sandbox command line options
+        - "jitter", "max_time", "max_blocks", "hit_counts": (optional)
+        override run_batch arguments
+        - "id": (optional) job identifier, default is the line number
+    Empty lines and lines starting with '#' are ignored.
+    """
+    for i, line in enumerate(fstream):
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+        job = json.loads(line)
+        job.setdefault("id", i)
+        yield job
+
+
+def build_sandbox(job, jitter="gcc"):
+    """Return the Sandbox instance of @job (see load_manifest)
+    @jitter: default jitter engine"""
+    sandbox_cls = getattr(sandbox, job["sandbox"])
+    parser = sandbox_cls.parser()
+    parser.add_argument("filename")
+    options = parser.parse_args([job["fname"],
+                                 "-j", job.get("jitter", jitter)] +
+                                list(job.get("options", [])))
+    return sandbox_cls(options.filename, options)
+
+
+def run_job(job, jitter="gcc", max_time=None, max_blocks=None,
+            hit_counts=False):
+    """Run @job (see load_manifest) in the current process and return its
+    result, as a JSON serialisable dictionnary:
+        - "id", "fname": from @job
+        - "status": "exit" if the emulation has been stopped, "break" if a
+        callback has returned a value, "timeout" or "block_limit" if a limit
+        has been reached, "exception" if a Python exception has been raised
+        during the run, "error" if the sandbox cannot be created or its
+        jitter does not support @max_blocks
+        - "error": repr of the Python exception (or the error message), or
+        None
+        - "exception": jitter exception flags
+        - "pc": last program counter
+        - "time": run duration, in seconds
+        - "blocks": number of blocks run, if @max_blocks is set
+        - "api_calls": list of [address, name] of library functions called
+        - "coverage": sorted addresses of the jitted blocks
+        - "hits": sorted [address, hit count] of the run blocks, if
+        @hit_counts is set
+    @jitter: default jitter engine
+    @max_time: default wall-clock limit, in seconds
+    @max_blocks: default maximum number of blocks to run
+    @hit_counts: default block hit counts collection
+    """
+    max_time = job.get("max_time", max_time)
+    max_blocks = job.get("max_blocks", max_blocks)
+    hit_counts = job.get("hit_counts", hit_counts)
+    result = {"id": job.get("id"),
+              "fname": job.get("fname"),
+              "status": None,
+              "error": None,
+              "exception": 0,
+              "pc": None,
+              "time": 0,
+              "blocks": None,
+              "api_calls": [],
+              "coverage": [],
+              "hits": None,
+              }
+
+    try:
+        sb = build_sandbox(job, jitter)
+    except (Exception, SystemExit) as error:
+        result["status"] = "error"
+        result["error"] = repr(error)
+        return result
+    myjit = sb.jitter
+    if max_blocks is not None and not myjit.jit.supports_max_blocks:
+        result["status"] = "error"
+        result["error"] = ("max_blocks is not supported by the %s jitter" %
+                           job.get("jitter", jitter))
+        return result
+
+    # Limits
+    stop_reasons = []
+
+    def stop_on(reason):
+        """Return an exception handler stopping the run for @reason"""
+        def stop(jitter):
+            stop_reasons.append(reason)
+            jitter.run = False
+            return False
+        return stop
+
+    myjit.add_exception_handler(BREAK_SIGALARM, stop_on("timeout"))
+    myjit.add_exception_handler(BREAK_BLOCK_LIMIT, stop_on("block_limit"))
+    if max_blocks is not None:
+        myjit.jit.max_blocks = max_blocks
+        myjit.jit.blocks_count = 0
+    if hit_counts:
+        myjit.coverage_start()
+
+    # API calls log, before the library handlers and stubs
+    api_calls = result["api_calls"]
+
+    def log_api(jitter):
+        api_calls.append([jitter.pc, jitter.libs.fad2cname[jitter.pc]])
+        return True
+
+    def log_stub(addr, stub):
+        name = myjit.libs.fad2cname[addr]
+
+        def logged_stub():
+            api_calls.append([addr, name])
+            return stub()
+        return logged_stub
+
+    if myjit.libs is not None:
+        handler = myjit.breakpoints_handler
+        stubs = myjit.jit.lib_stubs
+        for addr in myjit.libs.fad2cname:
+            handler.set_callback(addr, log_api, *handler.get_callbacks(addr))
+            if addr in stubs:
+                stubs[addr] = log_stub(addr, stubs[addr])
+
+    address = job.get("address")
+    if isinstance(address, basestring):
+        address = int(address, 0)
+
+    start = time.time()
+    if max_time is not None:
+        myjit.vm.set_alarm()
+        signal.setitimer(signal.ITIMER_REAL, max_time)
+    try:
+        sb.run(address)
+    except Exception as error:
+        result["status"] = "exception"
+        result["error"] = repr(error)
+    finally:
+        if max_time is not None:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+    result["time"] = time.time() - start
+
+    if result["status"] is None:
+        if stop_reasons:
+            result["status"] = stop_reasons[0]
+        else:
+            result["status"] = "break" if myjit.run else "exit"
+    result["exception"] = myjit.get_exception()
+    result["pc"] = myjit.pc
+    if max_blocks is not None:
+        result["blocks"] = myjit.jit.blocks_count
+    result["coverage"] = sorted(label.offset for label in myjit.jit.lbl2bloc)
+    if hit_counts:
+        result["hits"] = sorted([addr, count] for addr, count in
+                                myjit.get_coverage().counts.iteritems()
+                                if count)
+    return result
+
+
+def _start_job(job, kwargs):
+    """Fork a process running @job, and return its pid and the file
+    descriptor its result will be sent on"""
+    fd_read, fd_write = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.close(fd_read)
+        try:
+            data = json.dumps(run_job(job, **kwargs))
+            while data:
+                data = data[os.write(fd_write, data):]
+        finally:
+            os._exit(0)
+    os.close(fd_write)
+    return pid, fd_read
+
+
+def run_batch(jobs, output, processes=None, **kwargs):
+    """Run @jobs (see load_manifest) in parallel worker processes, and write
+    their results (see run_job) as JSON lines to @output, as soon as they are
+    available. Results can be out of order.
+
+    A job whose process dies is reported with the "crash" status (and
+    "signal" or "returncode"), a job still running KILL_DELAY seconds after
+    its wall-clock limit is killed and reported with the "killed" status.
+
+    @jobs: iterable of jobs
+    @output: file object
+    @processes: (optional) maximum number of jobs running at once, default is
+    the number of CPUs
+    Extra arguments are passed to run_job.
+    Return the number of jobs run.
+    """
+    if processes is None:
+        processes = multiprocessing.cpu_count()
+    jobs = iter(jobs)
+    # result file descriptor -> [pid, job, data chunks, kill deadline]
+    running = {}
+    count = 0
+    while True:
+        # Start jobs
+        while len(running) < processes:
+            try:
+                job = next(jobs)
+            except StopIteration:
+                break
+            pid, fdesc = _start_job(job, kwargs)
+            max_time = job.get("max_time", kwargs.get("max_time"))
+            deadline = None
+            if max_time is not None:
+                deadline = time.time() + max_time + KILL_DELAY
+            running[fdesc] = [pid, job, [], deadline]
+        if not running:
+            break
+
+        # Wait for results, or the next deadline
+        deadlines = [info[3] for info in running.itervalues()
+                     if info[3] is not None]
+        wait = None
+        if deadlines:
+            wait = max(0, min(deadlines) - time.time())
+        try:
+            ready = select.select(list(running), [], [], wait)[0]
+        except select.error as error:
+            if error.args[0] == errno.EINTR:
+                continue
+            raise
+
+        finished = []
+        for fdesc in ready:
+            chunk = os.read(fdesc, 0x10000)
+            if chunk:
+                running[fdesc][2].append(chunk)
+            else:
+                finished.append((fdesc, False))
+        now = time.time()
+        for fdesc, (pid, _, _, deadline) in running.iteritems():
+            if deadline is not None and deadline <= now and \
+                    (fdesc, False) not in finished:
+                os.kill(pid, signal.SIGKILL)
+                finished.append((fdesc, True))
+
+        for fdesc, killed in finished:
+            pid, job, chunks, _ = running.pop(fdesc)
+            os.close(fdesc)
+            _, status = os.waitpid(pid, 0)
+            result = None
+            if not killed:
+                try:
+                    result = json.loads("".join(chunks))
+                except ValueError:
+                    pass
+            if result is None:
+                result = {"id": job.get("id"), "fname": job.get("fname")}
+                if killed:
+                    result["status"] = "killed"
+                elif os.WIFSIGNALED(status):
+                    result["status"] = "crash"
+                    result["signal"] = os.WTERMSIG(status)
+                else:
+                    result["status"] = "crash"
+                    result["returncode"] = os.WEXITSTATUS(status)
+                log.warning("Job %r: %s", result["id"], result["status"])
+            output.write(json.dumps(result) + "\n")
+            output.flush()
+            count += 1
+    return count
@@ -1,6 +1,10 @@
+from array import array
+import heapq
+
 from miasm2.expression.expression \
-    import get_expr_mem, get_list_rw, ExprId, ExprInt
+    import get_expr_mem, get_list_rw, ExprId, ExprInt, ExprMem
 from miasm2.ir.symbexec import symbexec
+from miasm2.core.graph import DiGraph
 
 
 def get_node_name(label, i, n):
@@ -212,6 +216,264 @@ def inter_bloc_flow(ir_arch, flow_graph, irb_0, link_exec_to_data=True):
         todo.update(out)
 
 
+class DataFlowGraph(object):
+
+    """Compact data flow graph of an IR, equivalent to the DiGraph built by
+    intra_bloc_flow_raw and inter_bloc_flow
+
+    Nodes are integers, indexing arrays of (label, line, variable). Labels and
+    variables are interned. The adjacency of each node is an array of nodes.
+    """
+
+    def __init__(self, ir_arch):
+        """
+        @ir_arch: ir instance whose blocks are analysed
+        """
+        self.ir_arch = ir_arch
+        # Interned labels and variables: id -> object, object -> id
+        self.labels = []
+        self.variables = []
+        self._label_ids = {}
+        self._var_ids = {}
+        # Node id -> label id, line number, variable id
+        self._node_labels = array('l')
+        self._node_lines = array('l')
+        self._node_vars = array('l')
+        # (label id, line number, variable id) -> node id
+        self._node_ids = {}
+        # Node id -> array of successors / predecessors ids
+        self._succs = []
+        self._preds = []
+        # Edges, as (src id << 32) | dst id
+        self._edges = set()
+        # Label id -> {variable id: node id} read / written by the block
+        self._in_nodes = {}
+        self._out_nodes = {}
+
+    def __len__(self):
+        return len(self._succs)
+
+    def _intern(self, obj, objs, obj_ids):
+        obj_id = obj_ids.get(obj)
+        if obj_id is None:
+            obj_id = len(objs)
+            objs.append(obj)
+            obj_ids[obj] = obj_id
+        return obj_id
+
+    def _add_node(self, label_id, line_nb, var_id):
+        """Return the id of the node (@label_id, @line_nb, @var_id), created if
+        needed"""
+        key = (label_id, line_nb, var_id)
+        node = self._node_ids.get(key)
+        if node is None:
+            node = len(self._succs)
+            self._node_ids[key] = node
+            self._node_labels.append(label_id)
+            self._node_lines.append(line_nb)
+            self._node_vars.append(var_id)
+            self._succs.append(array('l'))
+            self._preds.append(array('l'))
+        return node
+
+    def _add_edge(self, src, dst):
+        """Add the edge @src -> @dst if it doesn't already exist"""
+        edge = (src << 32) | dst
+        if edge not in self._edges:
+            self._edges.add(edge)
+            self._succs[src].append(dst)
+            self._preds[dst].append(src)
+
+    def node(self, node):
+        """Return the (label, line number, variable) of the node id @node"""
+        return (self.labels[self._node_labels[node]],
+                self._node_lines[node],
+                self.variables[self._node_vars[node]])
+
+    def successors(self, node):
+        """Return the ids of the successors of the node id @node"""
+        return list(self._succs[node])
+
+    def predecessors(self, node):
+        """Return the ids of the predecessors of the node id @node"""
+        return list(self._preds[node])
+
+    def in_nodes(self, label):
+        """Return a dictionnary variable -> node id of the variables read by
+        the block @label before being written"""
+        nodes = self._in_nodes[self._label_ids[label]]
+        return {self.variables[var_id]: node
+                for var_id, node in nodes.iteritems()}
+
+    def out_nodes(self, label):
+        """Return a dictionnary variable -> node id of the last definitions
+        of the block @label"""
+        nodes = self._out_nodes[self._label_ids[label]]
+        return {self.variables[var_id]: node
+                for var_id, node in nodes.iteritems()}
+
+    def add_block(self, irb):
+        """Add the data flow of @irb, using raw IR expressions (see
+        intra_bloc_flow_raw)
+        @irb: irbloc instance, added once
+        """
+        label_id = self._intern(irb.label, self.labels, self._label_ids)
+        in_nodes = {}
+        out_nodes = {}
+        current_nodes = {}
+
+        def read_node(var, line_nb):
+            """Return the node of the variable @var read at @line_nb"""
+            var_id = self._intern(var, self.variables, self._var_ids)
+            node = current_nodes.get(var_id)
+            if node is None:
+                node = self._add_node(label_id, line_nb, var_id)
+                current_nodes[var_id] = node
+                in_nodes[var_id] = node
+            return node
+
+        for line_nb, assignblk in enumerate(irb.irs):
+            current_nodes.update(out_nodes)
+            for dst, reads in assignblk.get_rw(cst_read=True).iteritems():
+                # Memory addresses flow to the memory reads
+                for read in reads:
+                    if not isinstance(read, ExprMem):
+                        continue
+                    mem_id = self._intern(read, self.variables,
+                                          self._var_ids)
+                    mem_node = self._add_node(label_id, line_nb, mem_id)
+                    for addr in read.arg.get_r(mem_read=False,
+                                               cst_read=True):
+                        self._add_edge(read_node(addr, line_nb), mem_node)
+
+                if not reads:
+                    continue
+                dst_id = self._intern(dst, self.variables, self._var_ids)
+                dst_node = self._add_node(label_id, line_nb + 1, dst_id)
+                out_nodes[dst_id] = dst_node
+                for read in reads:
+                    self._add_edge(read_node(read, line_nb), dst_node)
+
+        self._in_nodes[label_id] = in_nodes
+        self._out_nodes[label_id] = out_nodes
+
+    def link_blocks(self, head, link_exec_to_data=True):
+        """Link the blocks reachable from @head: a variable read by a block is
+        linked to its definitions reaching the block (see inter_bloc_flow)
+        @head: asm_label of the first block
+        @link_exec_to_data: (optional) if set, the variables read by a block
+        also depend on the definitions of the variables read by the IRDst of
+        its predecessor
+        """
+        graph = self.ir_arch.graph
+
+        # Number the block definitions. Sets of definitions are bit vectors
+        def_nodes = []
+        var_masks = {}
+        gen = {}
+        for label_id, out_nodes in self._out_nodes.iteritems():
+            bits = 0
+            for var_id, node in out_nodes.iteritems():
+                bit = 1 << len(def_nodes)
+                def_nodes.append(node)
+                var_masks[var_id] = var_masks.get(var_id, 0) | bit
+                bits |= bit
+            gen[self.labels[label_id]] = bits
+        kill = {}
+        for label_id, out_nodes in self._out_nodes.iteritems():
+            bits = 0
+            for var_id in out_nodes:
+                bits |= var_masks[var_id]
+            kill[self.labels[label_id]] = bits
+
+        def defs_nodes(bits):
+            """Iterate on the nodes of the definitions @bits"""
+            while bits:
+                lowest = bits & -bits
+                yield def_nodes[lowest.bit_length() - 1]
+                bits ^= lowest
+
+        # Reverse postorder of the known blocks reachable from @head
+        postorder = []
+        if head in gen:
+            done = set([head])
+            stack = [(head, graph.successors_iter(head))]
+            while stack:
+                label, succs = stack[-1]
+                for succ in succs:
+                    if succ not in done and succ in gen:
+                        done.add(succ)
+                        stack.append((succ, graph.successors_iter(succ)))
+                        break
+                else:
+                    stack.pop()
+                    postorder.append(label)
+        order = postorder[::-1]
+        rank = {label: i for i, label in enumerate(order)}
+
+        # label -> definitions reaching the entry / the exit
+        reach_in = dict.fromkeys(order, 0)
+        reach_out = {}
+        todo = range(len(order))
+        pending = set(todo)
+        while todo:
+            i = heapq.heappop(todo)
+            pending.remove(i)
+            label = order[i]
+            reach = gen[label] | (reach_in[label] & ~kill[label])
+            if reach_out.get(label) == reach:
+                continue
+            reach_out[label] = reach
+            for succ in graph.successors_iter(label):
+                succ_rank = rank.get(succ)
+                if succ_rank is None:
+                    # Unknown block
+                    continue
+                succ_in = reach_in[succ]
+                if reach & ~succ_in == 0:
+                    continue
+                reach_in[succ] = succ_in | reach
+                if succ_rank not in pending:
+                    pending.add(succ_rank)
+                    heapq.heappush(todo, succ_rank)
+
+        for label, reach in reach_out.iteritems():
+            in_nodes = self._in_nodes[self._label_ids[label]]
+            for var_id, node in in_nodes.iteritems():
+                for src in defs_nodes(reach_in[label] &
+                                      var_masks.get(var_id, 0)):
+                    self._add_edge(src, node)
+
+            if not link_exec_to_data:
+                continue
+            # All data nodes depend on the nodes of the execution flow
+            data_nodes = [node for var_id, node in in_nodes.iteritems()
+                          if not isinstance(self.variables[var_id], ExprInt)]
+            for pred in graph.predecessors_iter(label):
+                pred_reach = reach_out.get(pred)
+                if pred_reach is None:
+                    continue
+                for exec_var in self.ir_arch.blocs[pred].dst.get_r():
+                    exec_id = self._var_ids.get(exec_var)
+                    for src in defs_nodes(pred_reach &
+                                          var_masks.get(exec_id, 0)):
+                        for node in data_nodes:
+                            self._add_edge(src, node)
+
+    def to_digraph(self):
+        """Return the DiGraph of the data flow, with nodes named as in
+        get_node_name"""
+        graph = DiGraph()
+        nodes = [get_node_name(*self.node(node))
+                 for node in xrange(len(self))]
+        for node in nodes:
+            graph.add_node(node)
+        for src, succs in enumerate(self._succs):
+            for dst in succs:
+                graph.add_edge(nodes[src], nodes[dst])
+        return graph
+
+
 class symb_exec_func:
 
     """
@@ -1,5 +1,8 @@
 """Provide dependency graph"""
 
+import os
+import multiprocessing
+
 import miasm2.expression.expression as m2_expr
 from miasm2.core.graph import DiGraph
 from miasm2.core.asmbloc import asm_label, expr_is_int_or_label, expr_is_label
@@ -104,7 +107,8 @@ class DependencyState(object):
     def __init__(self, label, inputs, pending, line_nb=None):
         self.label = label
         self.inputs = inputs
-        self.history = [label]
+        # History, as a linked list (label, previous history)
+        self._history = (label, None)
         self.pending = {k: set(v) for k, v in pending.iteritems()}
         self.line_nb = line_nb
         self.links = set()
@@ -117,13 +121,28 @@ class DependencyState(object):
                                           self.pending,
                                           self.links)
 
+    @property
+    def history(self):
+        """List of the labels of the path, from the first one to the current
+        one"""
+        history = []
+        node = self._history
+        while node is not None:
+            label, node = node
+            history.append(label)
+        history.reverse()
+        return history
+
     def extend(self, label):
         """Return a copy of itself, with itself in history
+        The new state shares its pending elements and links with @self: they
+        must be replaced, not modified in place
         @label: asm_label instance for the new DependencyState's label
         """
-        new_state = self.__class__(label, self.inputs, self.pending)
-        new_state.links = set(self.links)
-        new_state.history = self.history + [label]
+        new_state = self.__class__(label, self.inputs, {})
+        new_state.pending = self.pending
+        new_state.links = self.links
+        new_state._history = (label, self._history)
         return new_state
 
     def get_done_state(self):
@@ -209,7 +228,7 @@ class DependencyResult(DependencyState):
     def __init__(self, state, ira):
         self.label = state.label
         self.inputs = state.inputs
-        self.history = state.history
+        self._history = state._history
         self.pending = state.pending
         self.line_nb = state.line_nb
         self.links = state.links
@@ -398,6 +417,57 @@ class DependencyResultImplicit(DependencyResult):
         return self._solver.model()
 
 
+class DependencySolution(object):
+
+    """Solution of the path constraints of a DependencyResultImplicit, as
+    returned by DependencyGraph.get_solutions"""
+
+    def __init__(self, result, satisfiable, values, model):
+        """
+        @result: the solved DependencyResultImplicit instance
+        @satisfiable: True, False, or None if the solver gave up (time budget
+        exhausted, ...)
+        @values: dictionnary input element -> int, concrete value of the
+        inputs for the solution (empty if not satisfiable)
+        @model: dictionnary z3 variable name -> int (or str for non bit-vector
+        values)
+        """
+        self.result = result
+        self.satisfiable = satisfiable
+        self.values = values
+        self.model = model
+
+    def __repr__(self):
+        return "<Solution: %r %r>" % (self.satisfiable, self.values)
+
+
+# Context shared with the solving processes: (DependencyGraph instance, list
+# of labels, list of inputs, initial context, time budget). Workers inherit it
+# on fork, so that expressions and labels do not have to be pickled
+_solutions_context = None
+
+
+def _solve_result(job):
+    """Solve the encoded result @job (see DependencyGraph._encode_result) in a
+    worker process"""
+    depgraph, labels, inputs, ctx, timeout = _solutions_context
+    index, result = depgraph._decode_result(job, labels, inputs)
+    return index, depgraph._solve(result, inputs, ctx, timeout)
+
+
+class PendingSons(object):
+
+    """Stand for the dependency nodes pending on @element when entering a
+    block, in block summaries"""
+    __slots__ = ["element"]
+
+    def __init__(self, element):
+        self.element = element
+
+    def __repr__(self):
+        return '%s(%r)' % (self.__class__.__name__, self.element)
+
+
 class FollowExpr(object):
 
     "Stand for an element (expression, depnode, ...) to follow or not"
@@ -448,7 +518,8 @@ class DependencyGraph(object):
     def __init__(self, ira, implicit=False, apply_simp=True, follow_mem=True,
                  follow_call=True):
         """Create a DependencyGraph linked to @ira
-        The IRA graph must have been computed
+        The IRA graph must have been computed. It must not be modified
+        afterwards, as block summaries are cached
 
         @ira: IRAnalysis instance
         @implicit: (optional) Track IRDst for each block in the resulting path
@@ -461,6 +532,8 @@ class DependencyGraph(object):
         # Init
         self._ira = ira
         self._implicit = implicit
+        # (label, line_nb, pending signature) -> block summary
+        self._summaries = {}
 
         # Create callback filters. The order is relevant.
         self._cb_follow = []
@@ -585,6 +658,76 @@ class DependencyGraph(object):
         for cur_line_nb, assignblk in reversed(list(enumerate(irb.irs[:line_nb]))):
             self._track_exprs(state, assignblk, cur_line_nb)
 
+    def _get_block_summary(self, label, line_nb, pending):
+        """Return the summary of the dependencies followed in the block
+        @label, up to @line_nb, for the pending elements @pending.
+
+        The summary only depends on the pending elements, and on whether
+        their pending dependency nodes are empty or not. It is computed once,
+        with PendingSons standing for the pending dependency nodes, as a
+        tuple:
+        - frozenset of the new links (depnode, depnode)
+        - list of (depnode, element): links from depnode to each node pending
+        on element
+        - dictionary element -> (frozenset of depnodes, elements whose pending
+        nodes are also pending on element)
+        """
+        key = (label, line_nb,
+               frozenset((element, bool(depnodes))
+                         for element, depnodes in pending.iteritems()))
+        summary = self._summaries.get(key)
+        if summary is not None:
+            return summary
+
+        state = DependencyState(label, None,
+                                {element: ([PendingSons(element)]
+                                           if depnodes else [])
+                                 for element, depnodes in pending.iteritems()},
+                                line_nb)
+        self._compute_intrablock(state)
+
+        links, sons_links = set(), []
+        for depnode, son in state.links:
+            if isinstance(son, PendingSons):
+                sons_links.append((depnode, son.element))
+            else:
+                links.add((depnode, son))
+        new_pending = {}
+        for element, depnodes in state.pending.iteritems():
+            new_pending[element] = (
+                frozenset(depnode for depnode in depnodes
+                          if not isinstance(depnode, PendingSons)),
+                tuple(depnode.element for depnode in depnodes
+                      if isinstance(depnode, PendingSons)))
+        summary = (frozenset(links), sons_links, new_pending)
+        self._summaries[key] = summary
+        return summary
+
+    def _apply_block_summary(self, state):
+        """Follow dependencies tracked in @state in the current irbloc, using
+        the block summary
+        @state: instance of DependencyState"""
+        links, sons_links, summary_pending = self._get_block_summary(
+            state.label, state.line_nb, state.pending)
+        pending = state.pending
+
+        new_links = set(links)
+        for depnode, element in sons_links:
+            for son in pending[element]:
+                new_links.add((depnode, son))
+        if not new_links.issubset(state.links):
+            state.links = state.links.union(new_links)
+
+        new_pending = {}
+        for element, (depnodes, sons_of) in summary_pending.iteritems():
+            if sons_of:
+                depnodes = set(depnodes)
+                for sons_element in sons_of:
+                    depnodes.update(pending[sons_element])
+                depnodes = frozenset(depnodes)
+            new_pending[element] = depnodes
+        state.pending = new_pending
+
     def get(self, label, elements, line_nb, heads):
         """Compute the dependencies of @elements at line number @line_nb in
         the block named @label in the current IRA, before the execution of
@@ -598,13 +741,15 @@ class DependencyGraph(object):
         # Init the algorithm
         pending = {element: set() for element in elements}
         state = DependencyState(label, elements, pending, line_nb)
+        # Links and pending elements are shared between states
+        state.links = frozenset()
         todo = set([state])
         done = set()
         dpResultcls = DependencyResultImplicit if self._implicit else DependencyResult
 
         while todo:
             state = todo.pop()
-            self._compute_intrablock(state)
+            self._apply_block_summary(state)
             done_state = state.get_done_state()
             if done_state in done:
                 continue
@@ -618,12 +763,133 @@ class DependencyGraph(object):
 
             if self._implicit:
                 # Force IRDst to be tracked, except in the input block
-                state.pending[self._ira.IRDst] = set()
+                state.pending = dict(state.pending)
+                state.pending[self._ira.IRDst] = frozenset()
 
             # Propagate state to parents
             for pred in self._ira.graph.predecessors_iter(state.label):
                 todo.add(state.extend(pred))
 
+    def _solve(self, result, inputs, ctx, timeout):
+        """Solve the path constraints of @result
+        Return (satisfiable, input values as a list following @inputs, model)
+        @result: DependencyResultImplicit instance
+        @inputs: list of the inputs of @result
+        @ctx: initial context of the emulation, or None
+        @timeout: time budget in seconds, or None
+        """
+        values = result.emul(ctx=ctx)
+        solver = result._solver
+        if timeout is not None:
+            solver.set("timeout", max(1, int(timeout * 1000)))
+        check = solver.check()
+        if check == z3.unknown:
+            return None, [], {}
+        if check == z3.unsat:
+            return False, [], {}
+
+        model = solver.model()
+        variables = {}
+        for decl in model.decls():
+            value = model[decl]
+            if z3.is_bv_value(value):
+                value = value.as_long()
+            else:
+                value = str(value)
+            variables[decl.name()] = value
+        # Model completion extends the model: evaluate inputs last
+        translator = Translator.to_language("z3")
+        concrete = []
+        for element in inputs:
+            value = model.eval(translator.from_expr(values[element]),
+                               model_completion=True)
+            concrete.append(value.as_long())
+        return True, concrete, variables
+
+    def _encode_result(self, index, result, label2idx):
+        """Encode @result as picklable data, using @label2idx to number the
+        labels of the IRA. Only the relevant destinations are kept, as they
+        are the only ones used by the emulation"""
+        lines = set()
+        for depnode in result.relevant_nodes:
+            irb = self._ira.blocs[depnode.label]
+            dsts = list(irb.irs[depnode.line_nb])
+            if depnode.element in irb.irs[depnode.line_nb]:
+                dst_idx = dsts.index(depnode.element)
+            else:
+                dst_idx = None
+            lines.add((label2idx[depnode.label], depnode.line_nb, dst_idx))
+        history = [label2idx[label] for label in result.history]
+        return index, history, list(lines)
+
+    def _decode_result(self, job, labels, inputs):
+        """Rebuild the DependencyResultImplicit encoded in @job
+        Return (index, DependencyResultImplicit instance)"""
+        index, history, lines = job
+        state = DependencyState(labels[history[0]], set(inputs), {})
+        for label_idx in history[1:]:
+            state = state.extend(labels[label_idx])
+        links = set()
+        for label_idx, line_nb, dst_idx in lines:
+            label = labels[label_idx]
+            assignblk = self._ira.blocs[label].irs[line_nb]
+            if dst_idx is None:
+                # Only the line matters, not the element
+                element = m2_expr.ExprInt(0, 1)
+            else:
+                element = list(assignblk)[dst_idx]
+            links.add((DependencyNode(label, element, line_nb), None))
+        state.links = links
+        return index, DependencyResultImplicit(state, self._ira)
+
+    def get_solutions(self, label, elements, line_nb, heads, ctx=None,
+                      processes=None, timeout=None):
+        """Solve the path constraints of the results of get(label, elements,
+        line_nb, heads) using a pool of @processes processes, each one with
+        its own z3 context. Results are streamed to the workers as they are
+        found. Only available in implicit mode
+        The IRA and @ctx must not be modified during the iteration
+        @ctx: (optional) initial context of the emulation
+        @processes: (optional) number of processes (default: number of CPUs).
+        If 1, or if the OS does not fork, solve in the current process
+        @timeout: (optional) time budget of a query, in seconds
+        Return an iterator on DependencySolution, in completion order
+        """
+        global _solutions_context
+        if not self._implicit:
+            raise ValueError("Solutions need the implicit mode")
+        inputs = list(elements)
+        results = self.get(label, elements, line_nb, heads)
+
+        if processes == 1 or not hasattr(os, "fork"):
+            for result in results:
+                satisfiable, values, model = self._solve(result, inputs, ctx,
+                                                         timeout)
+                yield DependencySolution(result, satisfiable,
+                                         dict(zip(inputs, values)), model)
+            return
+
+        labels = list(self._ira.blocs)
+        label2idx = {lbl: index for index, lbl in enumerate(labels)}
+        pending = {}
+
+        def jobs():
+            """Encode results as they are found"""
+            for index, result in enumerate(results):
+                pending[index] = result
+                yield self._encode_result(index, result, label2idx)
+
+        _solutions_context = (self, labels, inputs, ctx, timeout)
+        pool = multiprocessing.Pool(processes)
+        try:
+            for index, (satisfiable, values, model) in pool.imap_unordered(
+                    _solve_result, jobs()):
+                yield DependencySolution(pending.pop(index), satisfiable,
+                                         dict(zip(inputs, values)), model)
+        finally:
+            pool.terminate()
+            _solutions_context = None
+
     def get_from_depnodes(self, depnodes, heads):
         """Alias for the get() method. Use the attributes of @depnodes as
         argument.
@@ -1,5 +1,10 @@
 import os
+import time
+import errno
+import select
+import signal
 import logging
+import cPickle
 from argparse import ArgumentParser
 
 from miasm2.analysis.machine import Machine
@@ -65,6 +70,15 @@ class Sandbox(object):
         if self.options.dumpblocs:
             self.jitter.jit.log_newbloc = True
 
+        if self.options.trace:
+            self.jitter.trace_start(self.options.trace,
+                                    regs=self.options.trace_regs,
+                                    mem=self.options.trace_mem,
+                                    sample=self.options.trace_sample)
+
+        if self.options.drcov or self.options.lcov:
+            self.jitter.coverage_start()
+
     @classmethod
     def parser(cls, *args, **kwargs):
         """
@@ -93,6 +107,21 @@ class Sandbox(object):
                             help="Don't log function calls")
         parser.add_argument('-i', "--dependencies", action="store_true",
                             help="Load PE and its dependencies")
+        parser.add_argument("--heap-redzone", type=int, default=0,
+                            help="Size of the red-zones around heap chunks")
+        parser.add_argument("--trace",
+                            help="Record executed blocks in this binary trace")
+        parser.add_argument("--trace-regs", action="store_true",
+                            help="Record modified registers in the trace")
+        parser.add_argument("--trace-mem", action="store_true",
+                            help="Record memory accesses in the trace")
+        parser.add_argument("--trace-sample", type=int, default=1,
+                            help="Only record one block out of this number")
+        parser.add_argument("--drcov",
+                            help="Write the executed blocks in this drcov file")
+        parser.add_argument("--lcov",
+                            help="Write the block hit counts in this lcov-like"
+                            " file")
 
         for base_cls in cls._classes_():
             base_cls.update_parser(parser)
@@ -126,6 +155,178 @@ class Sandbox(object):
             self.jitter.init_run(addr)
             self.jitter.continue_run()
 
+        if self.options.trace:
+            self.jitter.trace_stop()
+
+        if self.options.drcov or self.options.lcov:
+            coverage = self.jitter.get_coverage()
+            if self.options.drcov:
+                with open(self.options.drcov, "wb") as fdesc:
+                    coverage.write_drcov(fdesc)
+            if self.options.lcov:
+                with open(self.options.lcov, "w") as fdesc:
+                    coverage.write_lcov(fdesc)
+
+    def run_job(self, job):
+        """
+        Run a job in the sandbox and return its result.
+        @job: dictionnary, with optional keys:
+            - "addr": start address (int), as for run
+            - "regs": {register name: value} to set before running
+            - "memory": list of (address, data) to write before running
+            - "dump": list of (address, size) to read after running
+
+        Return a dictionnary:
+            - "status": "exit" if the emulation has been stopped, "break" if
+        a callback has returned a value, "exception" if a Python exception
+        has been raised
+            - "error": repr of the Python exception, or None
+            - "exception": jitter exception flags
+            - "regs": general purpose registers
+            - "memory": {(address, size): data, or None if unreadable}
+            - "time": run duration, in seconds
+        """
+        for name, value in job.get("regs", {}).iteritems():
+            setattr(self.jitter.cpu, name, value)
+        for addr, data in job.get("memory", []):
+            self.jitter.vm.set_mem(addr, data)
+
+        error = None
+        start = time.time()
+        try:
+            self.run(job.get("addr"))
+        except Exception as error:
+            status = "exception"
+        else:
+            status = "break" if self.jitter.run else "exit"
+        duration = time.time() - start
+        exception = self.jitter.get_exception()
+
+        memory = {}
+        for addr, size in job.get("dump", []):
+            try:
+                memory[(addr, size)] = self.jitter.vm.get_mem(addr, size)
+            except RuntimeError:
+                memory[(addr, size)] = None
+        return {"status": status,
+                "error": None if error is None else repr(error),
+                "exception": exception,
+                "regs": self.jitter.cpu.get_gpreg(),
+                "memory": memory,
+                "time": duration,
+                }
+
+    def fork_server(self, jobs, results, timeout=None):
+        """
+        Serve jobs until @jobs is closed. Each job (see run_job) is run in a
+        forked child, which inherits the initialised sandbox (loaded binary,
+        libraries, JiT backend and already jitted code) and is discarded
+        afterwards. Linux only.
+        Jobs and results are pickled on the file objects @jobs and @results
+        (pipes, or sockets with makefile). A job is a dictionnary, a result is
+        the dictionnary returned by run_job. A result "status" can also be
+        "timeout" or "crash" (with "signal" or "returncode" keys).
+        @timeout: (optional) maximum duration of a job, in seconds
+        """
+        while True:
+            try:
+                job = cPickle.load(jobs)
+            except EOFError:
+                break
+
+            fd_read, fd_write = os.pipe()
+            pid = os.fork()
+            if pid == 0:
+                # Child: run the job, send its result and never come back
+                os.close(fd_read)
+                try:
+                    result = cPickle.dumps(self.run_job(job),
+                                           cPickle.HIGHEST_PROTOCOL)
+                    while result:
+                        result = result[os.write(fd_write, result):]
+                finally:
+                    os._exit(0)
+
+            os.close(fd_write)
+            result = self._fork_server_wait(pid, fd_read, timeout)
+            os.close(fd_read)
+            cPickle.dump(result, results, cPickle.HIGHEST_PROTOCOL)
+            results.flush()
+
+    @staticmethod
+    def _fork_server_wait(pid, fdesc, timeout):
+        """Return the result of the fork_server child @pid, sent on @fdesc"""
+        deadline = None if timeout is None else time.time() + timeout
+        data = []
+        timed_out = False
+        while True:
+            wait = None if deadline is None else max(0, deadline - time.time())
+            try:
+                ready = select.select([fdesc], [], [], wait)[0]
+            except select.error as error:
+                if error.args[0] == errno.EINTR:
+                    continue
+                raise
+            if not ready:
+                timed_out = True
+                os.kill(pid, signal.SIGKILL)
+                break
+            chunk = os.read(fdesc, 0x10000)
+            if not chunk:
+                break
+            data.append(chunk)
+        _, status = os.waitpid(pid, 0)
+
+        if timed_out:
+            return {"status": "timeout"}
+        try:
+            return cPickle.loads("".join(data))
+        except Exception:
+            if os.WIFSIGNALED(status):
+                return {"status": "crash", "signal": os.WTERMSIG(status)}
+            return {"status": "crash", "returncode": os.WEXITSTATUS(status)}
+
+
+class ForkServer(object):
+
+    """
+    Run a Sandbox fork_server in a child process, and submit jobs to it
+    """
+
+    def __init__(self, sandbox, timeout=None):
+        """
+        @sandbox: initialised Sandbox instance
+        @timeout: (optional) maximum duration of a job, in seconds
+        """
+        jobs_read, jobs_write = os.pipe()
+        results_read, results_write = os.pipe()
+        self.pid = os.fork()
+        if self.pid == 0:
+            os.close(jobs_write)
+            os.close(results_read)
+            try:
+                sandbox.fork_server(os.fdopen(jobs_read, "rb"),
+                                    os.fdopen(results_write, "wb"),
+                                    timeout)
+            finally:
+                os._exit(0)
+        os.close(jobs_read)
+        os.close(results_write)
+        self.jobs = os.fdopen(jobs_write, "wb")
+        self.results = os.fdopen(results_read, "rb")
+
+    def submit(self, **job):
+        """Run a job (see Sandbox.run_job) and return its result"""
+        cPickle.dump(job, self.jobs, cPickle.HIGHEST_PROTOCOL)
+        self.jobs.flush()
+        return cPickle.load(self.results)
+
+    def close(self):
+        """Stop the fork server"""
+        self.jobs.close()
+        self.results.close()
+        os.waitpid(self.pid, 0)
+
 
 class OS(object):
 
@@ -169,7 +370,8 @@ class OS_Win(OS):
 
     def __init__(self, custom_methods, *args, **kwargs):
         from miasm2.jitter.loader.pe import vm_load_pe, vm_load_pe_libs,\
-            preload_pe, libimp_pe, vm_load_pe_and_dependencies
+            preload_pe, libimp_pe, vm_load_pe_and_dependencies, \
+            vm_load_pe_libs_cached
         from miasm2.os_dep import win_api_x86_32, win_api_x86_32_seh
         methods = win_api_x86_32.__dict__
         methods.update(custom_methods)
@@ -180,6 +382,7 @@ class OS_Win(OS):
         libs = libimp_pe()
         self.libs = libs
         win_api_x86_32.winobjs.runtime_dll = libs
+        win_api_x86_32.winobjs.heap.redzone = self.options.heap_redzone
 
         self.name2module = {}
         fname_basename = os.path.basename(self.fname).lower()
@@ -189,11 +392,19 @@ class OS_Win(OS):
             self.pe = vm_load_pe(self.jitter.vm, fstream.read(),
                                  load_hdr=self.options.load_hdr,
                                  name=self.fname,
+                                 fstream=fstream,
                                  **kwargs)
             self.name2module[fname_basename] = self.pe
 
         # Load library
-        if self.options.loadbasedll:
+        if self.options.loadbasedll and self.options.dll_cache:
+
+            # Load and patch libs from the loader cache
+            self.name2module.update(vm_load_pe_libs_cached(
+                self.jitter.vm, self.ALL_IMP_DLL, libs, self.modules_path,
+                self.options.dll_cache, **kwargs))
+
+        elif self.options.loadbasedll:
 
             # Load libs in memory
             self.name2module.update(vm_load_pe_libs(self.jitter.vm,
@@ -244,6 +455,9 @@ class OS_Win(OS):
                             help="Load base dll (path './win_dll')")
         parser.add_argument('-r', "--parse-resources",
                             action="store_true", help="Load resources")
+        parser.add_argument('-k', "--dll-cache",
+                            help="Loader cache of base dll, built on first "
+                            "use (with -l)")
 
 
 class OS_Linux(OS):
@@ -258,6 +472,7 @@ class OS_Linux(OS):
 
         # Import manager
         self.libs = libimp_elf()
+        linux_stdlib.linobjs.heap.redzone = self.options.heap_redzone
 
         with open(self.fname) as fstream:
             self.elf = vm_load_elf(self.jitter.vm, fstream.read(),
@@ -283,6 +498,7 @@ class OS_Linux_str(OS):
         # Import manager
         libs = libimp_elf()
         self.libs = libs
+        linux_stdlib.linobjs.heap.redzone = self.options.heap_redzone
 
         data = open(self.fname).read()
         self.options.load_base_addr = int(self.options.load_base_addr, 0)
@@ -11,6 +11,7 @@ def cb_aarch64_disasm(*args, **kwargs):
 
 class dis_aarch64b(disasmEngine):
     attrib = "b"
+    resync_step = 4
     def __init__(self, bs=None, **kwargs):
         super(dis_aarch64b, self).__init__(
             mn_aarch64, self.attrib, bs,
@@ -20,6 +21,7 @@ class dis_aarch64b(disasmEngine):
 
 class dis_aarch64l(disasmEngine):
     attrib = "l"
+    resync_step = 4
     def __init__(self, bs=None, **kwargs):
         super(dis_aarch64l, self).__init__(
             mn_aarch64, self.attrib, bs,
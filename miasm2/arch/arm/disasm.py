@@ -37,22 +37,26 @@ def cb_arm_disasm(*args, **kwargs):
 
 class dis_armb(disasmEngine):
     attrib = 'b'
+    resync_step = 4
     def __init__(self, bs=None, **kwargs):
         super(dis_armb, self).__init__(mn_arm, self.attrib, bs, **kwargs)
         self.dis_bloc_callback = cb_arm_disasm
 
 class dis_arml(disasmEngine):
     attrib = 'l'
+    resync_step = 4
     def __init__(self, bs=None, **kwargs):
         super(dis_arml, self).__init__(mn_arm, self.attrib, bs, **kwargs)
         self.dis_bloc_callback = cb_arm_disasm
 
 class dis_armtb(disasmEngine):
     attrib = 'b'
+    resync_step = 2
     def __init__(self, bs=None, **kwargs):
         super(dis_armtb, self).__init__(mn_armt, self.attrib, bs, **kwargs)
 
 class dis_armtl(disasmEngine):
     attrib = 'l'
+    resync_step = 2
     def __init__(self, bs=None, **kwargs):
         super(dis_armtl, self).__init__(mn_armt, self.attrib, bs, **kwargs)
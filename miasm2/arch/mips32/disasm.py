@@ -5,12 +5,14 @@ from miasm2.arch.mips32.arch import mn_mips32
 
 class dis_mips32b(disasmEngine):
     attrib = 'b'
+    resync_step = 4
     def __init__(self, bs=None, **kwargs):
         super(dis_mips32b, self).__init__(mn_mips32, self.attrib, bs, **kwargs)
 
 
 class dis_mips32l(disasmEngine):
     attrib = "l"
+    resync_step = 4
     def __init__(self, bs=None, **kwargs):
         super(dis_mips32l, self).__init__(mn_mips32, self.attrib, bs, **kwargs)
 
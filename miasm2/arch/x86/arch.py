@@ -705,6 +705,11 @@ class mn_x86(cls_mn):
         c.additional_info.g1.value = pref
         return c
 
+    @classmethod
+    def get_arg_str(cls, args_str):
+        # x86 arguments never contain a comma
+        return args_str.split(',', 1)[0]
+
     @classmethod
     def pre_dis(cls, v, mode, offset):
         offset_o = offset
@@ -766,8 +771,7 @@ class mn_x86(cls_mn):
     def get_cls_instance(cls, cc, mode, infos=None):
         for opmode in [0, 1]:
             for admode in [0, 1]:
-                c = cc()
-                c.init_class()
+                c = cls.get_prepared_instance(cc, (opmode, admode))
 
                 c.reset_class()
                 c.add_pre_dis_info()
@@ -780,6 +784,14 @@ class mn_x86(cls_mn):
                     c.rex_w.value = 1
                 yield c
 
+    @classmethod
+    def asm_cache_key(cls, instr, args):
+        key = super(mn_x86, cls).asm_cache_key(instr, args)
+        infos = instr.additional_info
+        if infos is None:
+            return key + (None,)
+        return key + ((infos.g1.value, infos.g2.value),)
+
     def post_dis(self):
         if self.g2.value:
             for a in self.args:
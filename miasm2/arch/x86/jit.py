@@ -76,9 +76,7 @@ class jitter_x86_32(jitter):
     # stdcall
     @named_arguments
     def func_args_stdcall(self, n_args):
-        ret_ad = self.pop_uint32_t()
-        args = [self.pop_uint32_t() for _ in xrange(n_args)]
-        return ret_ad, args
+        return self.cpu.stack_args(n_args, 4, True)
 
     def func_ret_stdcall(self, ret_addr, ret_value1=None, ret_value2=None):
         self.pc = self.cpu.EIP = ret_addr
@@ -90,9 +88,7 @@ class jitter_x86_32(jitter):
     # cdecl
     @named_arguments
     def func_args_cdecl(self, n_args):
-        ret_ad = self.pop_uint32_t()
-        args = [self.get_stack_arg(i) for i in xrange(n_args)]
-        return ret_ad, args
+        return self.cpu.stack_args(n_args, 4, False)
 
     def func_ret_cdecl(self, ret_addr, ret_value):
         self.cpu.EIP = ret_addr
@@ -105,6 +101,8 @@ class jitter_x86_32(jitter):
 
 class jitter_x86_64(jitter):
 
+    args_regs = ['RCX', 'RDX', 'R8', 'R9']
+
     def __init__(self, *args, **kwargs):
         sp = asmbloc.asm_symbol_pool()
         jitter.__init__(self, ir_x86_64(sp), *args, **kwargs)
@@ -133,14 +131,10 @@ class jitter_x86_64(jitter):
 
     @named_arguments
     def func_args_stdcall(self, n_args):
-        args_regs = ['RCX', 'RDX', 'R8', 'R9']
-        ret_ad = self.pop_uint64_t()
-        args = []
-        for i in xrange(min(n_args, 4)):
-            args.append(self.cpu.get_gpreg()[args_regs[i]])
-        for i in xrange(max(0, n_args - 4)):
-            args.append(self.get_stack_arg(i))
-        return ret_ad, args
+        ret_ad, args = self.cpu.stack_args(max(0, n_args - 4), 8, False)
+        cpu = self.cpu
+        return ret_ad, [getattr(cpu, reg)
+                        for reg in self.args_regs[:n_args]] + args
 
     def func_ret_stdcall(self, ret_addr, ret_value=None):
         self.pc = self.cpu.RIP = ret_addr
@@ -150,14 +144,10 @@ class jitter_x86_64(jitter):
 
     @named_arguments
     def func_args_cdecl(self, n_args):
-        args_regs = ['RCX', 'RDX', 'R8', 'R9']
-        ret_ad = self.pop_uint64_t()
-        args = []
-        for i in xrange(min(n_args, 4)):
-            args.append(self.cpu.get_gpreg()[args_regs[i]])
-        for i in xrange(max(0, n_args - 4)):
-            args.append(self.get_stack_arg(i))
-        return ret_ad, args
+        ret_ad, args = self.cpu.stack_args(max(0, n_args - 4), 8, False)
+        cpu = self.cpu
+        return ret_ad, [getattr(cpu, reg)
+                        for reg in self.args_regs[:n_args]] + args
 
     def func_ret_cdecl(self, ret_addr, ret_value=None):
         self.pc = self.cpu.RIP = ret_addr
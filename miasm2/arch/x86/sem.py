@@ -4463,6 +4463,19 @@ class ir_x86_16(ir):
     def mod_pc(self, instr, instr_ir, extra_ir):
         pass
 
+    def lifting_cache_key(self, instr):
+        key = super(ir_x86_16, self).lifting_cache_key(instr)
+        if key is None:
+            return None
+        return key + (self.do_stk_segm, self.do_ds_segm, self.do_str_segm,
+                      self.do_all_segm)
+
+    def get_lifting_info(self, instr):
+        return instr.additional_info.except_on_instr
+
+    def set_lifting_info(self, instr, info):
+        instr.additional_info.except_on_instr = info
+
     def get_ir(self, instr):
         args = instr.args[:]
         args = [arg.replace_expr(float_replace) for arg in args]
@@ -1,6 +1,7 @@
 #!/usr/bin/env python
 #-*- coding:utf-8 -*-
 
+import bisect
 import logging
 import inspect
 from collections import namedtuple
@@ -328,6 +329,21 @@ class asm_symbol_pool:
         if label in self._labels:
             self._labels.remove(label)
 
+    def remove_labels(self, labels):
+        """Delete the @labels, which are usually the last created ones"""
+        labels = set(labels)
+        for label in labels:
+            if self._name2label.get(label.name) is label:
+                del self._name2label[label.name]
+            if self._offset2label.get(label.offset) is label:
+                del self._offset2label[label.offset]
+        count = len(labels)
+        if count and set(self._labels[-count:]) == labels:
+            del self._labels[-count:]
+        else:
+            self._labels[:] = [label for label in self._labels
+                               if label not in labels]
+
     def del_label_offset(self, label):
         """Unpin the @label from its offset"""
         self._offset2label.pop(label.offset, None)
@@ -474,8 +490,7 @@ class AsmCFG(DiGraph):
 
     def add_uniq_edge(self, src, dst, constraint):
         """Add an edge from @src to @dst if it doesn't already exist"""
-        if (src not in self._nodes_succ or
-                dst not in self._nodes_succ[src]):
+        if not self.has_edge(src, dst):
             self.add_edge(src, dst, constraint)
 
     def del_edge(self, src, dst):
@@ -535,7 +550,7 @@ class AsmCFG(DiGraph):
         # -> add_edge(x, y, constraint)
         for node in graph._nodes:
             self.add_node(node)
-        for edge in graph._edges:
+        for edge in graph.edges():
             # Use "_uniq_" beacause the edge can already exist due to add_node
             self.add_uniq_edge(*edge, constraint=graph.edges2constraint[edge])
 
@@ -627,7 +642,7 @@ class AsmCFG(DiGraph):
                     continue
                 edge = (block, dst)
                 edges.append(edge)
-                if edge in self._edges:
+                if self.has_edge(*edge):
                     # Already known edge, constraint may have changed
                     self.edges2constraint[edge] = constraint.c_t
                 else:
@@ -675,30 +690,31 @@ class AsmCFG(DiGraph):
             raise RuntimeError("Some blocks are missing: %s" % map(str,
                                                                    self._pendings.keys()))
 
-        next_edges = {edge: constraint
-                      for edge, constraint in self.edges2constraint.iteritems()
-                      if constraint == asm_constraint.c_next}
+        # Destination block -> blocks with a next constraint to it
+        next_preds = {}
+        for (pblock, dblock), constraint in self.edges2constraint.iteritems():
+            if constraint == asm_constraint.c_next:
+                next_preds.setdefault(dblock, []).append(pblock)
 
-        for block in self._nodes:
+        for block, pred_next in next_preds.iteritems():
             # No next constraint to self
-            if (block, block) in next_edges:
+            if block in pred_next:
                 raise RuntimeError('Bad constraint: self in next')
 
             # No multiple next constraint to same block
-            pred_next = list(pblock
-                             for (pblock, dblock) in next_edges
-                             if dblock == block)
-
             if len(pred_next) > 1:
                 raise RuntimeError("Too many next constraints for bloc %r"
                                    "(%s)" % (block.label,
                                              map(lambda x: x.label, pred_next)))
 
-    def guess_blocks_size(self, mnemo):
+    def guess_blocks_size(self, mnemo, blocks=None):
         """Asm and compute max block size
         Add a 'size' and 'max_size' attribute on each block
-        @mnemo: metamn instance"""
-        for block in self._nodes:
+        @mnemo: metamn instance
+        @blocks: (optional) only guess the size of these blocks"""
+        if blocks is None:
+            blocks = self._nodes
+        for block in blocks:
             size = 0
             for instr in block.lines:
                 if isinstance(instr, asm_raw):
@@ -745,9 +761,9 @@ class AsmCFG(DiGraph):
         """
         # Get all possible destinations not yet resolved, with a resolved
         # offset
-        block_dst = [label.offset
-                     for label in self.pendings
-                     if label.offset is not None]
+        block_dst = sorted(set(label.offset
+                               for label in self.pendings
+                               if label.offset is not None))
 
         todo = self.nodes().copy()
         rebuild_needed = False
@@ -757,9 +773,12 @@ class AsmCFG(DiGraph):
             cur_block = todo.pop()
             range_start, range_stop = cur_block.get_range()
 
-            for off in block_dst:
-                if not (off > range_start and off < range_stop):
-                    continue
+            # Destinations are sorted: once the block is splitted, the
+            # following ones are in the new block
+            index = bisect.bisect_right(block_dst, range_start)
+            for off in block_dst[index:]:
+                if off >= range_stop:
+                    break
 
                 # `cur_block` must be splitted at offset `off`
                 label = symbol_pool.getby_offset_create(off)
@@ -813,7 +832,9 @@ def _merge_blocks(dg, graph):
     # Blocks to ignore, because they have been removed from the graph
     to_ignore = set()
 
-    for match in _expgraph.match(graph):
+    # Only blocks modified by the previous simplification round may lead to
+    # new matches
+    for match in _expgraph.match(graph, dg.touched):
 
         # Get matching blocks
         block, succ = match[_parent], match[_son]
@@ -1173,27 +1194,29 @@ def assemble_block(mnemo, block, symbol_pool, conservative=False):
         offset_i += instr.l
 
 
-def asmbloc_final(mnemo, blocks, blockChains, symbol_pool, conservative=False):
-    """Resolve and assemble @blockChains using @symbol_pool until fixed point is
-    reached"""
-
-    log_asmbloc.debug("asmbloc_final")
-
-    # Init structures
-    lbl2block = {block.label: block for block in blocks}
+def get_labels_uses(blocks):
+    """Return a dictionnary linking each label to the set of @blocks using it"""
     blocks_using_label = {}
     for block in blocks:
         labels = get_block_labels(block)
         for label in labels:
             blocks_using_label.setdefault(label, set()).add(block)
+    return blocks_using_label
 
-    block2chain = {}
-    for chain in blockChains:
-        for block in chain.blocks:
-            block2chain[block] = chain
 
-    # Init worklist
-    blocks_to_rework = set(blocks)
+def assemble_blocks_fixpoint(mnemo, blockChains, symbol_pool, lbl2block,
+                             blocks_using_label, blocks_to_rework,
+                             conservative=False):
+    """Fix and re-assemble @blocks_to_rework, and the blocks impacted by their
+    new offsets and sizes, until fixed point is reached.
+    Return the set of assembled blocks
+
+    @blockChains: placed BlockChains of the blocks
+    @lbl2block: dictionnary label -> block
+    @blocks_using_label: dictionnary label -> set of blocks using it
+    @blocks_to_rework: set of blocks to assemble
+    """
+    assembled = set()
 
     # Fix and re-assemble blocks until fixed point is reached
     while True:
@@ -1221,6 +1244,40 @@ def asmbloc_final(mnemo, blocks, blockChains, symbol_pool, conservative=False):
         while blocks_to_rework:
             block = blocks_to_rework.pop()
             assemble_block(mnemo, block, symbol_pool, conservative)
+            assembled.add(block)
+    return assembled
+
+
+def asmbloc_final(mnemo, blocks, blockChains, symbol_pool, conservative=False):
+    """Resolve and assemble @blockChains using @symbol_pool until fixed point is
+    reached"""
+
+    log_asmbloc.debug("asmbloc_final")
+
+    # Init structures
+    lbl2block = {block.label: block for block in blocks}
+    blocks_using_label = get_labels_uses(blocks)
+
+    # Init worklist
+    blocks_to_rework = set(blocks)
+
+    assemble_blocks_fixpoint(mnemo, blockChains, symbol_pool, lbl2block,
+                             blocks_using_label, blocks_to_rework,
+                             conservative)
+
+
+def get_block_patches(block):
+    """Yield the (offset, bytes) of the assembled instructions of @block, and
+    update their offset"""
+    offset = block.label.offset
+    for instr in block.lines:
+        if not instr.data:
+            # Empty line
+            continue
+        assert len(instr.data) == instr.l
+        yield offset, instr.data
+        instr.offset = offset
+        offset += instr.l
 
 
 def asm_resolve_final(mnemo, blocks, symbol_pool, dst_interval=None):
@@ -1239,21 +1296,167 @@ def asm_resolve_final(mnemo, blocks, symbol_pool, dst_interval=None):
     output_interval = interval()
 
     for block in blocks:
-        offset = block.label.offset
-        for instr in block.lines:
-            if not instr.data:
-                # Empty line
-                continue
-            assert len(instr.data) == instr.l
-            patches[offset] = instr.data
-            instruction_interval = interval([(offset, offset + instr.l - 1)])
+        for offset, data in get_block_patches(block):
+            patches[offset] = data
+            instruction_interval = interval([(offset, offset + len(data) - 1)])
             if not (instruction_interval & output_interval).empty:
                 raise RuntimeError("overlapping bytes %X" % int(offset))
-            instr.offset = offset
-            offset += instr.l
     return patches
 
 
+class AsmSession(object):
+
+    """Assembly of an AsmCFG, keeping blocks' sizes, BlockChains and labels'
+    uses between calls. Once assembled, modified blocks can be re-assembled
+    without resolving the whole AsmCFG again.
+
+    Usage:
+    >>> session = AsmSession(mnemo, blocks, symbol_pool)
+    >>> patches = session.assemble()
+    >>> block.lines[0] = new_instr
+    >>> patches_delta = session.update([block])
+    """
+
+    def __init__(self, mnemo, blocks, symbol_pool, dst_interval=None,
+                 conservative=False):
+        """Init an assembly session
+        @mnemo: metamn instance
+        @blocks: AsmCFG instance to assemble
+        @symbol_pool: asm_symbol_pool of @blocks
+        @dst_interval: (optional) interval in which blocks are placed
+        @conservative: (optional) use original bytes when possible
+        """
+        self.mnemo = mnemo
+        self.blocks = blocks
+        self.symbol_pool = symbol_pool
+        self.dst_interval = dst_interval
+        self.conservative = conservative
+
+        # Labels pinned before the assembly
+        self.pinned_labels = set(block.label for block in blocks
+                                 if is_int(block.label.offset))
+        self.block_chains = []
+        # block -> (BlockChain, offset_min, offset_max) allocated at placement
+        self.block2chain = {}
+        self.lbl2block = {}
+        self.block2labels = {}
+        self.blocks_using_label = {}
+        # offset -> bytes, and block -> patched offsets
+        self.patches = {}
+        self.block2offsets = {}
+
+    def _unpin_blocks(self):
+        """Unpin the blocks placed by a previous assembly"""
+        for block in self.blocks:
+            if block.label in self.pinned_labels:
+                continue
+            if block.label.offset is not None:
+                self.symbol_pool.del_label_offset(block.label)
+
+    def _update_patches(self, blocks):
+        """Update the patches of @blocks, return the patches which changed"""
+        old_patches = {}
+        for block in blocks:
+            for offset in self.block2offsets.pop(block, []):
+                old_patches[offset] = self.patches.pop(offset)
+
+        patches_delta = {}
+        for block in blocks:
+            offsets = []
+            for offset, data in get_block_patches(block):
+                self.patches[offset] = data
+                offsets.append(offset)
+                if old_patches.get(offset) != data:
+                    patches_delta[offset] = data
+            self.block2offsets[block] = offsets
+        return patches_delta
+
+    def _chain_fits(self, chain_info):
+        """Return True if the blocks of the BlockChain still lie in the
+        interval allocated at placement"""
+        chain, offset_min, offset_max = chain_info
+        for block in chain.blocks:
+            if block.label.offset < offset_min:
+                return False
+            if block.label.offset + block.size > offset_max:
+                return False
+        return True
+
+    def assemble(self):
+        """Resolve and assemble all the blocks
+        Return the patches, as a dictionnary offset -> bytes"""
+        self._unpin_blocks()
+        self.blocks.sanity_check()
+
+        self.blocks.guess_blocks_size(self.mnemo)
+        block_chains = group_constrained_blocks(self.symbol_pool, self.blocks)
+        self.block_chains = resolve_symbol(block_chains, self.symbol_pool,
+                                           self.dst_interval)
+        self.block2chain = {}
+        for chain in self.block_chains:
+            chain_info = (chain, chain.offset_min, chain.offset_max)
+            for block in chain.blocks:
+                self.block2chain[block] = chain_info
+
+        self.lbl2block = {block.label: block for block in self.blocks}
+        self.block2labels = {block: get_block_labels(block)
+                             for block in self.blocks}
+        self.blocks_using_label = get_labels_uses(self.blocks)
+
+        assemble_blocks_fixpoint(self.mnemo, self.block_chains,
+                                 self.symbol_pool, self.lbl2block,
+                                 self.blocks_using_label, set(self.blocks),
+                                 self.conservative)
+        self.patches = {}
+        self.block2offsets = {}
+        self._update_patches(self.blocks)
+        return dict(self.patches)
+
+    def update(self, modified_blocks):
+        """Re-assemble @modified_blocks, whose lines have been modified, and
+        the blocks impacted by their new sizes.
+        Return the patches which changed, as a dictionnary offset -> bytes.
+        Bytes which are not patched anymore are not reported.
+
+        If a BlockChain outgrows the interval allocated at placement, the
+        whole AsmCFG is resolved again.
+        Blocks and constraints cannot be added or removed through this
+        method: use assemble() instead.
+
+        @modified_blocks: iterable of modified blocks of the AsmCFG
+        """
+        modified_blocks = set(modified_blocks)
+        if not self.block2chain:
+            raise RuntimeError("AsmCFG must be assembled first")
+
+        # Update sizes and labels' uses of modified blocks
+        self.blocks.guess_blocks_size(self.mnemo, modified_blocks)
+        for block in modified_blocks:
+            for label in self.block2labels[block]:
+                self.blocks_using_label[label].discard(block)
+            labels = get_block_labels(block)
+            for label in labels:
+                self.blocks_using_label.setdefault(label, set()).add(block)
+            self.block2labels[block] = labels
+
+        assembled = assemble_blocks_fixpoint(self.mnemo, self.block_chains,
+                                             self.symbol_pool,
+                                             self.lbl2block,
+                                             self.blocks_using_label,
+                                             modified_blocks,
+                                             self.conservative)
+
+        chains = set(self.block2chain[block] for block in assembled)
+        if not all(self._chain_fits(chain_info) for chain_info in chains):
+            log_asmbloc.info("BlockChain overflow, resolve the whole AsmCFG")
+            old_patches = self.patches
+            patches = self.assemble()
+            return {offset: data for offset, data in patches.iteritems()
+                    if old_patches.get(offset) != data}
+
+        return self._update_patches(assembled)
+
+
 class disasmEngine(object):
 
     """Disassembly engine, taking care of disassembler options and mutli-block
@@ -1274,6 +1477,8 @@ class disasmEngine(object):
     + Number
      - lines_wd: maximum block's size (in number of instruction)
      - blocs_wd: maximum number of distinct disassembled block
+     - resync_step: number of bytes skipped by linear sweeps on invalid
+                    opcodes (architecture dependent)
 
     + callback(arch, attrib, pool_bin, cur_bloc, offsets_to_dis,
                symbol_pool)
@@ -1286,6 +1491,9 @@ class disasmEngine(object):
     this structure.
     """
 
+    # Smallest instruction step of the architecture
+    resync_step = 1
+
     def __init__(self, arch, attrib, bin_stream, **kwargs):
         """Instanciate a new disassembly engine
         @arch: targeted architecture
@@ -1312,10 +1520,14 @@ class disasmEngine(object):
         # Override options if needed
         self.__dict__.update(kwargs)
 
-    def _dis_bloc(self, offset):
+    def _dis_bloc(self, offset, stop=None, quiet=False):
         """Disassemble the block at offset @offset
         Return the created asm_bloc and future offsets to disassemble
+        @stop: (optional) offset at which the disassembly is stopped, as if it
+               was in dont_dis
+        @quiet: (optional) log disassembly failures at debug level only
         """
+        log_failure = log_asmbloc.debug if quiet else log_asmbloc.warning
 
         lines_cpt = 0
         in_delayslot = False
@@ -1329,7 +1541,8 @@ class disasmEngine(object):
             if in_delayslot:
                 delayslot_count -= 1
 
-            if offset in self.dont_dis:
+            if offset in self.dont_dis or (stop is not None and
+                                           offset >= stop):
                 if not cur_block.lines:
                     self.job_done.add(offset)
                     # Block is empty -> bad block
@@ -1361,11 +1574,11 @@ class disasmEngine(object):
             try:
                 instr = self.arch.dis(self.bin_stream, self.attrib, offset)
             except (Disasm_Exception, IOError), e:
-                log_asmbloc.warning(e)
+                log_failure(e)
                 instr = None
 
             if instr is None:
-                log_asmbloc.warning("cannot disasm at %X", int(off_i))
+                log_failure("cannot disasm at %X", int(off_i))
                 if not cur_block.lines:
                     self.job_done.add(offset)
                     # Block is empty -> bad block
@@ -1379,7 +1592,7 @@ class disasmEngine(object):
 
             # XXX TODO nul start block option
             if self.dont_dis_nulstart_bloc and instr.b.count('\x00') == instr.l:
-                log_asmbloc.warning("reach nul instr at %X", int(off_i))
+                log_failure("reach nul instr at %X", int(off_i))
                 if not cur_block.lines:
                     # Block is empty -> bad block
                     cur_block = asm_block_bad(label, errno=1)
@@ -1400,7 +1613,6 @@ class disasmEngine(object):
 
             offset += instr.l
             log_asmbloc.debug(instr)
-            log_asmbloc.debug(instr.args)
 
             cur_block.addline(instr)
             if not instr.breakflow():
@@ -1484,3 +1696,83 @@ class disasmEngine(object):
                               mn=self.arch, attrib=self.attrib,
                               pool_bin=self.bin_stream)
         return blocs
+
+    def dis_instr_linear(self, start, stop=None):
+        """Linear sweep: disassemble the instructions from @start to @stop and
+        yield them lazily, in address order
+        On invalid opcodes, the sweep resynchronises `resync_step` bytes
+        further.
+        @start: starting offset
+        @stop: (optional) ending offset (excluded). If not set, the sweep
+               ends at the first offset which cannot be read
+        """
+        offset = start
+        while stop is None or offset < stop:
+            try:
+                instr = self.arch.dis(self.bin_stream, self.attrib, offset)
+            except (Disasm_Exception, IOError):
+                instr = None
+            if instr is None:
+                if stop is None and not self._is_readable(offset):
+                    break
+                log_asmbloc.debug("cannot disasm at %X", int(offset))
+                offset += self.resync_step
+                continue
+            yield instr
+            offset += instr.l
+
+    def dis_bloc_linear(self, start, stop=None):
+        """Linear sweep: disassemble the blocks from @start to @stop and yield
+        them lazily, in address order
+        Blocks are ended as in dis_bloc, and the next block starts right after
+        the previous one. Offsets which cannot be disassembled produce an
+        asm_block_bad, and the sweep resynchronises `resync_step` bytes
+        further. `dis_bloc_callback` is run on each block.
+
+        The memory used does not depend on the swept range: swept offsets are
+        not recorded in `job_done`, and the labels created by the sweep are
+        removed from the engine's symbol_pool once their block has been
+        yielded (the yielded blocks keep them). Disassembly failures are
+        logged at debug level.
+
+        @start: starting offset
+        @stop: (optional) ending offset (excluded). If not set, the sweep
+               ends at the first offset which cannot be read
+        """
+        offset = start
+        labels = self.symbol_pool.items
+        # Labels created by the sweep, and still in symbol_pool
+        created = []
+        try:
+            while stop is None or offset < stop:
+                job_done, self.job_done = self.job_done, set()
+                labels_count = len(labels)
+                try:
+                    cur_block, _ = self._dis_bloc(offset, stop, quiet=True)
+                finally:
+                    self.job_done = job_done
+                created += labels[labels_count:]
+                if cur_block.lines:
+                    last = cur_block.lines[-1]
+                    offset = last.offset + last.l
+                else:
+                    if stop is None and not self._is_readable(offset):
+                        break
+                    offset += self.resync_step
+                yield cur_block
+                # Keep the label of the next block, which may be referenced by
+                # a constraint of this one
+                kept = [label for label in created if label.offset == offset]
+                self.symbol_pool.remove_labels(label for label in created
+                                               if label.offset != offset)
+                created = kept
+        finally:
+            self.symbol_pool.remove_labels(created)
+
+    def _is_readable(self, offset):
+        """Return True if at least one byte can be read at @offset"""
+        try:
+            self.bin_stream.getbytes(offset, 1)
+        except IOError:
+            return False
+        return True
@@ -15,6 +15,7 @@
 # with this program; if not, write to the Free Software Foundation, Inc.,
 # 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
 #
+import mmap
 
 
 class bin_stream(object):
@@ -24,6 +25,9 @@ class bin_stream(object):
     CACHE_SIZE = 10000
     # By default, no atomic mode
     _atomic_mode = False
+    # In atomic mode, bytes are read by windows of at least this size
+    ATOMIC_WINDOW = 16
+    _window = (None, None)
 
     def __init__(self, *args, **kargs):
         pass
@@ -39,12 +43,14 @@ class bin_stream(object):
         assert not self._atomic_mode
         self._atomic_mode = True
         self._cache = {}
+        self._window = (None, None)
 
     def leave_atomic_mode(self):
         """Leave atomic mode"""
         assert self._atomic_mode
         self._atomic_mode = False
         self._cache = None
+        self._window = (None, None)
 
     def _getbytes(self, start, length):
         return self.bin[start:start + length]
@@ -59,12 +65,40 @@ class bin_stream(object):
         if self._atomic_mode:
             val = self._cache.get((start,l), None)
             if val is None:
-                val = self._getbytes(start, l)
+                val = self._getbytes_window(start, l)
                 self._cache[(start,l)] = val
         else:
             val = self._getbytes(start, l)
         return val
 
+    def _getbytes_window(self, start, l):
+        """Return the bytes from @start to @start + @l, using the bytes read
+        by the previous call if possible. Otherwise, read a window of at
+        least ATOMIC_WINDOW bytes, as successive reads of an atomic section
+        are often close to each other (several fields of one instruction)
+        """
+        win_start, window = self._window
+        if (window is not None and win_start <= start and
+                start + l <= win_start + len(window)):
+            return window[start - win_start:start - win_start + l]
+        size = max(l, self.ATOMIC_WINDOW)
+        window = None
+        if self._can_prefetch(start, size):
+            try:
+                window = self._getbytes(start, size)
+            except IOError:
+                # The window is (partially) out of the stream
+                pass
+        if window is None or len(window) < l:
+            return self._getbytes(start, l)
+        self._window = (start, window)
+        return window[:l]
+
+    def _can_prefetch(self, start, size):
+        """Return False if reading @size bytes from @start may have side
+        effects, even if those bytes are not requested"""
+        return True
+
     def getbits(self, start, n):
         """Return the bits from the bit stream
         @start: the offset in bits
@@ -137,6 +171,25 @@ class bin_stream_str(bin_stream):
         return self.l - (self.offset + self.shift)
 
 
+class bin_stream_mmap(bin_stream_str):
+
+    """Read-only memory mapping of a file: bytes are loaded on demand by the
+    OS, so that large files are not read in memory"""
+
+    def __init__(self, binary, offset=0L, shift=0):
+        """@binary: file object or file name to map"""
+        if isinstance(binary, basestring):
+            with open(binary, "rb") as fdesc:
+                mapping = mmap.mmap(fdesc.fileno(), 0, access=mmap.ACCESS_READ)
+        else:
+            mapping = mmap.mmap(binary.fileno(), 0, access=mmap.ACCESS_READ)
+        super(bin_stream_mmap, self).__init__(mapping, offset, shift)
+
+    def close(self):
+        """Unmap the file"""
+        self.bin.close()
+
+
 class bin_stream_file(bin_stream):
 
     def __init__(self, binary, offset=0L, shift=0):
@@ -218,6 +271,10 @@ class bin_stream_vm(bin_stream):
     def getlen(self):
         return 0xFFFFFFFFFFFFFFFF
 
+    def _can_prefetch(self, start, size):
+        # Reading unmapped memory sets the VM exception flags
+        return self.vm.is_mapped(start + self.base_offset, size)
+
     def _getbytes(self, start, l=1):
         try:
             s = self.vm.get_mem(start + self.base_offset, l)
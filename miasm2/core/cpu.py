@@ -11,7 +11,7 @@ import pyparsing
 import miasm2.expression.expression as m2_expr
 from miasm2.core import asmbloc
 from miasm2.core.bin_stream import bin_stream, bin_stream_str
-from miasm2.core.utils import Disasm_Exception
+from miasm2.core.utils import Disasm_Exception, BoundedDict
 from miasm2.expression.simplifications import expr_simp
 
 log = logging.getLogger("cpuhelper")
@@ -822,6 +822,28 @@ def add_candidate(bases, c):
     add_candidate_to_tree(bases[0].bintree, c)
 
 
+def index_tree(branch):
+    """Index the children of the @branch of a candidates tree, for
+    guess_mnemo. Return a tuple (candidates, groups, others):
+    - candidates: set of the candidates ending on this branch
+    - groups: list of ((l, fmask, fname), {fbits: child index}), for children
+      of static length; siblings of a group are matched using only one read
+    - others: list of (node, child index) of the other children
+    """
+    groups = {}
+    others = []
+    for node, child in branch.iteritems():
+        if node == 'mn':
+            continue
+        l, fmask, fbits, fname, flen = node
+        if flen is None and l is not None:
+            group = groups.setdefault((l, fmask, fname), {})
+            group[fbits] = index_tree(child)
+        else:
+            others.append((node, index_tree(child)))
+    return branch.get('mn', set()), groups.items(), others
+
+
 def getfieldby_name(fields, fname):
     f = filter(lambda x: hasattr(x, 'fname') and x.fname == fname, fields)
     if len(f) != 1:
@@ -970,37 +992,80 @@ class cls_mn(object):
     instruction = instruction
     # Block's offset alignement
     alignment = 1
+    # Prepared instances, by (mnemonic class, pool key)
+    all_mn_pool = {}
+    # Instruction encodings, by asm_cache_key
+    asm_cache = BoundedDict(100000)
+    # Arguments parsing results, by (parser, argument string)
+    args_parse_cache = BoundedDict(100000)
+    # Candidates tree indexes, by id of the tree
+    bintree_index = {}
 
     @classmethod
-    def guess_mnemo(cls, bs, attrib, pre_dis_info, offset):
-        candidates = []
+    def get_bintree_index(cls):
+        """Return the index of the candidates tree `bintree` (see index_tree),
+        computed on the first call"""
+        tree_id = id(cls.bintree)
+        tree, index = cls.bintree_index.get(tree_id, (None, None))
+        if tree is not cls.bintree:
+            index = index_tree(cls.bintree)
+            # The root of the tree is not a candidate
+            index = (set(), index[1], index[2])
+            cls.bintree_index[tree_id] = (cls.bintree, index)
+        return index
 
+    @classmethod
+    def guess_mnemo(cls, bs, attrib, pre_dis_info, offset):
         candidates = set()
 
-        fname_values = pre_dis_info
-        todo = [(dict(fname_values), branch, offset * 8)
-                for branch in cls.bintree.items()]
-        for fname_values, branch, offset_b in todo:
-            (l, fmask, fbits, fname, flen), vals = branch
+        # Sibling branches often read the same bits: read them once
+        bits = {}
 
-            if flen is not None:
-                l = flen(attrib, fname_values)
-            if l is not None:
+        def read_bits(offset_b, l):
+            key = (offset_b, l)
+            v = bits.get(key)
+            if v is None:
                 try:
                     v = cls.getbits(bs, attrib, offset_b, l)
                 except IOError:
                     # Raised if offset is out of bound
+                    v = False
+                bits[key] = v
+            return v
+
+        # fname_values is shared between branches, and copied on write
+        todo = [(pre_dis_info, cls.get_bintree_index(), offset * 8)]
+        for fname_values, (mns, groups, others), offset_b in todo:
+            candidates.update(mns)
+            for (l, fmask, fname), children in groups:
+                v = read_bits(offset_b, l)
+                if v is False:
                     continue
-                offset_b += l
-                if v & fmask != fbits:
+                child = children.get(v & fmask)
+                if child is None:
                     continue
-                if fname is not None and not fname in fname_values:
-                    fname_values[fname] = v
-            for nb, v in vals.items():
-                if 'mn' in nb:
-                    candidates.update(v)
-                else:
-                    todo.append((dict(fname_values), (nb, v), offset_b))
+                values = fname_values
+                if fname is not None and not fname in values:
+                    values = dict(values)
+                    values[fname] = v
+                todo.append((values, child, offset_b + l))
+
+            for (l, fmask, fbits, fname, flen), child in others:
+                values = fname_values
+                child_offset_b = offset_b
+                if flen is not None:
+                    l = flen(attrib, values)
+                if l is not None:
+                    v = read_bits(offset_b, l)
+                    if v is False:
+                        continue
+                    child_offset_b += l
+                    if v & fmask != fbits:
+                        continue
+                    if fname is not None and not fname in values:
+                        values = dict(values)
+                        values[fname] = v
+                todo.append((values, child, child_offset_b))
 
         return [c for c in candidates]
 
@@ -1093,9 +1158,11 @@ class cls_mn(object):
             bs_l = len(bs)
 
         alias = False
+        log_debug = log.isEnabledFor(logging.DEBUG)
         for c in candidates:
-            log.debug("*" * 40, mode, c.mode)
-            log.debug(c.fields)
+            if log_debug:
+                log.debug("*" * 40, mode, c.mode)
+                log.debug(c.fields)
 
             c = cls.all_mn_inst[c][0]
 
@@ -1120,8 +1187,9 @@ class cls_mn(object):
                     total_l += l
                     f.l = l
                     f.is_present = True
-                    log.debug("FIELD %s %s %s %s", f.__class__, f.fname,
-                              offset_b, l)
+                    if log_debug:
+                        log.debug("FIELD %s %s %s %s", f.__class__, f.fname,
+                                  offset_b, l)
                     if bs_l * 8 - offset_b < l:
                         getok = False
                         break
@@ -1148,6 +1216,9 @@ class cls_mn(object):
 
             if not ret:
                 continue
+            # Simplified before post_dis, which works on the final
+            # expressions. Not deferred: the disassembly engine keeps every
+            # instruction and reads the arguments of flow instructions
             for a in c.args:
                 a.expr = expr_simp(a.expr)
 
@@ -1159,8 +1230,8 @@ class cls_mn(object):
             c_args = [a.expr for a in c.args]
             instr = cls.instruction(c.name, mode, c_args,
                                     additional_info=c.additional_info())
-            instr.l = prefix_len + total_l / 8
-            instr.b = cls.getbytes(bs, offset_o, instr.l)
+            instr.l = c.l
+            instr.b = c.b
             instr.offset = offset_o
             instr.get_info(c)
             if c.alias:
@@ -1184,8 +1255,40 @@ class cls_mn(object):
         return out[0]
 
     @classmethod
-    def fromstring(cls, s, mode = None):
+    def get_arg_str(cls, args_str):
+        """Return the part of @args_str on which the parsing of its first
+        argument depends. Architectures whose arguments cannot contain a
+        separator may return the first argument only, improving the hit rate
+        of the arguments parsing cache
+        @args_str: string of the remaining instruction arguments
+        """
+        return args_str
+
+    @classmethod
+    def parse_arg(cls, parser, arg_str):
+        """Parse the beginning of @arg_str using the pyparsing @parser
+        Return a tuple (expr, start, stop) or (None, None, None) if @parser
+        does not match at the start of @arg_str. Results are cached
+        @parser: pyparsing parser of an argument
+        @arg_str: string returned by get_arg_str
+        """
         global total_scans
+        key = (parser, arg_str)
+        if key in cls.args_parse_cache:
+            return cls.args_parse_cache[key]
+        try:
+            total_scans += 1
+            v, start, stop = parser.scanString(arg_str).next()
+        except StopIteration:
+            v, start, stop = [None], None, None
+        if start != 0:
+            v, start, stop = [None], None, None
+        result = v[0], start, stop
+        cls.args_parse_cache[key] = result
+        return result
+
+    @classmethod
+    def fromstring(cls, s, mode = None):
         name = re.search('(\S+)', s).groups()
         if not name:
             raise ValueError('cannot find name', s)
@@ -1213,17 +1316,11 @@ class cls_mn(object):
                         parser = f.parser
                     else:
                         parser = (f.parser,)
+                    arg_str = cls.get_arg_str(args_str)
                     for p in parser:
                         if p in parsers[(i, start_i)]:
                             continue
-                        try:
-                            total_scans += 1
-                            v, start, stop = p.scanString(args_str).next()
-                        except StopIteration:
-                            v, start, stop = [None], None, None
-                        if start != 0:
-                            v, start, stop = [None], None, None
-                        parsers[(i, start_i)][p] = v[0], start, stop
+                        parsers[(i, start_i)][p] = cls.parse_arg(p, arg_str)
 
                     start, stop = f.fromstring(args_str, parsers[(i, start_i)])
                     if start != 0:
@@ -1261,6 +1358,30 @@ class cls_mn(object):
     def dup_info(self, infos):
         return
 
+    @classmethod
+    def get_prepared_instance(cls, cc, pool_key=None):
+        """Return an instance of the mnemonic class @cc, in the state it has
+        just after its init_class. Instances are pooled by (@cc, @pool_key):
+        the returned one is valid until the next call with the same key.
+        @cc: mnemonic class
+        @pool_key: (optional) key distinguishing several instances of @cc
+        """
+        key = (cc, pool_key)
+        if key not in cls.all_mn_pool:
+            c = cc()
+            c.init_class()
+            fields_state = [(f, dict(f.__dict__)) for f in c.fields_order]
+            cls.all_mn_pool[key] = (c, dict(c.__dict__), fields_state)
+            return c
+        c, state, fields_state = cls.all_mn_pool[key]
+        # Restore the instance and its fields, as encoding modifies them
+        c.__dict__.clear()
+        c.__dict__.update(state)
+        for f, f_state in fields_state:
+            f.__dict__.clear()
+            f.__dict__.update(f_state)
+        return c
+
     @classmethod
     def get_cls_instance(cls, cc, mode, infos=None):
         c = cls.all_mn_inst[cc][0]
@@ -1272,17 +1393,29 @@ class cls_mn(object):
         c.mode = mode
         yield c
 
+    @classmethod
+    def asm_cache_key(cls, instr, args):
+        """Return the key of the @instr encodings in the asm cache
+        @instr: instruction instance
+        @args: @instr arguments, resolved with symbols
+        """
+        return (cls, instr.name, instr.mode, tuple(instr.args), tuple(args))
+
     @classmethod
     def asm(cls, instr, symbols=None):
         """
         Re asm instruction by searching mnemo using name and args. We then
         can modify args and get the hex of a modified instruction
         """
+        args = instr.resolve_args_with_symbols(symbols)
+        key = cls.asm_cache_key(instr, args)
+        if key in cls.asm_cache:
+            return list(cls.asm_cache[key])
+
         clist = cls.all_mn_name[instr.name]
         clist = [x for x in clist]
         vals = []
         candidates = []
-        args = instr.resolve_args_with_symbols(symbols)
 
         for cc in clist:
 
@@ -1312,7 +1445,8 @@ class cls_mn(object):
             log.debug('asm multiple args ret default')
 
         vals = cls.filter_asm_candidates(instr, candidates)
-        return vals
+        cls.asm_cache[key] = vals
+        return list(vals)
 
     @classmethod
     def filter_asm_candidates(cls, instr, candidates):
@@ -1326,16 +1460,17 @@ class cls_mn(object):
         todo = [(0, 0, [(x, self.fields_order[x]) for x in self.to_decode[::-1]])]
 
         result = []
-        done = []
+        done = set()
 
         while todo:
             index, cur_len, to_decode = todo.pop()
             # TEST XXX
             for _, f in to_decode:
                 setattr(self, f.fname, f)
-            if (index, [x[1].value for x in to_decode]) in done:
+            state = (index, tuple(x[1].value for x in to_decode))
+            if state in done:
                 continue
-            done.append((index, [x[1].value for x in to_decode]))
+            done.add(state)
 
             can_encode = True
             for i, f in to_decode[index:]:
@@ -1353,10 +1488,6 @@ class cls_mn(object):
 
                 for _ in ret:
                     o = []
-                    if ((index, cur_len, [xx[1].value for xx in to_decode]) in todo or
-                        (index, cur_len, [xx[1].value for xx in to_decode]) in done):
-                        raise NotImplementedError('not fully functional')
-
                     for p, f in to_decode:
                         fnew = f.clone()
                         o.append((p, fnew))
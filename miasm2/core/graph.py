@@ -1,4 +1,5 @@
 from collections import defaultdict, namedtuple
+import heapq
 import re
 
 
@@ -9,20 +10,29 @@ class DiGraph(object):
     # Stand for a cell in a dot node rendering
     DotCellDescription = namedtuple("DotCellDescription",
                                     ["text", "attr"])
+    # Loop of a loop nesting forest: @nodes are the nodes whose innermost
+    # loop is this one (including @header), @children the headers of the
+    # directly nested loops, and @parent the header of the enclosing loop, or
+    # None
+    Loop = namedtuple("Loop", ["header", "nodes", "children", "parent",
+                               "depth", "reducible"])
 
     def __init__(self):
         self._nodes = set()
-        self._edges = []
-        # N -> Nodes N2 with a edge (N -> N2)
+        # Edge (N, N2) -> number of edges N -> N2
+        self._edges = {}
+        # N -> Nodes N2 with a edge (N -> N2), in insertion order
         self._nodes_succ = {}
-        # N -> Nodes N2 with a edge (N2 -> N)
+        # N -> Nodes N2 with a edge (N2 -> N), in insertion order
         self._nodes_pred = {}
+        # head -> loop nesting forest, forgotten on modification
+        self._loop_forests = {}
 
     def __repr__(self):
         out = []
         for node in self._nodes:
             out.append(str(node))
-        for src, dst in self._edges:
+        for src, dst in self.edges():
             out.append("%s -> %s" % (src, dst))
         return '\n'.join(out)
 
@@ -30,7 +40,15 @@ class DiGraph(object):
         return self._nodes
 
     def edges(self):
-        return self._edges
+        """Return the list of edges (src, dst) of the graph. An edge added
+        several times is listed as many times"""
+        return [(src, dst)
+                for src, dsts in self._nodes_succ.iteritems()
+                for dst in dsts]
+
+    def has_edge(self, src, dst):
+        """Return True if there is at least one edge @src -> @dst"""
+        return (src, dst) in self._edges
 
     def merge(self, graph):
         """Merge the current graph with @graph
@@ -38,7 +56,7 @@ class DiGraph(object):
         """
         for node in graph._nodes:
             self.add_node(node)
-        for edge in graph._edges:
+        for edge in graph.edges():
             self.add_edge(*edge)
 
     def __add__(self, graph):
@@ -55,7 +73,7 @@ class DiGraph(object):
         if not isinstance(graph, self.__class__):
             return False
         return all((self._nodes == graph.nodes(),
-                    sorted(self._edges) == sorted(graph.edges())))
+                    self._edges == graph._edges))
 
     def add_node(self, node):
         """Add the node @node to the graph.
@@ -64,6 +82,7 @@ class DiGraph(object):
         """
         if node in self._nodes:
             return False
+        self._loop_forests.clear()
         self._nodes.add(node)
         self._nodes_succ[node] = []
         self._nodes_pred[node] = []
@@ -73,50 +92,66 @@ class DiGraph(object):
         """Delete the @node of the graph; Also delete every edge to/from this
         @node"""
 
+        self._loop_forests.clear()
         if node in self._nodes:
             self._nodes.remove(node)
-        for pred in self.predecessors(node):
+        # Delete from the last edge, which is cheaper with adjacency lists
+        for pred in reversed(self.predecessors(node)):
             self.del_edge(pred, node)
-        for succ in self.successors(node):
+        for succ in reversed(self.successors(node)):
             self.del_edge(node, succ)
+        self._nodes_succ.pop(node, None)
+        self._nodes_pred.pop(node, None)
 
     def add_edge(self, src, dst):
         if not src in self._nodes:
             self.add_node(src)
         if not dst in self._nodes:
             self.add_node(dst)
-        self._edges.append((src, dst))
+        self._loop_forests.clear()
+        edge = (src, dst)
+        self._edges[edge] = self._edges.get(edge, 0) + 1
         self._nodes_succ[src].append(dst)
         self._nodes_pred[dst].append(src)
 
     def add_uniq_edge(self, src, dst):
         """Add an edge from @src to @dst if it doesn't already exist"""
-        if (src not in self._nodes_succ or
-                dst not in self._nodes_succ[src]):
+        if (src, dst) not in self._edges:
             self.add_edge(src, dst)
 
     def del_edge(self, src, dst):
-        self._edges.remove((src, dst))
-        self._nodes_succ[src].remove(dst)
-        self._nodes_pred[dst].remove(src)
+        edge = (src, dst)
+        count = self._edges.get(edge)
+        if count is None:
+            raise ValueError("Unknown edge %s -> %s" % edge)
+        self._loop_forests.clear()
+        if count == 1:
+            del self._edges[edge]
+        else:
+            self._edges[edge] = count - 1
+        self._del_adjacency(self._nodes_succ[src], dst)
+        self._del_adjacency(self._nodes_pred[dst], src)
+
+    @staticmethod
+    def _del_adjacency(nodes, node):
+        """Remove an occurrence of @node in the adjacency list @nodes"""
+        if nodes[-1] == node:
+            # Fast path, used by del_node
+            nodes.pop()
+        else:
+            nodes.remove(node)
 
     def predecessors_iter(self, node):
-        if not node in self._nodes_pred:
-            raise StopIteration
-        for n_pred in self._nodes_pred[node]:
-            yield n_pred
+        return iter(self._nodes_pred.get(node, ()))
 
     def predecessors(self, node):
-        return [x for x in self.predecessors_iter(node)]
+        return list(self._nodes_pred.get(node, ()))
 
     def successors_iter(self, node):
-        if not node in self._nodes_succ:
-            raise StopIteration
-        for n_suc in self._nodes_succ[node]:
-            yield n_suc
+        return iter(self._nodes_succ.get(node, ()))
 
     def successors(self, node):
-        return [x for x in self.successors_iter(node)]
+        return list(self._nodes_succ.get(node, ()))
 
     def leaves_iter(self):
         for node in self._nodes:
@@ -270,115 +305,118 @@ class DiGraph(object):
         return self._reachable_nodes(leaf, self.predecessors_iter)
 
     @staticmethod
-    def _compute_generic_dominators(head, reachable_cb, prev_cb, next_cb):
-        """Generic algorithm to compute either the dominators or postdominators
-        of the graph.
+    def _compute_generic_idoms(head, next_cb, prev_cb):
+        """Generic algorithm to compute either the immediate dominators or
+        the immediate postdominators of the graph.
+
+        Source: Cooper, Keith D., Timothy J. Harvey, and Ken Kennedy.
+        "A simple, fast dominance algorithm."
+        Software Practice & Experience 4 (2001), p. 7
+
         @head: the head/leaf of the graph
-        @reachable_cb: sons/parents of the head/leaf
-        @prev_cb: return predecessors/succesors of a node
         @next_cb: return succesors/predecessors of a node
+        @prev_cb: return predecessors/succesors of a node
+        Return a dictionnary node -> immediate (post)dominator, for each node
+        reachable from/to @head, except @head
         """
 
-        nodes = set(reachable_cb(head))
-        dominators = {}
-        for node in nodes:
-            dominators[node] = set(nodes)
-
-        dominators[head] = set([head])
-        todo = set(nodes)
-
+        # Postorder numbering of the nodes reachable from @head
+        postorder = []
+        index = {}
+        done = set([head])
+        todo = [(head, next_cb(head))]
         while todo:
-            node = todo.pop()
-
-            # Heads state must not be changed
-            if node == head:
-                continue
-
-            # Compute intersection of all predecessors'dominators
-            new_dom = None
-            for pred in prev_cb(node):
-                if not pred in nodes:
-                    continue
-                if new_dom is None:
-                    new_dom = set(dominators[pred])
-                new_dom.intersection_update(dominators[pred])
-
-            # We are not a head to we have at least one dominator
-            assert(new_dom is not None)
-
-            new_dom.update(set([node]))
-
-            # If intersection has changed, add sons to the todo list
-            if new_dom == dominators[node]:
-                continue
+            node, next_nodes = todo[-1]
+            for next_node in next_nodes:
+                if next_node not in done:
+                    done.add(next_node)
+                    todo.append((next_node, next_cb(next_node)))
+                    break
+            else:
+                todo.pop()
+                index[node] = len(postorder)
+                postorder.append(node)
+
+        preds = [[index[pred] for pred in prev_cb(node) if pred in index]
+                 for node in postorder]
+        head_index = len(postorder) - 1
+        idoms = [None] * len(postorder)
+        idoms[head_index] = head_index
+
+        changed = True
+        while changed:
+            changed = False
+            # Reverse postorder, without the head
+            for node in xrange(head_index - 1, -1, -1):
+                new_idom = None
+                for pred in preds[node]:
+                    if idoms[pred] is None:
+                        continue
+                    if new_idom is None:
+                        new_idom = pred
+                        continue
+                    # Intersect dominators of @pred and @new_idom
+                    finger1, finger2 = pred, new_idom
+                    while finger1 != finger2:
+                        while finger1 < finger2:
+                            finger1 = idoms[finger1]
+                        while finger2 < finger1:
+                            finger2 = idoms[finger2]
+                    new_idom = finger1
+                if idoms[node] != new_idom:
+                    idoms[node] = new_idom
+                    changed = True
+
+        return dict((postorder[node], postorder[idoms[node]])
+                    for node in xrange(head_index))
 
-            dominators[node] = new_dom
-            for succ in next_cb(node):
-                todo.add(succ)
+    @staticmethod
+    def _idoms2dominators(head, idoms):
+        """Return the dictionnary node -> set of its (post)dominators, from
+        the immediate (post)dominators @idoms of the head/leaf @head"""
+        dominators = {head: set([head])}
+        for node in idoms:
+            todo = []
+            while node not in dominators:
+                todo.append(node)
+                node = idoms[node]
+            for son in reversed(todo):
+                dominators[son] = dominators[node].union([son])
+                node = son
         return dominators
 
     def compute_dominators(self, head):
         """Compute the dominators of the graph"""
-        return self._compute_generic_dominators(head,
-                                                self.reachable_sons,
-                                                self.predecessors_iter,
-                                                self.successors_iter)
+        return self._idoms2dominators(head,
+                                      self.compute_immediate_dominators(head))
 
     def compute_postdominators(self, leaf):
         """Compute the postdominators of the graph"""
-        return self._compute_generic_dominators(leaf,
-                                                self.reachable_parents,
-                                                self.successors_iter,
-                                                self.predecessors_iter)
+        return self._idoms2dominators(leaf,
+                                      self.compute_immediate_postdominators(
+                                          leaf))
 
     @staticmethod
-    def _walk_generic_dominator(node, gen_dominators, succ_cb):
+    def _walk_generic_dominator(node, gen_dominators):
         """Generic algorithm to return an iterator of the ordered list of
         @node's dominators/post_dominator.
 
         The function doesn't return the self reference in dominators.
         @node: The start node
         @gen_dominators: The dictionary containing at least node's
-        dominators/post_dominators
-        @succ_cb: return predecessors/succesors of a node
+        dominators/post_dominators, and their own dominators/post_dominators
 
         """
-        # Init
-        done = set()
         if node not in gen_dominators:
             # We are in a branch which doesn't reach head
             return
-        node_gen_dominators = set(gen_dominators[node])
-        todo = set([node])
-
-        # Avoid working on itself
-        node_gen_dominators.remove(node)
-
-        # For each level
-        while node_gen_dominators:
-            new_node = None
-
-            # Worklist pattern
-            while todo:
-                node = todo.pop()
-                if node in done:
-                    continue
-                if node in node_gen_dominators:
-                    new_node = node
-                    break
-
-                # Avoid loops
-                done.add(node)
-
-                # Look for the next level
-                for pred in succ_cb(node):
-                    todo.add(pred)
-
-            # Return the node; it's the next starting point
-            assert(new_node is not None)
-            yield new_node
-            node_gen_dominators.remove(new_node)
-            todo = set([new_node])
+        # Dominators of a node form a chain: the nearest one has the most
+        # dominators
+        node_gen_dominators = sorted(gen_dominators[node],
+                                     key=lambda dom: len(gen_dominators[dom]),
+                                     reverse=True)
+        for dominator in node_gen_dominators[1:]:
+            yield dominator
 
     def walk_dominators(self, node, dominators):
         """Return an iterator of the ordered list of @node's dominators
@@ -386,9 +424,7 @@ class DiGraph(object):
         @node: The start node
         @dominators: The dictionary containing at least node's dominators
         """
-        return self._walk_generic_dominator(node,
-                                            dominators,
-                                            self.predecessors_iter)
+        return self._walk_generic_dominator(node, dominators)
 
     def walk_postdominators(self, node, postdominators):
         """Return an iterator of the ordered list of @node's postdominators
@@ -398,21 +434,51 @@ class DiGraph(object):
         postdominators
 
         """
-        return self._walk_generic_dominator(node,
-                                            postdominators,
-                                            self.successors_iter)
+        return self._walk_generic_dominator(node, postdominators)
 
     def compute_immediate_dominators(self, head):
         """Compute the immediate dominators of the graph"""
-        dominators = self.compute_dominators(head)
-        idoms = {}
+        return self._compute_generic_idoms(head,
+                                           self.successors_iter,
+                                           self.predecessors_iter)
+
+    def compute_immediate_postdominators(self, leaf):
+        """Compute the immediate postdominators of the graph"""
+        return self._compute_generic_idoms(leaf,
+                                           self.predecessors_iter,
+                                           self.successors_iter)
+
+    def compute_dominator_tree(self, head):
+        """Compute the dominator tree of the graph: a DiGraph with an edge
+        from the immediate dominator of each node to this node"""
+        tree = DiGraph()
+        tree.add_node(head)
+        for node, idom in self.compute_immediate_dominators(head).iteritems():
+            tree.add_edge(idom, node)
+        return tree
 
-        for node in dominators:
-            for predecessor in self.walk_dominators(node, dominators):
-                if predecessor in dominators[node] and node != predecessor:
-                    idoms[node] = predecessor
-                    break
-        return idoms
+    @staticmethod
+    def _compute_dominance_intervals(head, idoms):
+        """Number the nodes of the dominator tree @idoms of root @head, so
+        that a node A dominates a node B iff the interval of A contains the
+        interval of B
+        Return a dictionnary node -> (enter number, exit number)"""
+        sons = {}
+        for node, idom in idoms.iteritems():
+            sons.setdefault(idom, []).append(node)
+        enter, intervals = {}, {}
+        counter = 0
+        todo = [head]
+        while todo:
+            node = todo.pop()
+            if node in enter:
+                intervals[node] = (enter[node], counter)
+            else:
+                enter[node] = counter
+                todo.append(node)
+                todo += sons.get(node, [])
+            counter += 1
+        return intervals
 
     def compute_dominance_frontier(self, head):
         """
@@ -426,7 +492,7 @@ class DiGraph(object):
         frontier = {}
 
         for node in idoms:
-            if self._nodes_pred[node] >= 2:
+            if len(self._nodes_pred[node]) >= 2:
                 for predecessor in self.predecessors_iter(node):
                     runner = predecessor
                     if runner not in idoms:
@@ -527,13 +593,16 @@ class DiGraph(object):
         :param head: head of graph
         :return: yield a back edge
         """
-        dominators = self.compute_dominators(head)
+        intervals = self._compute_dominance_intervals(
+            head, self.compute_immediate_dominators(head))
 
         # traverse graph
         for node in self.walk_depth_first_forward(head):
+            node_enter, node_exit = intervals[node]
             for successor in self.successors_iter(node):
                 # check for a back edge to a dominator
-                if successor in dominators[node]:
+                succ_enter, succ_exit = intervals[successor]
+                if succ_enter <= node_enter and node_exit <= succ_exit:
                     edge = (node, successor)
                     yield edge
 
@@ -558,6 +627,147 @@ class DiGraph(object):
                 todo.append(predecessor)
         return done
 
+    def compute_loop_nesting_forest(self, head):
+        """
+        Computes the loop nesting forest of the graph, including irreducible
+        loops. A node belongs to the loop of its header when it is reachable
+        from, and reaches, this header without going through it again.
+
+        The result is cached until the graph is modified.
+
+        Source: Havlak, Paul. "Nesting of reducible and irreducible loops."
+        ACM TOPLAS 19.4 (1997), pp. 557--567, with the fix from Ramalingam,
+        G. "Identifying loops in almost linear time." ACM TOPLAS 21.2 (1999)
+        :param head: head of the graph
+        :return: dictionnary header -> Loop(header, nodes, children, parent,
+        depth, reducible), depth being 1 for outermost loops
+        """
+        return dict(self._get_loop_nesting_forest(head))
+
+    def _get_loop_nesting_forest(self, head):
+        """Return the cached loop nesting forest from @head, computing it if
+        needed"""
+        forest = self._loop_forests.get(head)
+        if forest is None:
+            forest = self._compute_loop_nesting_forest(head)
+            self._loop_forests[head] = forest
+        return forest
+
+    def _compute_loop_nesting_forest(self, head):
+        """Computes the loop nesting forest (see compute_loop_nesting_forest)
+        """
+        # Depth first preorder numbering. Descendants of a node are numbered
+        # from its number to last[number]
+        nodes = [head]
+        number = {head: 0}
+        last = {}
+        todo = [(head, self.successors_iter(head))]
+        while todo:
+            node, successors = todo[-1]
+            for succ in successors:
+                if succ not in number:
+                    number[succ] = len(nodes)
+                    nodes.append(succ)
+                    todo.append((succ, self.successors_iter(succ)))
+                    break
+            else:
+                todo.pop()
+                last[number[node]] = len(nodes) - 1
+
+        # Split predecessors between back edges and others
+        back_preds = [[] for _ in nodes]
+        non_back_preds = [set() for _ in nodes]
+        for index, node in enumerate(nodes):
+            for pred in self.predecessors_iter(node):
+                pred_index = number.get(pred)
+                if pred_index is None:
+                    # Unreachable from head
+                    continue
+                if index <= pred_index <= last[index]:
+                    back_preds[index].append(pred_index)
+                else:
+                    non_back_preds[index].add(pred_index)
+
+        # Union-find, merging loop bodies into their header
+        union = range(len(nodes))
+
+        def find(index):
+            """Return the representative of @index, compressing the path"""
+            root = index
+            while union[root] != root:
+                root = union[root]
+            while union[index] != root:
+                union[index], index = root, union[index]
+            return root
+
+        header = [None] * len(nodes)
+        is_header = [False] * len(nodes)
+        reducible = [True] * len(nodes)
+        for index in xrange(len(nodes) - 1, -1, -1):
+            pool = set()
+            for pred_index in back_preds[index]:
+                if pred_index == index:
+                    # Self loop
+                    is_header[index] = True
+                else:
+                    pool.add(find(pred_index))
+            worklist = list(pool)
+            while worklist:
+                member = worklist.pop()
+                for pred_index in non_back_preds[member]:
+                    rep = find(pred_index)
+                    if not index <= rep <= last[index]:
+                        # Entry from outside the header's DFS subtree
+                        reducible[index] = False
+                        non_back_preds[index].add(rep)
+                    elif rep != index and rep not in pool:
+                        pool.add(rep)
+                        worklist.append(rep)
+            if pool:
+                is_header[index] = True
+            for member in pool:
+                header[member] = index
+                union[member] = index
+
+        # Build loops, outermost first
+        depth = {}
+        loop_nodes = {}
+        children = {}
+        for index, node in enumerate(nodes):
+            parent = header[index]
+            if is_header[index]:
+                depth[index] = 1 if parent is None else depth[parent] + 1
+                loop_nodes[index] = [node]
+                children[index] = []
+                if parent is not None:
+                    children[parent].append(node)
+            elif parent is not None:
+                loop_nodes[parent].append(node)
+
+        forest = {}
+        for index, members in loop_nodes.iteritems():
+            parent = header[index]
+            forest[nodes[index]] = self.Loop(
+                nodes[index], frozenset(members), frozenset(children[index]),
+                None if parent is None else nodes[parent],
+                depth[index], reducible[index])
+        return forest
+
+    def compute_loop_body(self, head, header):
+        """Return the set of the nodes of the loop of @header, including the
+        nodes of its nested loops
+        :param head: head of the graph
+        :param header: loop header, in compute_loop_nesting_forest(head)
+        """
+        forest = self._get_loop_nesting_forest(head)
+        body = set()
+        todo = [header]
+        while todo:
+            loop = forest[todo.pop()]
+            body.update(loop.nodes)
+            todo += loop.children
+        return body
+
     def compute_strongly_connected_components(self):
         """
         Partitions the graph into strongly connected components.
@@ -645,25 +855,49 @@ class DiGraphSimplifier(object):
 
     def __init__(self):
         self.passes = []
+        # Nodes added, removed or whose edges changed during the previous
+        # round of passes; None if the whole graph must be considered
+        self.touched = None
 
     def enable_passes(self, passes):
         """Add @passes to passes to applied
         @passes: sequence of function (DiGraphSimplifier, DiGraph) -> None
+
+        Passes may restrict their work to the nodes in `self.touched` (see
+        `MatchGraph.match`), as the other parts of the graph have already been
+        examined by a previous round.
         """
         self.passes += passes
 
+    @staticmethod
+    def _touched_nodes(graph, new_graph):
+        """Return the set of nodes added, removed or whose edges differ
+        between @graph and @new_graph"""
+        touched = graph.nodes() ^ new_graph.nodes()
+        edges = (set(graph._edges.iteritems()) ^
+                 set(new_graph._edges.iteritems()))
+        for (src, dst), _ in edges:
+            touched.add(src)
+            touched.add(dst)
+        return touched
+
     def apply_simp(self, graph):
-        """Apply enabled simplifications on graph @graph
+        """Apply enabled simplifications on graph @graph, until a fixpoint is
+        reached
         @graph: DiGraph instance
         """
+        self.touched = None
         while True:
             new_graph = graph.copy()
             for simp_func in self.passes:
                 simp_func(self, new_graph)
 
-            if new_graph == graph:
+            touched = self._touched_nodes(graph, new_graph)
+            if not touched:
                 break
+            self.touched = touched
             graph = new_graph
+        self.touched = None
         return new_graph
 
     def __call__(self, graph):
@@ -752,7 +986,9 @@ class MatchGraph(DiGraph):
 
     This class provides API to match a given DiGraph pattern, with addidionnal
     restrictions.
-    The implemented algorithm is a naive approach.
+    The implemented algorithm is a naive approach: candidates for a first
+    joker are looked up in an index of the graph nodes by (in degree, out
+    degree), then partial solutions are extended along the pattern edges.
 
     The recommended way to instanciate a MatchGraph is the use of
     MatchGraphJoker.
@@ -872,25 +1108,50 @@ class MatchGraph(DiGraph):
         """Propagate through @node predecessors in @graph"""
         return graph.predecessors_iter(node)
 
-    def match(self, graph):
-        """Naive subgraph matching between graph and self.
-        Iterator on matching solution, as dictionary MatchGraphJoker -> @graph
+    @staticmethod
+    def _index_nodes(graph, nodes):
+        """Index @nodes of @graph by (in degree, out degree)
+        Return a dictionary (in degree, out degree) -> list of (position in
+        @nodes, node)
+        @graph: DiGraph instance
+        @nodes: iterable of @graph's nodes
+        """
+        index = {}
+        for pos, node in enumerate(nodes):
+            key = (len(graph._nodes_pred[node]), len(graph._nodes_succ[node]))
+            index.setdefault(key, []).append((pos, node))
+        return index
+
+    def _candidates(self, joker, index):
+        """Iterator on (position, node) of @index which may stand for @joker,
+        regardless of the other jokers, in position order
+        @joker: MatchGraphJoker instance
+        @index: nodes index, as returned by `_index_nodes`
+        """
+        nb_pred = len(self._nodes_pred[joker])
+        nb_succ = len(self._nodes_succ[joker])
+        candidates = []
+        for (in_degree, out_degree), nodes in index.iteritems():
+            if in_degree < nb_pred or out_degree < nb_succ:
+                continue
+            if joker.restrict_in and in_degree != nb_pred:
+                continue
+            if joker.restrict_out and out_degree != nb_succ:
+                continue
+            candidates.append(nodes)
+        for pos, node in heapq.merge(*candidates):
+            if joker.filt(node):
+                yield pos, node
+
+    def _extend_sol(self, partial_sol, graph):
+        """Iterator on the complete solutions extending @partial_sol in @graph
+        @partial_sol: dictionary MatchGraphJoker -> @graph's node
         @graph: DiGraph instance
-        In order to obtained correct and complete results, @graph must be
-        connected.
         """
         # Partial solution: nodes corrects, edges between these nodes corrects
         # A partial solution is a dictionary MatchGraphJoker -> @graph's node
-        todo = list()  # Dictionnaries containing partial solution
-        done = list()  # Aleady computed partial solutions
-
-        # Elect first candidates
-        to_match = next(iter(self._nodes))
-        for node in graph.nodes():
-            if self._check_node(node, to_match, graph):
-                to_add = {to_match: node}
-                if to_add not in todo:
-                    todo.append(to_add)
+        todo = [partial_sol]  # Dictionnaries containing partial solution
+        done = set()  # Aleady computed partial solutions
 
         while todo:
             # When a partial_sol is computed, if more precise partial solutions
@@ -903,9 +1164,10 @@ class MatchGraph(DiGraph):
             partial_sol = todo.pop()
 
             # Avoid infinite loop and recurrent work
-            if partial_sol in done:
+            key = frozenset(partial_sol.iteritems())
+            if key in done:
                 continue
-            done.append(partial_sol)
+            done.add(key)
 
             # If all nodes are matching, this is a potential solution
             if len(partial_sol) == len(self._nodes):
@@ -919,4 +1181,59 @@ class MatchGraph(DiGraph):
                 self._propagate_sol(node, partial_sol, graph, todo,
                                     MatchGraph._propagate_predecessors)
 
-        raise StopIteration
+    @staticmethod
+    def match_patterns(patterns, graph, nodes=None):
+        """Subgraph matching between @graph and several @patterns, in one
+        traversal of @graph.
+        Iterator on (pattern, solution), solutions being dictionaries
+        MatchGraphJoker -> @graph's node, reported as soon as they are found
+        @patterns: sequence of MatchGraph instances
+        @graph: DiGraph instance
+        @nodes: (optional) if set, only report solutions involving at least one
+        of these nodes (for instance, the nodes modified since a previous
+        match); nodes which are not in @graph are ignored
+        In order to obtained correct and complete results, @graph and
+        @patterns must be connected.
+        """
+        whole_graph = nodes is None
+        if whole_graph:
+            nodes = graph.nodes()
+        else:
+            nodes = [node for node in nodes if node in graph.nodes()]
+        index = MatchGraph._index_nodes(graph, nodes)
+
+        # Elect first candidates: nodes standing for the first joker if the
+        # whole graph is considered, for any joker otherwise
+        seeds = []
+        for pattern_nb, pattern in enumerate(patterns):
+            jokers = list(pattern._nodes)
+            if whole_graph:
+                jokers = jokers[:1]
+            for joker_nb, joker in enumerate(jokers):
+                for pos, node in pattern._candidates(joker, index):
+                    seeds.append((pos, pattern_nb, joker_nb, joker, node))
+        seeds.sort(key=lambda seed: seed[:3])
+
+        # Last candidates first, as a "depth first" approach
+        found = [set() for _ in patterns]
+        for _, pattern_nb, _, joker, node in reversed(seeds):
+            pattern = patterns[pattern_nb]
+            for sol in pattern._extend_sol({joker: node}, graph):
+                # A solution may be reached from several of its nodes
+                key = frozenset(sol.iteritems())
+                if key in found[pattern_nb]:
+                    continue
+                found[pattern_nb].add(key)
+                yield pattern, sol
+
+    def match(self, graph, nodes=None):
+        """Naive subgraph matching between graph and self.
+        Iterator on matching solution, as dictionary MatchGraphJoker -> @graph
+        @graph: DiGraph instance
+        @nodes: (optional) if set, only solutions involving at least one of
+        these nodes are returned (see `match_patterns`)
+        In order to obtained correct and complete results, @graph must be
+        connected.
+        """
+        for _, sol in MatchGraph.match_patterns([self], graph, nodes):
+            yield sol
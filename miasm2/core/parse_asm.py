@@ -60,8 +60,8 @@ class DirectiveDontSplit(Directive):
     pass
 
 
-def guess_next_new_label(symbol_pool):
-    """Generate a new label
+def guess_next_new_label_name(symbol_pool):
+    """Generate a new label name, unused in @symbol_pool
     @symbol_pool: the asm_symbol_pool instance"""
     i = 0
     gen_name = "loc_%.8X"
@@ -69,10 +69,16 @@ def guess_next_new_label(symbol_pool):
         name = gen_name % i
         label = symbol_pool.getby_name(name)
         if label is None:
-            return symbol_pool.add_label(name)
+            return name
         i += 1
 
 
+def guess_next_new_label(symbol_pool):
+    """Generate a new label
+    @symbol_pool: the asm_symbol_pool instance"""
+    return symbol_pool.add_label(guess_next_new_label_name(symbol_pool))
+
+
 def replace_expr_labels(expr, symbol_pool, replace_id):
     """Create asm_label of the expression @expr in the @symbol_pool
     Update @replace_id"""
@@ -102,27 +108,28 @@ STATE_NO_BLOC = 0
 STATE_IN_BLOC = 1
 
 
-def parse_txt(mnemo, attrib, txt, symbol_pool=None):
-    """Parse an assembly listing. Returns a couple (blocks, symbol_pool), where
-    blocks is a list of asm_bloc and symbol_pool the associated asm_symbol_pool
+def split_lines(txt):
+    """Iterate over the lines of the assembly listing @txt
+    @txt: string, or iterable of lines (such as a file object)
+    """
+    if isinstance(txt, basestring):
+        txt = txt.split('\n')
+    for line in txt:
+        yield line.rstrip('\n')
+
+
+def parse_lines(mnemo, attrib, txt, symbol_pool):
+    """Parse the assembly listing @txt line by line. Yield its labels,
+    directives, asm_raw and instructions
 
     @mnemo: architecture used
     @attrib: architecture attribute
-    @txt: assembly listing
-    @symbol_pool: (optional) the asm_symbol_pool instance used to handle labels
-    of the listing
-
+    @txt: assembly listing, as a string or an iterable of lines
+    @symbol_pool: the asm_symbol_pool instance used to handle labels
     """
 
-    if symbol_pool is None:
-        symbol_pool = asmbloc.asm_symbol_pool()
-
-    C_NEXT = asmbloc.asm_constraint.c_next
-    C_TO = asmbloc.asm_constraint.c_to
-
-    lines = []
     # parse each line
-    for line in txt.split('\n'):
+    for line in split_lines(txt):
         # empty
         if EMPTY_RE.match(line):
             continue
@@ -137,7 +144,7 @@ def parse_txt(mnemo, attrib, txt, symbol_pool=None):
         if match_re:
             label_name = match_re.group(1)
             label = symbol_pool.getby_name_create(label_name)
-            lines.append(label)
+            yield label
             continue
         # directive
         if DIRECTIVE_START_RE.match(line):
@@ -152,7 +159,7 @@ def parse_txt(mnemo, attrib, txt, symbol_pool=None):
                 raw = raw.decode('string_escape')
                 if directive == 'string':
                     raw += "\x00"
-                lines.append(asmbloc.asm_raw(raw))
+                yield asmbloc.asm_raw(raw)
                 continue
             if directive == 'ustring':
                 # XXX HACK
@@ -160,7 +167,7 @@ def parse_txt(mnemo, attrib, txt, symbol_pool=None):
                 raw = line[line.find(r'"') + 1:line.rfind(r'"')] + "\x00"
                 raw = raw.decode('string_escape')
                 raw = "".join([string + '\x00' for string in raw])
-                lines.append(asmbloc.asm_raw(raw))
+                yield asmbloc.asm_raw(raw)
                 continue
             if directive in declarator:
                 data_raw = line[match_re.end():].split(' ', 1)[1]
@@ -182,20 +189,20 @@ def parse_txt(mnemo, attrib, txt, symbol_pool=None):
 
                 raw_data = asmbloc.asm_raw(expr_list)
                 raw_data.element_size = size
-                lines.append(raw_data)
+                yield raw_data
                 continue
             if directive == 'comm':
                 # TODO
                 continue
             if directive == 'split':  # custom command
-                lines.append(DirectiveSplit())
+                yield DirectiveSplit()
                 continue
             if directive == 'dontsplit':  # custom command
-                lines.append(DirectiveDontSplit())
+                yield DirectiveDontSplit()
                 continue
             if directive == "align":
                 align_value = int(line[match_re.end():], 0)
-                lines.append(DirectiveAlign(align_value))
+                yield DirectiveAlign(align_value)
                 continue
             if directive in ['file', 'intel_syntax', 'globl', 'local',
                              'type', 'size', 'align', 'ident', 'section']:
@@ -210,7 +217,7 @@ def parse_txt(mnemo, attrib, txt, symbol_pool=None):
         if match_re:
             label_name = match_re.group(1)
             label = symbol_pool.getby_name_create(label_name)
-            lines.append(label)
+            yield label
             continue
 
         # code
@@ -224,41 +231,64 @@ def parse_txt(mnemo, attrib, txt, symbol_pool=None):
 
         if instr.dstflow():
             instr.dstflow2label(symbol_pool)
-        lines.append(instr)
+        yield instr
+
+
+def parse_txt(mnemo, attrib, txt, symbol_pool=None):
+    """Parse an assembly listing. Returns a couple (blocks, symbol_pool), where
+    blocks is a list of asm_bloc and symbol_pool the associated asm_symbol_pool
+
+    @mnemo: architecture used
+    @attrib: architecture attribute
+    @txt: assembly listing, as a string or an iterable of lines (for instance,
+    a file object, which is then read line by line)
+    @symbol_pool: (optional) the asm_symbol_pool instance used to handle labels
+    of the listing
+
+    """
+
+    if symbol_pool is None:
+        symbol_pool = asmbloc.asm_symbol_pool()
+
+    C_NEXT = asmbloc.asm_constraint.c_next
+    C_TO = asmbloc.asm_constraint.c_to
 
-    asmbloc.log_asmbloc.info("___pre asm oki___")
     # make blocks
 
+    lines = parse_lines(mnemo, attrib, txt, symbol_pool)
+    line = next(lines, None)
     cur_block = None
     state = STATE_NO_BLOC
-    i = 0
     blocks = asmbloc.AsmCFG()
     block_to_nlink = None
     delayslot = 0
-    while i < len(lines):
+    # Labels generated for blocks without one. They are named once the whole
+    # listing is parsed, so that they do not collide with the listing ones
+    unnamed_labels = []
+    while line is not None:
         if delayslot:
             delayslot -= 1
             if delayslot == 0:
                 state = STATE_NO_BLOC
-        line = lines[i]
         # no current block
         if state == STATE_NO_BLOC:
             if isinstance(line, DirectiveDontSplit):
                 block_to_nlink = cur_block
-                i += 1
+                line = next(lines, None)
                 continue
             elif isinstance(line, DirectiveSplit):
                 block_to_nlink = None
-                i += 1
+                line = next(lines, None)
                 continue
             elif not isinstance(line, asmbloc.asm_label):
                 # First line must be a label. If it's not the case, generate
                 # it.
-                label = guess_next_new_label(symbol_pool)
+                label = symbol_pool.add_label("")
+                unnamed_labels.append(label)
                 cur_block = asmbloc.asm_bloc(label, alignment=mnemo.alignment)
             else:
                 cur_block = asmbloc.asm_bloc(line, alignment=mnemo.alignment)
-                i += 1
+                line = next(lines, None)
             # Generate the current bloc
             blocks.add_node(cur_block)
             state = STATE_IN_BLOC
@@ -294,7 +324,7 @@ def parse_txt(mnemo, attrib, txt, symbol_pool=None):
                 cur_block.addline(line)
                 block_to_nlink = cur_block
                 if not line.breakflow():
-                    i += 1
+                    line = next(lines, None)
                     continue
                 if delayslot:
                     raise RuntimeError("Cannot have breakflow in delayslot")
@@ -312,7 +342,10 @@ def parse_txt(mnemo, attrib, txt, symbol_pool=None):
                 delayslot = line.delayslot + 1
             else:
                 raise RuntimeError("unknown class %s" % line.__class__)
-        i += 1
+        line = next(lines, None)
+
+    for label in unnamed_labels:
+        symbol_pool.rename_label(label, guess_next_new_label_name(symbol_pool))
 
     for block in blocks:
         # Fix multiple constraints
@@ -176,9 +176,16 @@ def get_str(vm, addr, enc, max_char=None, end='\x00'):
         Unencoded here means that the actual ending sequence that this function
         will look for is end.encode(enc), not directly @end.
     """
-    s = []
     end_char= end.encode(enc)
     step = len(end_char)
+    if end_char in ("\x00", "\x00\x00"):
+        # Null terminated string, read in C
+        if max_char is not None:
+            max_char = (max_char + step - 1) / step
+        if step == 1:
+            return vm.get_cstr(addr, max_char).decode(enc)
+        return vm.get_wstr(addr, max_char).decode(enc)
+    s = []
     i = 0
     while max_char is None or i < max_char:
         c = vm.get_mem(addr + i, step)
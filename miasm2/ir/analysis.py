@@ -1,7 +1,9 @@
 #!/usr/bin/env python
 #-*- coding:utf-8 -*-
 
+import heapq
 import logging
+from itertools import chain
 
 from miasm2.ir.symbexec import symbexec
 from miasm2.ir.ir import ir, AssignBlock
@@ -73,15 +75,16 @@ class ira(ir):
                 continue
 
             block = self.blocs[node]
+            last = len(block.irs) - 1
             successors = self.graph.successors(node)
             has_son = bool(successors)
             for p_son in successors:
                 if p_son not in self.blocs:
                     # Leaf has lost its son: don't remove anything
                     # reaching this block
-                    for r in self.ira_regs_ids():
-                        useful.update(block.irs[-1]._cur_reach[r].union(
-                            block.irs[-1].defout[r]))
+                    useful.update(self._bits2defs(
+                        self._reach_in[node][last] |
+                        self._reach_gen[node][last]))
 
             # Function call, memory write or IRDst affectation
             for idx, assignblk in enumerate(block.irs):
@@ -91,14 +94,16 @@ class ira(ir):
                         useful.add((block.label, idx, dst))
                     if isinstance(dst, ExprMem):
                         useful.add((block.label, idx, dst))
-                    useful.update(block.irs[idx].defout[self.IRDst])
+                if self.IRDst in assignblk:
+                    useful.add((block.label, idx, self.IRDst))
 
             # Affecting return registers
             if not has_son:
                 for r in self.get_out_regs(block):
-                    useful.update(block.irs[-1].defout[r]
-                                  if block.irs[-1].defout[r] else
-                                  block.irs[-1]._cur_reach[r])
+                    if r in block.irs[-1]:
+                        useful.add((block.label, last, r))
+                    else:
+                        useful.update(self.get_reach(block.label, last, r))
 
         return useful
 
@@ -114,7 +119,13 @@ class ira(ir):
 
         """
 
+        regs = set(self.ira_regs_ids())
         useful = self.init_useful_instr()
+        # Useful definitions, as a bit vector
+        useful_defs = 0
+        for i, definition in enumerate(self._reach_defs):
+            if definition in useful:
+                useful_defs |= 1 << i
         worklist = useful.copy()
         while worklist:
             elem = worklist.pop()
@@ -123,19 +134,16 @@ class ira(ir):
 
             assignblk = self.blocs[irb_label].irs[irs_ind]
             ins = assignblk.dst2ExprAff(dst)
-
-            # Handle dependencies of used variables in ins
-            for reg in ins.get_r(True).intersection(self.ira_regs_ids()):
-                worklist.update(
-                    assignblk._cur_reach[reg].difference(useful).difference(
-                        assignblk._cur_kill[reg]
-                        if not assignblk.defout[reg] else
-                        set()))
-                for _, _, defout_dst in assignblk.defout[reg]:
-                    # Loop case (dst in defout of current irb)
-                    if defout_dst == dst:
-                        worklist.update(
-                            assignblk._cur_reach[reg].difference(useful))
+            reach = self._reach_in[irb_label][irs_ind]
+
+            # Handle dependencies of used variables in ins: sources are read
+            # before the AssignBlock writes
+            for reg in ins.get_r(True).intersection(regs):
+                new_defs = (reach & self._reach_masks.get(reg, 0) &
+                            ~useful_defs)
+                if new_defs:
+                    useful_defs |= new_defs
+                    worklist.update(self._bits2defs(new_defs))
         return useful
 
     def remove_dead_code(self):
@@ -148,12 +156,11 @@ class ira(ir):
         modified = False
         for block in self.blocs.values():
             modified |= self.remove_dead_instr(block, useful)
-            # Remove useless structures
-            for assignblk in block.irs:
-                del assignblk._cur_kill
-                del assignblk._prev_kill
-                del assignblk._cur_reach
-                del assignblk._prev_reach
+        # Remove useless structures
+        del self._reach_defs
+        del self._reach_masks
+        del self._reach_in
+        del self._reach_gen
         return modified
 
     def set_dead_regs(self, b):
@@ -171,99 +178,151 @@ class ira(ir):
             print '    (%s, %s, %s)' % p
 
     def dump_bloc_state(self, irb):
+        """Print the reach analysis state of each AssignBlock of @irb
+        PRE: compute_reach(self)"""
         print '*' * 80
-        for irs in irb.irs:
-            for assignblk in irs:
-                print 5 * "-"
-                print 'instr', assignblk
-                print 5 * "-"
-                for v in self.ira_regs_ids():
-                    if assignblk._cur_reach[v]:
-                        print 'REACH[%d][%s]' % (k, v)
-                        self.print_set(assignblk._cur_reach[v])
-                    if assignblk._cur_kill[v]:
-                        print 'KILL[%d][%s]' % (k, v)
-                        self.print_set(assignblk._cur_kill[v])
-                    if assignblk.defout[v]:
-                        print 'DEFOUT[%d][%s]' % (k, v)
-                        self.print_set(assignblk.defout[v])
-
-    def compute_reach_block(self, irb):
-        """Variable influence computation for a single block
-        @irb: irbloc instance
-        PRE: init_reach()
-        """
-
-        reach_block = {key: value.copy()
-                       for key, value in irb.irs[0]._cur_reach.iteritems()}
-
-        # Compute reach from predecessors
-        for n_pred in self.graph.predecessors(irb.label):
-            p_block = self.blocs[n_pred]
-
-            # Handle each register definition
-            for c_reg in self.ira_regs_ids():
-                # REACH(n) = U[p in pred] DEFOUT(p) U REACH(p)\KILL(p)
-                pred_through = p_block.irs[-1].defout[c_reg].union(
-                    p_block.irs[-1]._cur_reach[c_reg].difference(
-                        p_block.irs[-1]._cur_kill[c_reg]))
-                reach_block[c_reg].update(pred_through)
-
-        # If a predecessor has changed
-        if reach_block != irb.irs[0]._cur_reach:
-            irb.irs[0]._cur_reach = reach_block
-            for c_reg in self.ira_regs_ids():
-                if irb.irs[0].defout[c_reg]:
-                    # KILL(n) = DEFOUT(n) ? REACH(n)\DEFOUT(n) : EMPTY
-                    irb.irs[0]._cur_kill[c_reg].update(
-                        reach_block[c_reg].difference(irb.irs[0].defout[c_reg]))
-
-        # Compute reach and kill for block's instructions
-        for i in xrange(1, len(irb.irs)):
-            for c_reg in self.ira_regs_ids():
-                # REACH(n) = U[p in pred] DEFOUT(p) U REACH(p)\KILL(p)
-                pred_through = irb.irs[i - 1].defout[c_reg].union(
-                    irb.irs[i - 1]._cur_reach[c_reg].difference(
-                        irb.irs[i - 1]._cur_kill[c_reg]))
-                irb.irs[i]._cur_reach[c_reg].update(pred_through)
-                if irb.irs[i].defout[c_reg]:
-                    # KILL(n) = DEFOUT(n) ? REACH(n)\DEFOUT(n) : EMPTY
-                    irb.irs[i]._cur_kill[c_reg].update(
-                        irb.irs[i]._cur_reach[c_reg].difference(
-                            irb.irs[i].defout[c_reg]))
-
-    def _test_kill_reach_fix(self):
-        """Return True iff a fixed point has been reached during reach
-        analysis"""
-
-        fixed = True
-        for node in self.graph.nodes():
-            if node in self.blocs:
-                irb = self.blocs[node]
-                for assignblk in irb.irs:
-                    if (assignblk._cur_reach != assignblk._prev_reach or
-                            assignblk._cur_kill != assignblk._prev_kill):
-                        fixed = False
-                        # This is not a deepcopy, but cur_reach is assigned to a
-                        # new dictionnary on change in `compute_reach_block`
-                        assignblk._prev_reach = assignblk._cur_reach.copy()
-                        assignblk._prev_kill = assignblk._cur_kill.copy()
-        return fixed
+        for idx, assignblk in enumerate(irb.irs):
+            print 5 * "-"
+            print 'instr', assignblk
+            print 5 * "-"
+            for v in self.ira_regs_ids():
+                reach = self.get_reach(irb.label, idx, v)
+                if reach:
+                    print 'REACH[%d][%s]' % (idx, v)
+                    self.print_set(reach)
+                if v in assignblk:
+                    print 'DEFOUT[%d][%s]' % (idx, v)
+                    self.print_set([(irb.label, idx, v)])
+
+    def _bits2defs(self, bits):
+        """Return the set of definitions (block, instruction number,
+        register) of the bit vector @bits
+        PRE: compute_reach(self)"""
+        defs = set()
+        while bits:
+            lowest = bits & -bits
+            defs.add(self._reach_defs[lowest.bit_length() - 1])
+            bits ^= lowest
+        return defs
+
+    def get_reach(self, irb_label, index, reg):
+        """Return the set of definitions (block, instruction number, register)
+        of @reg reaching the AssignBlock @index of the block @irb_label,
+        before its execution
+        PRE: compute_reach(self)"""
+        return self._bits2defs(self._reach_in[irb_label][index] &
+                               self._reach_masks.get(reg, 0))
+
+    def _reach_order(self):
+        """Return the labels of the blocks, in reverse postorder of a depth
+        first walk from the graph heads"""
+        done = set()
+        postorder = []
+        for head in chain(self.graph.heads_iter(), self.blocs):
+            if head in done or head not in self.blocs:
+                continue
+            done.add(head)
+            todo = [(head, self.graph.successors_iter(head))]
+            while todo:
+                node, successors = todo[-1]
+                for succ in successors:
+                    if succ not in done and succ in self.blocs:
+                        done.add(succ)
+                        todo.append((succ, self.graph.successors_iter(succ)))
+                        break
+                else:
+                    todo.pop()
+                    postorder.append(node)
+        postorder.reverse()
+        return postorder
 
     def compute_reach(self):
         """
-        Compute reach, defout and kill sets until a fixed point is reached.
+        Compute the definitions reaching each AssignBlock, until a fixed
+        point is reached.
+
+        Register definitions (block, instruction number, register) are
+        numbered, and sets of definitions are stored as bit vectors (int).
+        The fixed point is computed on blocks, using a worklist ordered in
+        reverse postorder.
 
         Source : Kennedy, K. (1979). A survey of data flow analysis techniques.
         IBM Thomas J. Watson Research Division, page 43
         """
-        fixed_point = False
+        regs = set(self.ira_regs_ids())
+        # Definition number -> (block, instruction number, register)
+        self._reach_defs = defs = []
+        # Register -> definitions of the register
+        self._reach_masks = masks = {}
+        # Block -> definitions generated by each AssignBlock
+        self._reach_gen = {}
+        # Block -> definitions reaching each AssignBlock
+        self._reach_in = {}
+
+        written = {}
+        for label, irb in self.blocs.iteritems():
+            gens, dsts = [], []
+            for idx, assignblk in enumerate(irb.irs):
+                gen = 0
+                assignblk_dsts = [dst for dst in assignblk if dst in regs]
+                for dst in assignblk_dsts:
+                    bit = 1 << len(defs)
+                    defs.append((label, idx, dst))
+                    masks[dst] = masks.get(dst, 0) | bit
+                    gen |= bit
+                gens.append(gen)
+                dsts.append(assignblk_dsts)
+            self._reach_gen[label] = gens
+            written[label] = dsts
+
+        # KILL(n) = definitions of the registers written by n
+        kills = {}
+        block_gen, block_kill = {}, {}
+        for label, gens in self._reach_gen.iteritems():
+            kills[label] = kill_list = []
+            gen_out, kill_out = 0, 0
+            for gen, assignblk_dsts in zip(gens, written[label]):
+                kill = 0
+                for dst in assignblk_dsts:
+                    kill |= masks[dst]
+                kill_list.append(kill)
+                gen_out = gen | (gen_out & ~kill)
+                kill_out |= kill
+            block_gen[label], block_kill[label] = gen_out, kill_out
+
+        # REACH(n) = U[p in pred] DEFOUT(p) U REACH(p)\KILL(p)
+        order = self._reach_order()
+        rank = dict((label, i) for i, label in enumerate(order))
+        reach_in = dict.fromkeys(order, 0)
+        reach_out = dict(block_gen)
+        worklist = range(len(order))
+        pending = set(worklist)
         log.debug('iteration...')
-        while not fixed_point:
-            for node in self.graph.nodes():
-                if node in self.blocs:
-                    self.compute_reach_block(self.blocs[node])
-            fixed_point = self._test_kill_reach_fix()
+        while worklist:
+            i = heapq.heappop(worklist)
+            pending.remove(i)
+            label = order[i]
+            new_in = 0
+            for pred in self.graph.predecessors_iter(label):
+                new_in |= reach_out.get(pred, 0)
+            reach_in[label] = new_in
+            new_out = block_gen[label] | (new_in & ~block_kill[label])
+            if new_out == reach_out[label]:
+                continue
+            reach_out[label] = new_out
+            for succ in self.graph.successors_iter(label):
+                succ_rank = rank.get(succ)
+                if succ_rank is not None and succ_rank not in pending:
+                    pending.add(succ_rank)
+                    heapq.heappush(worklist, succ_rank)
+
+        # Propagate in blocks
+        for label, gens in self._reach_gen.iteritems():
+            reach = reach_in[label]
+            self._reach_in[label] = reach_list = []
+            for gen, kill in zip(gens, kills[label]):
+                reach_list.append(reach)
+                reach = gen | (reach & ~kill)
 
     def dead_simp(self):
         """
@@ -273,8 +332,6 @@ class ira(ir):
         Source : Kennedy, K. (1979). A survey of data flow analysis techniques.
         IBM Thomas J. Watson Research Division, page 43
         """
-        # Update r/w variables for all irblocs
-        self.get_rw(self.ira_regs_ids())
         # Liveness step
         self.compute_reach()
         self.remove_dead_code()
@@ -18,6 +18,7 @@
 # with this program; if not, write to the Free Software Foundation, Inc.,
 # 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
 #
+import bisect
 from itertools import chain
 
 import miasm2.expression.expression as m2_expr
@@ -26,6 +27,7 @@ from miasm2.expression.simplifications import expr_simp
 from miasm2.core.asmbloc import asm_symbol_pool, expr_is_label, asm_label, \
     asm_bloc
 from miasm2.core.graph import DiGraph
+from miasm2.core.utils import BoundedDict
 
 
 class AssignBlock(dict):
@@ -206,27 +208,6 @@ class irbloc(object):
         """Line number of the IRDst setting statement in the current irs"""
         return self._dst_linenb
 
-    def get_rw(self, regs_ids):
-        """
-        Computes the variables read and written by each instructions
-        Initialize attributes needed for in/out and reach computation.
-        @regs_ids : ids of registers used in IR
-        """
-        keep_exprid = lambda elts: filter(lambda expr: isinstance(expr,
-                                                                  m2_expr.ExprId),
-                                          elts)
-        for idx, assignblk in enumerate(self.irs):
-            assignblk._cur_reach = {reg: set() for reg in regs_ids}
-            assignblk._prev_reach = {reg: set() for reg in regs_ids}
-            assignblk._cur_kill = {reg: set() for reg in regs_ids}
-            assignblk._prev_kill = {reg: set() for reg in regs_ids}
-            # LineNumber -> dict:
-            #               Register: set(definition(irb label, index))
-            assignblk.defout = {reg: set() for reg in regs_ids}
-            assignblk.defout.update({dst: set([(self.label, idx, dst)])
-                                     for dst in assignblk
-                                     if isinstance(dst, m2_expr.ExprId)})
-
     def __str__(self):
         out = []
         out.append('%s' % self.label)
@@ -294,30 +275,442 @@ class DiGraphIR(DiGraph):
         return super(DiGraphIR, self).dot()
 
 
+def expr_node(expr):
+    """Return a tuple (shape, children) of @expr, where children is the list
+    of its direct sub-expressions, and shape the remaining attributes"""
+    if isinstance(expr, (m2_expr.ExprInt, m2_expr.ExprId)):
+        return (expr.__class__, expr.size, expr), []
+    if isinstance(expr, m2_expr.ExprMem):
+        return (m2_expr.ExprMem, expr.size), [expr.arg]
+    if isinstance(expr, m2_expr.ExprOp):
+        return (m2_expr.ExprOp, expr.op, len(expr.args)), list(expr.args)
+    if isinstance(expr, m2_expr.ExprSlice):
+        return (m2_expr.ExprSlice, expr.start, expr.stop), [expr.arg]
+    if isinstance(expr, m2_expr.ExprCompose):
+        return ((m2_expr.ExprCompose,
+                 tuple((start, stop) for _, start, stop in expr.args)),
+                [arg for arg, _, _ in expr.args])
+    if isinstance(expr, m2_expr.ExprCond):
+        return (m2_expr.ExprCond,), [expr.cond, expr.src1, expr.src2]
+    if isinstance(expr, m2_expr.ExprAff):
+        return (m2_expr.ExprAff,), [expr.dst, expr.src]
+    raise TypeError("Unknown expression %r" % expr)
+
+
+def copy_assignblk(assignblk, replace=None, own_ids=None):
+    """Return a copy of the AssignBlock @assignblk
+    @replace: (optional) dictionary of Expr -> Expr to replace in the copy
+    @own_ids: (optional) dictionary of ExprId -> itself; destinations and
+    sources equal to one of them are replaced by this very instance"""
+    new_assignblk = AssignBlock()
+    if not replace and not own_ids:
+        dict.update(new_assignblk, assignblk)
+        return new_assignblk
+    for dst, src in assignblk.iteritems():
+        if replace:
+            dst, src = dst.replace_expr(replace), src.replace_expr(replace)
+        if own_ids:
+            dst, src = own_ids.get(dst, dst), own_ids.get(src, src)
+        dict.__setitem__(new_assignblk, dst, src)
+    return new_assignblk
+
+
+class LiftingTemplate(object):
+
+    """Lifting of an instruction, which can be rebound to another ir instance
+    and, if it is relocatable, to the same encoding at another offset.
+
+    Labels of the lifting come from the instruction arguments, from the
+    labels generated during the lifting, or from the ir symbol_pool. They are
+    rebound accordingly.
+
+    Once the same encoding has been lifted at two offsets, if both liftings
+    only differ by the offset shift on some integers and labels, the
+    template becomes relocatable: those integers and labels are shifted on
+    rebinding. Semantics are supposed to be affine in the offset; the
+    allowed shifts are multiples of `granularity`, the lowest bit set in the
+    verified shifts, so that an alignment of the offset cannot be missed.
+    """
+
+    def __init__(self, instr, assignblk, extra_irblocs, gen_labels, info):
+        """@instr: lifted instruction
+        @assignblk: AssignBlock of the instruction
+        @extra_irblocs: extra irblocs of the instruction
+        @gen_labels: labels generated during the lifting
+        @info: lifting information to restore on the instruction, see
+        ir.get_lifting_info
+        """
+        self.offset = instr.offset
+        self.assignblk = copy_assignblk(assignblk)
+        self.extra_irblocs = [(irb.label, map(copy_assignblk, irb.irs),
+                               irb.except_automod)
+                              for irb in extra_irblocs]
+        self.gen_labels = set(gen_labels)
+        self.info = info
+        # label -> index of the argument using it
+        self.arg_labels = {}
+        for i, arg in enumerate(instr.args):
+            if expr_is_label(arg):
+                self.arg_labels.setdefault(arg.name, i)
+        self.label_ids = set()
+        for expr in self.exprs():
+            self.label_ids.update(expr_id for expr_id in
+                                  m2_expr.get_expr_ids(expr)
+                                  if expr_is_label(expr_id))
+        self.labels = set(label_id.name for label_id in self.label_ids)
+        self.labels.update(label for label, _, _ in self.extra_irblocs)
+
+        self.relocatable = False
+        self.granularity = None
+        self.reloc_ints = set()
+        self.reloc_labels = set()
+
+    def exprs(self):
+        """Iterate on the expressions of the lifting"""
+        for assignblk in chain([self.assignblk],
+                               *(irs for _, irs, _ in self.extra_irblocs)):
+            for dst, src in assignblk.iteritems():
+                yield dst
+                yield src
+
+    def can_rebind(self, offset):
+        """Return True if the template can be rebound at @offset"""
+        shift = offset - self.offset
+        if shift == 0:
+            return True
+        return self.relocatable and shift % self.granularity == 0
+
+    def rebind(self, ir_arch, instr, gen_labels=None):
+        """Return the lifting (assignblk, extra irblocs) of @instr in
+        @ir_arch, using this template
+        @gen_labels: (optional) dictionary of template generated label ->
+        label to use, instead of generating new ones
+        """
+        shift = instr.offset - self.offset
+        label_map = {}
+        for label in self.labels:
+            if label in self.arg_labels:
+                new_label = instr.args[self.arg_labels[label]].name
+            elif label in self.gen_labels:
+                if gen_labels is None:
+                    new_label = ir_arch.gen_label()
+                else:
+                    new_label = gen_labels[label]
+            elif label.offset is not None:
+                offset = label.offset
+                if label in self.reloc_labels:
+                    offset += shift
+                new_label = ir_arch.symbol_pool.getby_offset_create(offset)
+            else:
+                new_label = ir_arch.symbol_pool.getby_name_create(label.name)
+            label_map[label] = new_label
+
+        replace = {}
+        for label_id in self.label_ids:
+            new_label = label_map[label_id.name]
+            if new_label is not label_id.name:
+                replace[label_id] = m2_expr.ExprId(new_label, label_id.size)
+        if shift:
+            for expr in self.reloc_ints:
+                replace[expr] = m2_expr.ExprInt_from(expr,
+                                                     int(expr.arg) + shift)
+
+        # The template ids (IRDst, pc, sp) may be the ones of another ir
+        # instance, and ir2C compares destinations to ir_arch.IRDst by
+        # identity: use the ones of @ir_arch
+        own_ids = dict((expr_id, expr_id) for expr_id in
+                       (getattr(ir_arch, "IRDst", None), ir_arch.pc,
+                        ir_arch.sp)
+                       if expr_id is not None)
+
+        assignblk = copy_assignblk(self.assignblk, replace, own_ids)
+        extra_irblocs = []
+        for label, irs, except_automod in self.extra_irblocs:
+            irb = irbloc(label_map[label],
+                         [copy_assignblk(irs_assignblk, replace, own_ids)
+                          for irs_assignblk in irs])
+            irb.except_automod = except_automod
+            extra_irblocs.append(irb)
+        ir_arch.set_lifting_info(instr, self.info)
+        return assignblk, extra_irblocs
+
+    def _match(self, other):
+        """Match the expressions of this template with the ones of the
+        template @other, of the same encoding at another offset.
+        Return a tuple (reloc_ints, reloc_labels, label pairs), or None if
+        they do not match"""
+        delta = other.offset - self.offset
+        reloc_ints, reloc_labels, label_pairs = set(), set(), {}
+
+        def match_label(label1, label2):
+            if label_pairs.setdefault(label1, label2) is not label2:
+                return False
+            if label1 in self.arg_labels:
+                return other.arg_labels.get(label2) == self.arg_labels[label1]
+            if label1 in self.gen_labels:
+                return label2 in other.gen_labels
+            if label2 in other.arg_labels or label2 in other.gen_labels:
+                return False
+            if label1.offset is None or label2.offset is None:
+                return (label1.offset == label2.offset and
+                        label1.name == label2.name)
+            if label2.offset - label1.offset == delta:
+                reloc_labels.add(label1)
+                return True
+            return label2.offset == label1.offset
+
+        def match_expr(expr1, expr2):
+            if (expr1.__class__ is not expr2.__class__ or
+                    expr1.size != expr2.size):
+                return False
+            if isinstance(expr1, m2_expr.ExprInt):
+                mask = m2_expr.size2mask(expr1.size)
+                diff = (int(expr2.arg) - int(expr1.arg)) & mask
+                if diff == 0:
+                    return True
+                if diff == delta & mask:
+                    reloc_ints.add(expr1)
+                    return True
+                return False
+            if isinstance(expr1, m2_expr.ExprId):
+                if expr_is_label(expr1):
+                    return (expr_is_label(expr2) and
+                            match_label(expr1.name, expr2.name))
+                return expr1 == expr2
+            shape1, children1 = expr_node(expr1)
+            shape2, children2 = expr_node(expr2)
+            if shape1 != shape2:
+                return False
+            return all(match_expr(child1, child2)
+                       for child1, child2 in zip(children1, children2))
+
+        def match_assignblk(assignblk1, assignblk2):
+            if len(assignblk1) != len(assignblk2):
+                return False
+            # Destinations depending on the offset are paired only if there
+            # is no ambiguity
+            others1 = [dst for dst in assignblk1 if dst not in assignblk2]
+            others2 = [dst for dst in assignblk2 if dst not in assignblk1]
+            if len(others1) > 1:
+                return False
+            pairs = [(dst, dst) for dst in assignblk1 if dst in assignblk2]
+            pairs += zip(others1, others2)
+            return all(match_expr(dst1, dst2) and
+                       match_expr(assignblk1[dst1], assignblk2[dst2])
+                       for dst1, dst2 in pairs)
+
+        if len(self.extra_irblocs) != len(other.extra_irblocs):
+            return None
+        if not match_assignblk(self.assignblk, other.assignblk):
+            return None
+        for (label1, irs1, _), (label2, irs2, _) in zip(self.extra_irblocs,
+                                                        other.extra_irblocs):
+            if len(irs1) != len(irs2) or not match_label(label1, label2):
+                return None
+            if not all(match_assignblk(assignblk1, assignblk2)
+                       for assignblk1, assignblk2 in zip(irs1, irs2)):
+                return None
+        return reloc_ints, reloc_labels, label_pairs
+
+    def relocate(self, ir_arch, instr, other):
+        """Try to make this template relocatable, using the template @other
+        of the lifting of @instr (same encoding, other offset) in @ir_arch.
+        Return True on success"""
+        if self.info != other.info:
+            return False
+        match = self._match(other)
+        if match is None:
+            return False
+        reloc_ints, reloc_labels, label_pairs = match
+        delta = other.offset - self.offset
+        granularity = delta & -delta
+        if self.granularity is not None:
+            granularity = min(granularity, self.granularity)
+        # Check that rebinding this template reproduces @other
+        state = (self.relocatable, self.granularity, self.reloc_ints,
+                 self.reloc_labels)
+        self.relocatable, self.granularity = True, granularity
+        self.reloc_ints = self.reloc_ints.union(reloc_ints)
+        self.reloc_labels = self.reloc_labels.union(reloc_labels)
+        gen_labels = dict((label1, label2)
+                          for label1, label2 in label_pairs.iteritems()
+                          if label1 in self.gen_labels)
+        assignblk, extra_irblocs = self.rebind(ir_arch, instr, gen_labels)
+        if (assignblk == other.assignblk and
+                [(irb.label, irb.irs, irb.except_automod)
+                 for irb in extra_irblocs] == other.extra_irblocs):
+            return True
+        (self.relocatable, self.granularity, self.reloc_ints,
+         self.reloc_labels) = state
+        return False
+
+
+class IRBlocks(dict):
+
+    """Dictionnary label -> irbloc of an ir instance
+    Keep track of the labels whose block has been added, replaced or removed,
+    so that the structures built on the blocks can be updated incrementally
+    """
+
+    def __init__(self, *args, **kwargs):
+        super(IRBlocks, self).__init__(*args, **kwargs)
+        # Labels modified since the last `pop_modified`
+        self._modified = set(self)
+
+    def pop_modified(self):
+        """Return the set of labels modified since the last call, and forget
+        them"""
+        modified, self._modified = self._modified, set()
+        return modified
+
+    def __setitem__(self, label, irb):
+        super(IRBlocks, self).__setitem__(label, irb)
+        self._modified.add(label)
+
+    def __delitem__(self, label):
+        super(IRBlocks, self).__delitem__(label)
+        self._modified.add(label)
+
+    def pop(self, label, *args):
+        if label in self:
+            self._modified.add(label)
+        return super(IRBlocks, self).pop(label, *args)
+
+    def popitem(self):
+        label, irb = super(IRBlocks, self).popitem()
+        self._modified.add(label)
+        return label, irb
+
+    def setdefault(self, label, irb=None):
+        if label not in self:
+            self[label] = irb
+        return self[label]
+
+    def update(self, *args, **kwargs):
+        for label, irb in dict(*args, **kwargs).iteritems():
+            self[label] = irb
+
+    def clear(self):
+        self._modified.update(self)
+        super(IRBlocks, self).clear()
+
+
 class ir(object):
 
+    # Liftings templates, see instr2ir
+    lifting_cache = BoundedDict(10000)
+    # Labels generated by the current lifting, if recorded
+    _lifting_labels = None
+
     def __init__(self, arch, attrib, symbol_pool=None):
         if symbol_pool is None:
             symbol_pool = asm_symbol_pool()
         self.symbol_pool = symbol_pool
-        self.blocs = {}
         self.pc = arch.getpc(attrib)
         self.sp = arch.getsp(attrib)
         self.arch = arch
         self.attrib = attrib
-        # Lazy structure
+        # Lazy structure, updated on block modifications
         self._graph = None
+        self.blocs = {}
+
+    def _get_blocs(self):
+        return self._blocs
+
+    def _set_blocs(self, blocs):
+        """Replace the blocks by the dictionnary label -> irbloc @blocs
+        An already computed graph is kept as is, as it may have been built by
+        hand"""
+        self._blocs = IRBlocks(blocs)
+        self._blocs.pop_modified()
+        if self._graph is not None:
+            self._graph._blocks = self._blocs
+        # label -> (irbloc, its IRDst, its dst_trackback)
+        self._dst_cache = {}
+        # label -> (irbloc, IRDst) used to build its edges in the graph
+        self._graph_dsts = {}
+        # Lazy offset interval index: sorted start offsets of the lines,
+        # start offset -> {label: end offset}, label -> start offsets of its
+        # lines
+        self._offsets = None
+        self._offset2ends = {}
+        self._label2offsets = {}
+        # Length of the longest indexed line
+        self._max_line_len = 0
+
+    blocs = property(_get_blocs, _set_blocs)
 
     def get_ir(self, instr):
         raise NotImplementedError("Abstract Method")
 
-    def instr2ir(self, l):
+    def _instr2ir(self, l):
         ir_bloc_cur, extra_assignblk = self.get_ir(l)
         assignblk = AssignBlock(ir_bloc_cur)
         for irb in extra_assignblk:
             irb.irs = map(AssignBlock, irb.irs)
         return assignblk, extra_assignblk
 
+    def instr2ir(self, l):
+        """Return the lifting (assignblk, extra irblocs) of the instruction @l
+
+        Liftings are cached in `lifting_cache`, by instruction encoding (see
+        lifting_cache_key). A cached lifting is reused for the same encoding
+        at the same offset, or at any offset once it is known to be
+        relocatable (see LiftingTemplate).
+        """
+        key = self.lifting_cache_key(l)
+        if key is None:
+            return self._instr2ir(l)
+        template = self.lifting_cache.get(key)
+        if template is not None and template.can_rebind(l.offset):
+            return template.rebind(self, l)
+        offset_key = key + (l.offset,)
+        offset_template = self.lifting_cache.get(offset_key)
+        if offset_template is not None:
+            return offset_template.rebind(self, l)
+
+        lifting_labels, self._lifting_labels = self._lifting_labels, []
+        try:
+            assignblk, extra_irblocs = self._instr2ir(l)
+            gen_labels = self._lifting_labels
+        finally:
+            self._lifting_labels = lifting_labels
+        new_template = LiftingTemplate(l, assignblk, extra_irblocs,
+                                       gen_labels, self.get_lifting_info(l))
+        if template is None:
+            self.lifting_cache[key] = new_template
+        elif not template.relocate(self, l, new_template):
+            self.lifting_cache[offset_key] = new_template
+        return assignblk, extra_irblocs
+
+    def lifting_cache_key(self, instr):
+        """Return the key of the lifting of @instr in the lifting cache, or
+        None if it must not be cached. The key holds everything the lifting
+        depends on, except the instruction offset"""
+        raw = getattr(instr, "b", None)
+        if raw is None or instr.offset is None:
+            return None
+        args = []
+        for arg in instr.args:
+            if expr_is_label(arg):
+                # Labels of the arguments are relative to the instruction
+                label = arg.name
+                if label.offset is None:
+                    return None
+                arg = (label.offset - instr.offset, arg.size)
+            args.append(arg)
+        return (self.__class__, self.attrib, instr.mode, raw, tuple(args))
+
+    def get_lifting_info(self, instr):
+        """Return the information set on @instr by its lifting, restored by
+        set_lifting_info when a cached lifting is used"""
+        return None
+
+    def set_lifting_info(self, instr, info):
+        """Restore on @instr the information @info returned by
+        get_lifting_info"""
+        pass
+
     def get_label(self, ad):
         """Transforms an ExprId/ExprInt/label/int into a label
         @ad: an ExprId/ExprInt/label/int"""
@@ -346,13 +739,88 @@ class ir(object):
         self.add_bloc(b, gen_pc_updt)
 
     def getby_offset(self, offset):
+        """Return the set of irblocs with a line covering @offset"""
+        if self._offsets is None:
+            self._update_blocs()
+            self._offsets = []
+            for label in self.blocs:
+                self._index_offsets(label)
+        else:
+            self._update_blocs()
         out = set()
-        for irb in self.blocs.values():
-            for l in irb.lines:
-                if l.offset <= offset < l.offset + l.l:
-                    out.add(irb)
+        index = bisect.bisect_right(self._offsets, offset)
+        while index > 0:
+            index -= 1
+            start = self._offsets[index]
+            if start + self._max_line_len <= offset:
+                break
+            for label, end in self._offset2ends[start].iteritems():
+                if offset < end:
+                    out.add(self.blocs[label])
         return out
 
+    def _index_offsets(self, label):
+        """Update the offset interval index with the block @label"""
+        for start in self._label2offsets.pop(label, ()):
+            ends = self._offset2ends[start]
+            del ends[label]
+            if not ends:
+                del self._offset2ends[start]
+                del self._offsets[bisect.bisect_left(self._offsets, start)]
+
+        irb = self.blocs.get(label)
+        if irb is None:
+            return
+        starts = set()
+        for line in irb.lines:
+            start, end = line.offset, line.offset + line.l
+            if start not in self._offset2ends:
+                self._offset2ends[start] = {}
+                bisect.insort(self._offsets, start)
+            ends = self._offset2ends[start]
+            ends[label] = max(end, ends.get(label, end))
+            self._max_line_len = max(self._max_line_len, line.l)
+            starts.add(start)
+        self._label2offsets[label] = starts
+
+    def _update_graph(self, label):
+        """Update the out edges of @label in the graph"""
+        graph = self._graph
+        old_succs = set(graph.successors_iter(label))
+        for succ in graph.successors(label):
+            graph.del_edge(label, succ)
+
+        irb = self.blocs.get(label)
+        if irb is None:
+            self._graph_dsts.pop(label, None)
+        else:
+            self._graph_dsts[label] = (irb, irb.dst)
+            graph.add_node(label)
+            for dst in self.dst_trackback(irb):
+                if isinstance(dst, m2_expr.ExprInt):
+                    dst = m2_expr.ExprId(
+                        self.symbol_pool.getby_offset_create(int(dst.arg)))
+                if expr_is_label(dst):
+                    graph.add_edge(label, dst.name)
+
+        # Only blocks and destinations are nodes of the graph
+        for node in old_succs.union([label]):
+            if (node not in self.blocs and
+                    not graph.predecessors(node) and
+                    node in graph.nodes()):
+                graph.del_node(node)
+
+    def _update_blocs(self):
+        """Update the structures built on the blocks with the blocks added,
+        replaced or removed since the last call"""
+        modified = self.blocs.pop_modified()
+        for label in modified:
+            self._dst_cache.pop(label, None)
+            if self._offsets is not None:
+                self._index_offsets(label)
+            if self._graph is not None:
+                self._update_graph(label)
+
     def gen_pc_update(self, c, l):
         c.irs.append(AssignBlock([m2_expr.ExprAff(self.pc,
                                                   m2_expr.ExprInt_from(self.pc,
@@ -417,9 +885,6 @@ class ir(object):
 
             self.blocs[irb.label] = irb
 
-        # Forget graph if any
-        self._graph = None
-
     def get_instr_label(self, instr):
         """Returns the label associated to an instruction
         @instr: current instruction"""
@@ -429,6 +894,8 @@ class ir(object):
     def gen_label(self):
         # TODO: fix hardcoded offset
         l = self.symbol_pool.gen_label()
+        if self._lifting_labels is not None:
+            self._lifting_labels.append(l)
         return l
 
     def get_next_label(self, instr):
@@ -448,16 +915,6 @@ class ir(object):
                 del assignblk[dst]
                 assignblk[dst.replace_expr(rep)] = src.replace_expr(rep)
 
-    def get_rw(self, regs_ids=None):
-        """
-        Calls get_rw(irb) for each bloc
-        @regs_ids : ids of registers used in IR
-        """
-        if regs_ids is None:
-            regs_ids = []
-        for b in self.blocs.values():
-            b.get_rw(regs_ids)
-
     def _extract_dst(self, todo, done):
         """
         Naive extraction of @todo destinations
@@ -482,8 +939,20 @@ class ir(object):
     def dst_trackback(self, irb):
         """
         Naive backtracking of IRDst
+        The result is cached for the blocks of the current instance, until
+        they are replaced or their IRDst is modified
         @irb: irbloc instance
         """
+        cached = self._dst_cache.get(irb.label)
+        if cached is not None and cached[0] is irb and cached[1] == irb.dst:
+            return set(cached[2])
+        done = self._dst_trackback(irb)
+        if self.blocs.get(irb.label) is irb:
+            self._dst_cache[irb.label] = (irb, irb.dst, frozenset(done))
+        return done
+
+    def _dst_trackback(self, irb):
+        """Compute dst_trackback(@irb)"""
         todo = set([irb.dst])
         done = set()
 
@@ -507,21 +976,23 @@ class ir(object):
         """
         Gen irbloc digraph
         """
+        self._update_blocs()
         self._graph = DiGraphIR(self.blocs)
-        for lbl, b in self.blocs.iteritems():
-            self._graph.add_node(lbl)
-            dst = self.dst_trackback(b)
-            for d in dst:
-                if isinstance(d, m2_expr.ExprInt):
-                    d = m2_expr.ExprId(
-                        self.symbol_pool.getby_offset_create(int(d.arg)))
-                if expr_is_label(d):
-                    self._graph.add_edge(lbl, d.name)
+        self._graph_dsts = {}
+        for lbl in self.blocs:
+            self._update_graph(lbl)
 
     @property
     def graph(self):
         """Get a DiGraph representation of current IR instance.
-        Lazy property, building the graph on-demand"""
+        Lazy property, building the graph on-demand. It is then updated as
+        blocks are added, replaced or removed, or as their IRDst is modified"""
         if self._graph is None:
             self._gen_graph()
+        else:
+            self._update_blocs()
+            # IRDst modified in place, in blocks already in self.blocs
+            for label, (irb, dst) in self._graph_dsts.items():
+                if irb.dst != dst:
+                    self._update_graph(label)
         return self._graph
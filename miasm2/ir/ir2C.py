@@ -388,7 +388,8 @@ def ir2C(ir_arch, irbloc, lbl_done,
 
 
 def irblocs2C(ir_arch, resolvers, label, irblocs,
-    gen_exception_code=False, log_mn=False, log_regs=False):
+    gen_exception_code=False, log_mn=False, log_regs=False, log_trace=False,
+    coverage_id=None):
     out = []
 
     lbls = [b.label for b in irblocs]
@@ -408,6 +409,10 @@ def irblocs2C(ir_arch, resolvers, label, irblocs,
 
     out.append("void* local_labels[] = {%s};"%(', '.join(["&&%s"%l.name for l in lbls_local])))
     out.append("vm_cpu_t* mycpu = (vm_cpu_t*)jitcpu->cpu;")
+    if log_trace:
+        out.append("TRACE_BLOCK(0x%X);" % (label.offset & mask_int))
+    if coverage_id is not None:
+        out.append("COVERAGE_HIT(%d);" % coverage_id)
 
 
     out.append("goto %s;" % label.name)
@@ -54,6 +54,28 @@ PyObject * JitCpu_set_jitter(JitCpu *self, PyObject *value, void *closure)
 	return 0;
 }
 
+/* Return a copy of the @size bytes of the cpu state */
+PyObject * JitCpu_snapshot(JitCpu *self, size_t size)
+{
+	return PyString_FromStringAndSize((char*)self->cpu, size);
+}
+
+/* Restore the cpu state from a JitCpu_snapshot result */
+PyObject * JitCpu_restore(JitCpu *self, PyObject *args, size_t size)
+{
+	char* snapshot;
+	int snapshot_len;
+
+	if (!PyArg_ParseTuple(args, "s#", &snapshot, &snapshot_len))
+		return NULL;
+	if ((size_t)snapshot_len != size)
+		RAISE(PyExc_ValueError, "invalid cpu snapshot");
+
+	memcpy(self->cpu, snapshot, size);
+	Py_INCREF(Py_None);
+	return Py_None;
+}
+
 uint8_t __attribute__((weak)) MEM_LOOKUP_08(JitCpu* jitcpu, uint64_t addr)
 {
 	return vm_MEM_LOOKUP_08(&((VmMngr*)jitcpu->pyvm)->vm_mngr, addr);
@@ -111,6 +111,8 @@ PyObject * JitCpu_get_vmmngr(JitCpu *self, void *closure);
 PyObject * JitCpu_set_vmmngr(JitCpu *self, PyObject *value, void *closure);
 PyObject * JitCpu_get_jitter(JitCpu *self, void *closure);
 PyObject * JitCpu_set_jitter(JitCpu *self, PyObject *value, void *closure);
+PyObject * JitCpu_snapshot(JitCpu *self, size_t size);
+PyObject * JitCpu_restore(JitCpu *self, PyObject *args, size_t size);
 void Resolve_dst(block_id* BlockDst, uint64_t addr, uint64_t is_local);
 
 #define Resolve_dst(b, arg_addr, arg_is_local) do {(b)->address = (arg_addr); (b)->is_local = (arg_is_local);} while(0)
@@ -133,6 +135,13 @@ PyObject* vm_get_mem(JitCpu *self, PyObject* args);
 #define VM_exception_flag (((VmMngr*)jitcpu->pyvm)->vm_mngr.exception_flags)
 #define CPU_exception_flag (((vm_cpu_t*)jitcpu->cpu)->exception_flags)
 
+#define COVERAGE_HIT(id) (((VmMngr*)jitcpu->pyvm)->vm_mngr.coverage[(id)]++)
+
+#define TRACE_BLOCK(addr) do {						\
+		if (((VmMngr*)jitcpu->pyvm)->vm_mngr.trace)		\
+			vm_trace_block(&((VmMngr*)jitcpu->pyvm)->vm_mngr, (addr)); \
+	} while(0)
+
 #define JIT_RET_EXCEPTION 1
 #define JIT_RET_NO_EXCEPTION 0
 
@@ -129,6 +129,30 @@ typedef struct {
 typedef int (*jitted_func)(block_id*, PyObject*);
 
 
+/*
+ * Return @retaddr, or (@retaddr, @blocks) if a blocks budget is used
+ */
+static PyObject* exec_bloc_ret(PyObject* retaddr, int use_budget,
+			       uint64_t blocks)
+{
+	PyObject* ret;
+
+	if (!use_budget)
+		return retaddr;
+	ret = Py_BuildValue("(OK)", retaddr, blocks);
+	Py_DECREF(retaddr);
+	return ret;
+}
+
+
+/*
+ * Run jitted blocks from retaddr, until an exception, a breakpoint or a non
+ * jitted block. If the optional max_blocks is not None, stop after max_blocks
+ * blocks and return (next address, number of blocks run).
+ * If the optional stubs dictionary is given, a block exiting to one of its
+ * addresses calls the associated handler, which returns the next address to
+ * run, or a tuple (next address,) to stop.
+ */
 PyObject* tcc_exec_bloc(PyObject* self, PyObject* args)
 {
 	jitted_func func;
@@ -137,16 +161,34 @@ PyObject* tcc_exec_bloc(PyObject* self, PyObject* args)
 	PyObject* lbl2ptr;
 	PyObject* breakpoints;
 	PyObject* retaddr = NULL;
+	PyObject* py_max_blocks = Py_None;
+	PyObject* stubs = Py_None;
+	PyObject* stub;
+	PyObject* ret;
 	int status;
 	block_id BlockDst;
+	uint64_t max_blocks = 0;
+	uint64_t blocks = 0;
+	int use_budget;
 
-	if (!PyArg_ParseTuple(args, "OOOO", &retaddr, &jitcpu, &lbl2ptr, &breakpoints))
+	if (!PyArg_ParseTuple(args, "OOOO|OO", &retaddr, &jitcpu, &lbl2ptr,
+			      &breakpoints, &py_max_blocks, &stubs))
 		return NULL;
+	use_budget = py_max_blocks != Py_None;
+	if (use_budget) {
+		max_blocks = PyInt_AsUnsignedLongLongMask(py_max_blocks);
+		if (PyErr_Occurred())
+			return NULL;
+	}
 
 	/* The loop will decref retaddr always once */
 	Py_INCREF(retaddr);
 
 	for (;;) {
+		// Check blocks budget
+		if (use_budget && blocks >= max_blocks)
+			return exec_bloc_ret(retaddr, use_budget, blocks);
+
 		// Init
 		BlockDst.is_local = 0;
 		BlockDst.address = 0;
@@ -161,21 +203,42 @@ PyObject* tcc_exec_bloc(PyObject* self, PyObject* args)
 				exit(1);
 			}
 			// retaddr is not jitted yet
-			return retaddr;
+			return exec_bloc_ret(retaddr, use_budget, blocks);
 		}
 
 		// Execute it
 		status = func(&BlockDst, jitcpu);
+		blocks++;
 		Py_DECREF(retaddr);
 		retaddr = PyLong_FromUnsignedLongLong(BlockDst.address);
 
 		// Check exception
 		if (status)
-			return retaddr;
+			return exec_bloc_ret(retaddr, use_budget, blocks);
+
+		// Call library stubs
+		while (stubs != Py_None &&
+		       (stub = PyDict_GetItem(stubs, retaddr)) != NULL) {
+			Py_INCREF(stub);
+			ret = PyObject_CallObject(stub, NULL);
+			Py_DECREF(stub);
+			Py_DECREF(retaddr);
+			if (ret == NULL)
+				return NULL;
+			if (PyTuple_Check(ret)) {
+				retaddr = PyTuple_GetItem(ret, 0);
+				Py_XINCREF(retaddr);
+				Py_DECREF(ret);
+				if (retaddr == NULL)
+					return NULL;
+				return exec_bloc_ret(retaddr, use_budget, blocks);
+			}
+			retaddr = ret;
+		}
 
 		// Check breakpoint
 		if (PyDict_Contains(breakpoints, retaddr))
-			return retaddr;
+			return exec_bloc_ret(retaddr, use_budget, blocks);
 	}
 }
 
@@ -302,6 +302,16 @@ IMOD(32)
 IMOD(64)
 
 
+PyObject* cpu_snapshot(JitCpu* self, PyObject* args)
+{
+	return JitCpu_snapshot(self, sizeof(vm_cpu_t));
+}
+
+PyObject* cpu_restore(JitCpu* self, PyObject* args)
+{
+	return JitCpu_restore(self, args, sizeof(vm_cpu_t));
+}
+
 static PyMemberDef JitCpu_members[] = {
     {NULL}  /* Sentinel */
 };
@@ -319,6 +329,10 @@ static PyMethodDef JitCpu_methods[] = {
 	 "X"},
 	{"set_exception", (PyCFunction)cpu_set_exception, METH_VARARGS,
 	 "X"},
+	{"snapshot", (PyCFunction)cpu_snapshot, METH_NOARGS,
+	 "X"},
+	{"restore", (PyCFunction)cpu_restore, METH_VARARGS,
+	 "X"},
 	{"set_mem", (PyCFunction)vm_set_mem, METH_VARARGS,
 	 "X"},
 	{"get_mem", (PyCFunction)vm_get_mem, METH_VARARGS,
@@ -364,6 +364,82 @@ PyObject* vm_set_mem(JitCpu *self, PyObject* args)
        return Py_None;
 }
 
+PyObject* cpu_snapshot(JitCpu* self, PyObject* args)
+{
+	return JitCpu_snapshot(self, sizeof(vm_cpu_t));
+}
+
+PyObject* cpu_restore(JitCpu* self, PyObject* args)
+{
+	return JitCpu_restore(self, args, sizeof(vm_cpu_t));
+}
+
+/* Return @value as an int, as struct.unpack does, or a long if needed */
+static PyObject* stack_word(uint64_t value)
+{
+	if (value <= LONG_MAX)
+		return PyInt_FromLong((long)value);
+	return PyLong_FromUnsignedLongLong(value);
+}
+
+/*
+ * stack_args(count, size, pop): pop the return address, a @size bytes word,
+ * from the stack, then read @count @size bytes arguments following it,
+ * popping them if @pop is set. Return (return address, [arguments])
+ */
+PyObject* cpu_stack_args(JitCpu* self, PyObject* args)
+{
+	vm_cpu_t* vmcpu = (vm_cpu_t*)self->cpu;
+	uint64_t count, size, mask, sp, value, i, j;
+	int pop;
+	char* buffer;
+	unsigned char* ptr;
+	PyObject *ret_ad, *arg_list, *result, *item;
+
+	if (!PyArg_ParseTuple(args, "KKi", &count, &size, &pop))
+		return NULL;
+	if (size != 2 && size != 4 && size != 8)
+		RAISE(PyExc_ValueError, "bad stack word size");
+
+	mask = size == 8 ? (uint64_t)-1 : (1ULL << (size * 8)) - 1;
+	sp = vmcpu->RSP & mask;
+	if (vm_read_mem(&(((VmMngr*)self->pyvm)->vm_mngr), sp, &buffer,
+			(count + 1) * size) < 0)
+		return NULL;
+
+	ret_ad = NULL;
+	result = NULL;
+	arg_list = PyList_New(count);
+	if (arg_list == NULL)
+		goto end;
+	ptr = (unsigned char*)buffer;
+	for (i = 0; i < count + 1; i++) {
+		value = 0;
+		for (j = 0; j < size; j++)
+			value |= ((uint64_t)ptr[j]) << (8 * j);
+		ptr += size;
+		item = stack_word(value);
+		if (item == NULL)
+			goto end;
+		if (i == 0)
+			ret_ad = item;
+		else
+			PyList_SET_ITEM(arg_list, i - 1, item);
+	}
+
+	result = PyTuple_Pack(2, ret_ad, arg_list);
+	if (result != NULL) {
+		sp = (sp + (pop ? count + 1 : 1) * size) & mask;
+		vmcpu->RSP = (vmcpu->RSP & ~mask) | sp;
+	}
+
+end:
+	free(buffer);
+	Py_XDECREF(ret_ad);
+	Py_XDECREF(arg_list);
+	return result;
+}
+
 static PyMemberDef JitCpu_members[] = {
     {NULL}  /* Sentinel */
 };
@@ -385,6 +461,12 @@ static PyMethodDef JitCpu_methods[] = {
 	 "X"},
 	{"set_exception", (PyCFunction)cpu_set_exception, METH_VARARGS,
 	 "X"},
+	{"snapshot", (PyCFunction)cpu_snapshot, METH_NOARGS,
+	 "X"},
+	{"restore", (PyCFunction)cpu_restore, METH_VARARGS,
+	 "X"},
+	{"stack_args", (PyCFunction)cpu_stack_args, METH_VARARGS,
+	 "X"},
 	{"set_mem", (PyCFunction)vm_set_mem, METH_VARARGS,
 	 "X"},
 	{"get_mem", (PyCFunction)vm_get_mem, METH_VARARGS,
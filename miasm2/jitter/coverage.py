@@ -0,0 +1,119 @@
+"""Block hit counts of a jitter run (see `jitter.coverage_start`), and their
+export to drcov (as read by Lighthouse or bncov) and lcov-like formats
+
+Modules used by the exporters are (name, start address, stop address) tuples;
+blocks outside every module are not exported.
+"""
+
+import struct
+from bisect import bisect_right
+
+
+def vm_modules(vm):
+    """Return the modules standing for the memory pages of @vm
+    @vm: VmMngr instance
+    """
+    modules = []
+    for addr, page in sorted(vm.get_all_memory().iteritems()):
+        name = page.get("name") or "mem_%x" % addr
+        modules.append((name, addr, addr + page["size"]))
+    return modules
+
+
+class Coverage(object):
+    """Hit counts of the blocks run by a jitter
+
+    Usage:
+    >>> jitter.coverage_start()
+    >>> jitter.continue_run()
+    >>> coverage = jitter.get_coverage()
+    >>> with open("run.drcov", "wb") as fdesc:
+    ...     coverage.write_drcov(fdesc)
+    """
+
+    def __init__(self, blocks, modules=None):
+        """
+        @blocks: dictionary block address -> (block size, hit count)
+        @modules: (optional) default modules of the exporters
+        """
+        self.blocks = blocks
+        self.modules = modules
+
+    @property
+    def counts(self):
+        "Dictionary block address -> hit count"
+        return dict((addr, count)
+                    for addr, (_, count) in self.blocks.iteritems())
+
+    def __len__(self):
+        return len(self.blocks)
+
+    def modules_blocks(self, modules=None):
+        """Return a list of (module index, [(address, size, count), ...]),
+        sorted by address, with a block list for each module of @modules
+        @modules: list of (name, start, stop), default to self.modules
+        """
+        if modules is None:
+            modules = self.modules
+        if modules is None:
+            raise ValueError("Modules are required")
+        order = sorted(xrange(len(modules)), key=lambda i: modules[i][1])
+        starts = [modules[i][1] for i in order]
+        by_module = dict((i, []) for i in xrange(len(modules)))
+        for addr, (size, count) in sorted(self.blocks.iteritems()):
+            pos = bisect_right(starts, addr) - 1
+            if pos < 0:
+                continue
+            index = order[pos]
+            if addr >= modules[index][2]:
+                continue
+            by_module[index].append((addr, size, count))
+        return sorted(by_module.iteritems())
+
+    def write_drcov(self, fdesc, modules=None):
+        """Write the coverage in the drcov format (version 2) to @fdesc. Hit
+        counts are not part of this format, and blocks never run are skipped
+        @fdesc: file object opened in binary mode
+        @modules: list of (name, start, stop), default to self.modules
+        """
+        if modules is None:
+            modules = self.modules
+        entries = []
+        for index, blocks in self.modules_blocks(modules):
+            start = modules[index][1]
+            for addr, size, count in blocks:
+                if not count:
+                    continue
+                entries.append(struct.pack("<IHH", addr - start,
+                                           min(size, 0xffff), index))
+        fdesc.write("DRCOV VERSION: 2\n")
+        fdesc.write("DRCOV FLAVOR: drcov\n")
+        fdesc.write("Module Table: version 2, count %d\n" % len(modules))
+        fdesc.write("Columns: id, base, end, entry, checksum, timestamp, "
+                    "path\n")
+        for index, (name, start, stop) in enumerate(modules):
+            fdesc.write("%3d, 0x%016x, 0x%016x, 0x%016x, 0x%08x, 0x%08x, "
+                        "%s\n" % (index, start, stop, 0, 0, 0, name))
+        fdesc.write("BB Table: %d bbs\n" % len(entries))
+        fdesc.write("".join(entries))
+
+    def write_lcov(self, fdesc, modules=None, test_name="miasm"):
+        """Write the coverage in a lcov-like format to @fdesc: a record for
+        each module of @modules, with a 'DA:<address>,<hit count>' line for
+        each block
+        @fdesc: file object
+        @modules: list of (name, start, stop), default to self.modules
+        @test_name: value of the TN lines
+        """
+        if modules is None:
+            modules = self.modules
+        for index, blocks in self.modules_blocks(modules):
+            if not blocks:
+                continue
+            fdesc.write("TN:%s\n" % test_name)
+            fdesc.write("SF:%s\n" % modules[index][0])
+            for addr, _, count in blocks:
+                fdesc.write("DA:%d,%d\n" % (addr, count))
+            fdesc.write("LH:%d\n" % sum(1 for block in blocks if block[2]))
+            fdesc.write("LF:%d\n" % len(blocks))
+            fdesc.write("end_of_record\n")
@@ -13,6 +13,10 @@ EXCEPT_BREAKPOINT_INTERN = (1 << 10)
 EXCEPT_ACCESS_VIOL = ((1 << 14) | EXCEPT_DO_NOT_UPDATE_PC)
 EXCEPT_DIV_BY_ZERO = ((1 << 16) | EXCEPT_DO_NOT_UPDATE_PC)
 EXCEPT_PRIV_INSN = ((1 << 17) | EXCEPT_DO_NOT_UPDATE_PC)
+
+# VM Mngr breaks
+BREAK_SIGALARM = 1 << 5
+BREAK_BLOCK_LIMIT = 1 << 6
 # VM Mngr constants
 
 PAGE_READ = 1
@@ -22,3 +26,7 @@ PAGE_EXEC = 4
 BREAKPOINT_READ = 1
 BREAKPOINT_WRITE = 2
 
+
+# Execution trace
+TRACE_REGS = 1
+TRACE_MEM = 2
@@ -12,6 +12,8 @@ class EmulatedSymbExec(symbexec):
         """
         super(EmulatedSymbExec, self).__init__(*args, **kwargs)
         self.cpu = cpu
+        # VmMngr instance recording memory accesses in its trace, if any
+        self.trace_vm = None
         self.func_read = self._func_read
         self.func_write = self._func_write
 
@@ -27,10 +29,11 @@ class EmulatedSymbExec(symbexec):
 
         addr = expr_mem.arg.arg.arg
         size = expr_mem.size / 8
-        value = self.cpu.get_mem(addr, size)
+        value = int(self.cpu.get_mem(addr, size)[::-1].encode("hex"), 16)
+        if self.trace_vm is not None:
+            self.trace_vm.trace_mem(False, size, addr, value)
 
-        return m2_expr.ExprInt(int(value[::-1].encode("hex"), 16),
-                               expr_mem.size)
+        return m2_expr.ExprInt(value, expr_mem.size)
 
     def _func_write(self, symb_exec, dest, data):
         """Memory read wrapper for symbolic execution
@@ -53,6 +56,8 @@ class EmulatedSymbExec(symbexec):
 
         # Write in VmMngr context
         self.cpu.set_mem(addr, content)
+        if self.trace_vm is not None:
+            self.trace_vm.trace_mem(True, size, addr, to_write)
 
     # Interaction symbexec <-> jitter
     def update_cpu_from_engine(self):
@@ -27,6 +27,8 @@ class JitCore(object):
 
     jitted_block_delete_cb = None
     jitted_block_max_size = 10000
+    # True if the backend can stop after `max_blocks` blocks
+    supports_max_blocks = True
 
     def __init__(self, ir_arch, bs=None):
         """Initialise a JitCore instance.
@@ -42,6 +44,13 @@ class JitCore(object):
         self.lbl2bloc = {}
         self.log_mn = False
         self.log_regs = False
+        # Call the VmMngr execution trace on each block
+        self.log_trace = False
+        # Count the runs of each block in the VmMngr coverage counters
+        self.log_coverage = False
+        # Block address -> coverage counter identifier / block size
+        self.coverage_ids = {}
+        self.coverage_sizes = {}
         self.log_newbloc = False
         self.segm_to_do = set()
         self.job_done = set()
@@ -52,6 +61,14 @@ class JitCore(object):
         self.disasm_cb = None
         self.split_dis = set()
         self.addr_mod = interval()
+        # Maximum number of blocks to run (None for no limit), and number of
+        # blocks run while limited
+        self.max_blocks = None
+        self.blocks_count = 0
+        # Library stubs: address -> handler, called without argument by the
+        # JiT loop when a block exits to this address. The handler returns
+        # the next address, or a tuple (next address,) to stop the loop
+        self.lib_stubs = {}
 
         self.options = {"jit_maxline": 50  # Maximum number of line jitted
                         }
@@ -96,6 +113,35 @@ class JitCore(object):
             cur_bloc.ad_min = cur_bloc.lines[0].offset
             cur_bloc.ad_max = cur_bloc.lines[-1].offset + cur_bloc.lines[-1].l
 
+    def add_coverage_bloc(self, vm, bloc):
+        """Assign a coverage counter of @vm to @bloc
+        @vm: VmMngr instance
+        @bloc: asm_bloc instance
+        """
+        offset = bloc.label.offset
+        if offset not in self.coverage_ids:
+            self.coverage_ids[offset] = len(self.coverage_ids)
+            vm.coverage_resize(len(self.coverage_ids))
+        self.coverage_sizes[offset] = bloc.ad_max - bloc.ad_min
+
+    def coverage_id(self, label):
+        """Return the coverage counter identifier of the block at @label, or
+        None if the block is not counted"""
+        if not self.log_coverage:
+            return None
+        return self.coverage_ids.get(label.offset)
+
+    def code_options(self, label):
+        """Return a string standing for the options modifying the code of the
+        block at @label, other than log_mn and log_regs, for code caches"""
+        options = ""
+        if self.log_trace:
+            options += "trace_"
+        coverage_id = self.coverage_id(label)
+        if coverage_id is not None:
+            options += "cov%d_" % coverage_id
+        return options
+
     def add_bloc_to_mem_interval(self, vm, bloc):
         "Update vm to include bloc addresses in its memory range"
 
@@ -158,19 +204,54 @@ class JitCore(object):
         # Store min/max bloc address needed in jit automod code
         self.get_bloc_min_max(cur_bloc)
 
+        # Assign its hit counter
+        if self.log_coverage:
+            self.add_coverage_bloc(vm, cur_bloc)
+
         # JiT it
         self.add_bloc(cur_bloc)
 
         # Update jitcode mem range
         self.add_bloc_to_mem_interval(vm, cur_bloc)
 
-    def jit_call(self, label, cpu, _vmmngr, breakpoints):
+    def jit_call(self, label, cpu, vmmngr, breakpoints):
         """Call the function label with cpu and vmmngr states
         @label: function's label
         @cpu: JitCpu instance
         @breakpoints: Dict instance of used breakpoints
         """
-        return self.exec_wrapper(label, cpu, self.lbl2jitbloc.data, breakpoints)
+        if self.max_blocks is None:
+            return self.exec_wrapper(label, cpu, self.lbl2jitbloc.data,
+                                     breakpoints, None, self.lib_stubs)
+        if not self.supports_max_blocks:
+            raise RuntimeError("%s does not support max_blocks" %
+                               self.__class__.__name__)
+        budget = max(0, self.max_blocks - self.blocks_count)
+        ret, count = self.exec_wrapper(label, cpu, self.lbl2jitbloc.data,
+                                       breakpoints, budget, self.lib_stubs)
+        self.count_blocks(vmmngr, count)
+        return ret
+
+    def count_blocks(self, vmmngr, count):
+        """Add @count to the number of blocks run. Set the BREAK_BLOCK_LIMIT
+        exception of @vmmngr if max_blocks blocks have been run
+        @vmmngr: VmMngr instance
+        @count: number of blocks run
+        """
+        self.blocks_count += count
+        if self.blocks_count >= self.max_blocks:
+            vmmngr.set_exception(vmmngr.get_exception() | BREAK_BLOCK_LIMIT)
+
+    def call_lib_stubs(self, lbl):
+        """Call the library stubs chained from @lbl, and return the next
+        address
+        @lbl: address
+        """
+        while lbl in self.lib_stubs:
+            lbl = self.lib_stubs[lbl]()
+            if isinstance(lbl, tuple):
+                return lbl[0]
+        return lbl
 
     def runbloc(self, cpu, vm, lbl, breakpoints):
         """Run the bloc starting at lbl.
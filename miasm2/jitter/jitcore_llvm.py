@@ -10,6 +10,9 @@ class JitCore_LLVM(jitcore.JitCore):
 
     "JiT management, using LLVM as backend"
 
+    # llvm_exec_bloc has no block budget
+    supports_max_blocks = False
+
     # Architecture dependant libraries
     arch_dependent_libs = {"x86": "JitCore_x86.so",
                            "arm": "JitCore_arm.so",
@@ -73,9 +76,9 @@ class JitCore_LLVM(jitcore.JitCore):
             # /!\ This part is under development
             # Use it at your own risk
 
-            # Compute Hash : label + bloc binary
+            # Compute Hash : label + code options + bloc binary
             func_name = bloc.label.name
-            to_hash = func_name
+            to_hash = func_name + self.code_options(bloc.label)
 
             # Get binary from bloc
             for line in bloc.lines:
@@ -133,6 +136,8 @@ class JitCore_LLVM(jitcore.JitCore):
         # Set log level
         func.log_regs = self.log_regs
         func.log_mn = self.log_mn
+        func.log_trace = self.log_trace
+        func.coverage_id = self.coverage_id(label)
 
         # Import irblocs
         func.from_blocs(irblocs)
@@ -31,6 +31,8 @@ class JitCore_Python(jitcore.JitCore):
         @irblocs: a gorup of irblocs
         """
 
+        coverage_id = self.coverage_id(label)
+
         def myfunc(cpu, vmmngr):
             """Execute the function according to cpu and vmmngr states
             @cpu: JitCpu instance
@@ -47,6 +49,17 @@ class JitCore_Python(jitcore.JitCore):
             exec_engine = self.symbexec
             exec_engine.cpu = cpu
 
+            # Block hit counter
+            if coverage_id is not None:
+                vmmngr.coverage_hit(coverage_id)
+
+            # Execution trace
+            if self.log_trace:
+                vmmngr.trace_block(label.offset)
+                exec_engine.trace_vm = vmmngr
+            else:
+                exec_engine.trace_vm = None
+
             # For each irbloc inside irblocs
             while True:
 
@@ -117,5 +130,17 @@ class JitCore_Python(jitcore.JitCore):
         # Get Python function corresponding to @label
         fc_ptr = self.lbl2jitbloc[label]
 
-        # Execute the function
-        return fc_ptr(cpu, vmmngr)
+        if self.max_blocks is None:
+            # Execute the function
+            ret = fc_ptr(cpu, vmmngr)
+        elif self.blocks_count >= self.max_blocks:
+            self.count_blocks(vmmngr, 0)
+            return label
+        else:
+            ret = fc_ptr(cpu, vmmngr)
+            self.count_blocks(vmmngr, 1)
+
+        if (ret in self.lib_stubs and
+            cpu.get_exception() | vmmngr.get_exception() == 0):
+            ret = self.call_lib_stubs(ret)
+        return ret
@@ -175,7 +175,9 @@ class JitCore_Tcc(jitcore.JitCore):
         out = irblocs2C(self.ir_arch, self.resolver, label, irblocks,
                         gen_exception_code=True,
                         log_mn=self.log_mn,
-                        log_regs=self.log_regs)
+                        log_regs=self.log_regs,
+                        log_trace=self.log_trace,
+                        coverage_id=self.coverage_id(label))
         out = [f_declaration + '{'] + out + ['}\n']
         c_code = out
 
@@ -186,10 +188,11 @@ class JitCore_Tcc(jitcore.JitCore):
         @block: block to jit
         """
         block_raw = "".join(line.b for line in block.lines)
-        block_hash = md5("%X_%s_%s_%s" % (block.label.offset,
-                                          self.log_mn,
-                                          self.log_regs,
-                                          block_raw)).hexdigest()
+        block_hash = md5("%X_%s_%s_%s%s" % (block.label.offset,
+                                            self.log_mn,
+                                            self.log_regs,
+                                            self.code_options(block.label),
+                                            block_raw)).hexdigest()
         fname_out = os.path.join(self.tempdir, "%s.c" % block_hash)
         if os.access(fname_out, os.R_OK):
             func_code = open(fname_out).read()
@@ -10,6 +10,7 @@ from miasm2.core.bin_stream import bin_stream_vm
 from miasm2.ir.ir2C import init_arch_C
 from miasm2.core.interval import interval
 from miasm2.jitter.emulatedsymbexec import EmulatedSymbExec
+from miasm2.jitter.coverage import Coverage, vm_modules
 
 hnd = logging.StreamHandler()
 hnd.setFormatter(logging.Formatter("[%(levelname)s]: %(message)s"))
@@ -36,26 +37,35 @@ def named_arguments(func):
     @func: function
 
     """
+    # Arguments names -> namedtuple class
+    args_classes = {}
+
     @wraps(func)
     def newfunc(self, args):
         if isinstance(args, Sequence):
             ret_ad, arg_vals = func(self, len(args))
-            arg_vals = namedtuple("args", args)(*arg_vals)
+            args = tuple(args)
+            args_cls = args_classes.get(args)
+            if args_cls is None:
+                args_cls = args_classes[args] = namedtuple("args", args)
+            arg_vals = args_cls(*arg_vals)
             # func_name(arguments) return address
-            log_func.info('%s(%s) ret addr: %s',
-                          get_caller_name(1),
-                          ', '.join("%s=0x%x" % (field, value)
-                                    for field, value in arg_vals._asdict(
-                                    ).iteritems()),
-                         hex(ret_ad))
-            return ret_ad, namedtuple("args", args)(*arg_vals)
+            if log_func.isEnabledFor(logging.INFO):
+                log_func.info('%s(%s) ret addr: %s',
+                              get_caller_name(1),
+                              ', '.join("%s=0x%x" % (field, value)
+                                        for field, value in arg_vals._asdict(
+                                        ).iteritems()),
+                              hex(ret_ad))
+            return ret_ad, arg_vals
         else:
             ret_ad, arg_vals = func(self, args)
             # func_name(arguments) return address
-            log_func.info('%s(%s) ret addr: %s',
-                get_caller_name(1),
-                ', '.join(hex(arg) for arg in arg_vals),
-                hex(ret_ad))
+            if log_func.isEnabledFor(logging.INFO):
+                log_func.info('%s(%s) ret addr: %s',
+                              get_caller_name(1),
+                              ', '.join(hex(arg) for arg in arg_vals),
+                              hex(ret_ad))
             return ret_ad, arg_vals
     return newfunc
 
@@ -192,6 +202,8 @@ class jitter:
 
         self.vm = VmMngr.Vm()
         self.cpu = jcore.JitCpu()
+        # Register name -> offset in the CPU state
+        self.cpu_offsets = jcore.get_gpreg_offset_all()
         self.ir_arch = ir_arch
         self.bs = bin_stream_vm(self.vm)
         init_arch_C(self.arch)
@@ -233,6 +245,10 @@ class jitter:
         self.exceptions_handler = CallbackHandlerBitflag()
         self.init_exceptions_handler()
         self.exec_cb = None
+        self.libs = None
+        self.user_globals = {}
+        # Value returned by the last library stub giving control back
+        self.lib_stub_result = None
 
     def init_exceptions_handler(self):
         "Add common exceptions handlers"
@@ -260,6 +276,7 @@ class jitter:
         """
         self.breakpoints_handler.add_callback(addr, callback)
         self.jit.add_disassembly_splits(addr)
+        self.update_lib_stub(addr)
         # De-jit previously jitted blocks
         self.jit.addr_mod = interval([(addr, addr)])
         self.jit.updt_automod_code(self.vm)
@@ -271,6 +288,7 @@ class jitter:
         """
         self.breakpoints_handler.set_callback(addr, *args)
         self.jit.add_disassembly_splits(addr)
+        self.update_lib_stub(addr)
 
     def remove_breakpoints_by_callback(self, callback):
         """Remove callbacks associated with breakpoint.
@@ -279,6 +297,9 @@ class jitter:
         empty_keys = self.breakpoints_handler.remove_callback(callback)
         for key in empty_keys:
             self.jit.remove_disassembly_splits(key)
+        if self.libs is not None:
+            for addr in self.libs.fad2cname:
+                self.update_lib_stub(addr)
 
     def add_exception_handler(self, flag, callback):
         """Add a callback associated with an exception flag.
@@ -332,6 +353,15 @@ class jitter:
         # Run the bloc at PC
         self.pc = self.runbloc(self.pc)
 
+        # Result of a library stub called from the JiT loop
+        if self.lib_stub_result is not None:
+            res, self.lib_stub_result = self.lib_stub_result, None
+            if isinstance(res, collections.Iterator):
+                for tmp in res:
+                    yield tmp
+            else:
+                yield res
+
         # Check exceptions (raised by the execution of the block)
         exception_flag = self.get_exception()
         for res in self.exceptions_handler(exception_flag, self):
@@ -379,30 +409,91 @@ class jitter:
     def get_exception(self):
         return self.cpu.get_exception() | self.vm.get_exception()
 
+    def snapshot(self):
+        """Return a snapshot of the memory and CPU states, to be used with
+        `restore`.
+        Written memory is tracked from now on, so that restoring this snapshot
+        only copies back the memory modified since.
+        Note: the state of the OS emulation layers is not part of it.
+        """
+        return self.vm.snapshot(), self.cpu.snapshot()
+
+    def restore(self, snapshot):
+        """Restore the memory and CPU states saved in @snapshot
+        Code jitted from restored memory is discarded
+        @snapshot: value returned by `snapshot`
+        """
+        vm_snapshot, cpu_snapshot = snapshot
+        modified = self.vm.restore(vm_snapshot)
+        if modified:
+            for addr, size in modified:
+                self.jit.addr_mod += interval([(addr, addr + size - 1)])
+            self.jit.updt_automod_code(self.vm)
+        self.cpu.restore(cpu_snapshot)
+
+    def trace_start(self, filename, regs=False, mem=False, sample=1,
+                    ranges=None, buffer_size=0x100000):
+        """Record the executed blocks in the binary trace @filename, to be read
+        with miasm2.jitter.trace.TraceReader
+        @regs: also record the registers modified before each block (see
+            cpu_offsets)
+        @mem: also record the memory accesses of each block
+        @sample: only record one block out of @sample
+        @ranges: (optional) list of (start, stop) addresses; only record the
+            blocks starting in these ranges
+        @buffer_size: records are written to @filename by chunks of this size
+        """
+        flags = (TRACE_REGS if regs else 0) | (TRACE_MEM if mem else 0)
+        # Only trace the registers part of the CPU state
+        regs_size = min(len(self.cpu.snapshot()),
+                        max(self.cpu_offsets.itervalues()) + 8)
+        self.vm.trace_start(filename, flags, buffer_size, sample,
+                            ranges or [], self.cpu, regs_size)
+        if not self.jit.log_trace:
+            # Blocks already jitted do not call the trace
+            self.jit.log_trace = True
+            self.jit.clear_jitted_blocks()
+
+    def trace_stop(self):
+        """Stop the trace started by `trace_start` and write its last
+        records"""
+        self.vm.trace_stop()
+
+    def coverage_start(self):
+        """Count the runs of each block from now on, see `get_coverage`"""
+        if not self.jit.log_coverage:
+            # Blocks already jitted do not count their runs
+            self.jit.log_coverage = True
+            self.jit.clear_jitted_blocks()
+
+    def get_coverage(self):
+        """Return a Coverage instance of the blocks jitted since
+        `coverage_start`, with their hit counts. Its default modules are the
+        memory pages"""
+        counts = self.vm.get_coverage()
+        blocks = {}
+        for addr, coverage_id in self.jit.coverage_ids.iteritems():
+            blocks[addr] = (self.jit.coverage_sizes[addr], counts[coverage_id])
+        return Coverage(blocks, vm_modules(self.vm))
+
+    def reset_coverage(self):
+        "Reset the hit counts of the blocks"
+        self.vm.reset_coverage()
+
     # commun functions
     def get_str_ansi(self, addr, max_char=None):
         """Get ansi str from vm.
         @addr: address in memory
         @max_char: maximum len"""
-        l = 0
-        tmp = addr
-        while ((max_char is None or l < max_char) and
-               self.vm.get_mem(tmp, 1) != "\x00"):
-            tmp += 1
-            l += 1
-        return self.vm.get_mem(addr, l)
+        return self.vm.get_cstr(addr, max_char)
 
     def get_str_unic(self, addr, max_char=None):
         """Get unicode str from vm.
         @addr: address in memory
-        @max_char: maximum len"""
-        l = 0
-        tmp = addr
-        while ((max_char is None or l < max_char) and
-               self.vm.get_mem(tmp, 2) != "\x00\x00"):
-            tmp += 2
-            l += 2
-        s = self.vm.get_mem(addr, l)
+        @max_char: maximum len, in bytes"""
+        if max_char is not None:
+            max_char = (max_char + 1) / 2
+        s = self.vm.get_wstr(addr, max_char)
         s = s[::2]  # TODO: real unicode decoding
         return s
 
@@ -436,6 +527,42 @@ class jitter:
         else:
             return ret
 
+    def lib_stub(self, f_addr, func):
+        """Return a library stub for @f_addr, to be called by the JiT loop
+        instead of the handle_lib breakpoint. The stub calls @func and returns
+        the next PC, or a tuple (next PC,) to give control back to the run
+        loop (on a non None result, an exception or a run stop).
+        @f_addr: library function address
+        @func: handler, with definition (jitter instance)
+        """
+        cpu = self.cpu
+        pc_name = self.ir_arch.pc.name
+
+        def stub():
+            self.pc = f_addr
+            ret = func(self)
+            pc = getattr(cpu, pc_name)
+            if ret is not None and ret is not True:
+                self.lib_stub_result = ret
+                return (pc,)
+            if not self.run or self.get_exception():
+                return (pc,)
+            return pc
+        return stub
+
+    def update_lib_stub(self, f_addr):
+        """Bind the library stub of @f_addr if its only breakpoint is
+        handle_lib on a known function, unbind it otherwise
+        @f_addr: breakpoint address
+        """
+        callbacks = self.breakpoints_handler.get_callbacks(f_addr)
+        fname = self.libs.fad2cname.get(f_addr) if self.libs else None
+        if callbacks == [self.handle_lib] and fname in self.user_globals:
+            self.jit.lib_stubs[f_addr] = self.lib_stub(
+                f_addr, self.user_globals[fname])
+        else:
+            self.jit.lib_stubs.pop(f_addr, None)
+
     def handle_function(self, f_addr):
         """Add a brakpoint which will trigger the function handler"""
         self.add_breakpoint(f_addr, self.handle_lib)
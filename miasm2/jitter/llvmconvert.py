@@ -199,6 +199,10 @@ class LLVMContext_JIT(LLVMContext):
         p8 = llvm_c.PointerType.pointer(LLVMType.int(8))
         self.add_fc({"dump_gpregs": {"ret": LLVMType.void(),
                                      "args": [p8]}})
+        self.add_fc({"vm_trace_block": {"ret": LLVMType.void(),
+                                        "args": [p8, LLVMType.int(64)]}})
+        self.add_fc({"vm_coverage_hit": {"ret": LLVMType.void(),
+                                         "args": [p8, LLVMType.int(64)]}})
 
     def set_vmcpu(self, lookup_table):
         "Set the correspondance between register name and vmcpu offset"
@@ -219,6 +223,9 @@ class LLVMFunction():
     # Default logging values
     log_mn = False
     log_regs = False
+    log_trace = False
+    # Coverage counter identifier of the function, None if not counted
+    coverage_id = None
 
     def __init__(self, llvm_context, name="fc"):
         "Create a new function with name fc"
@@ -938,6 +945,20 @@ class LLVMFunction():
         # Add content
         builder.position_at_end(entry_bbl)
 
+        if self.log_trace is True:
+            # Call the execution trace
+            fc_ptr = self.mod.get_function_named("vm_trace_block")
+            offset = llvm_c.Constant.int(LLVMType.int(64),
+                                         blocs[0].label.offset)
+            builder.call(fc_ptr, [self.local_vars["vmmngr"], offset])
+
+        if self.coverage_id is not None:
+            # Count the function run
+            fc_ptr = self.mod.get_function_named("vm_coverage_hit")
+            coverage_id = llvm_c.Constant.int(LLVMType.int(64),
+                                              self.coverage_id)
+            builder.call(fc_ptr, [self.local_vars["vmmngr"], coverage_id])
+
         for irbloc in blocs:
             self.add_irbloc(irbloc)
 
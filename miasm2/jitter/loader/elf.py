@@ -73,8 +73,7 @@ def vm_load_elf(vm, fdata, name="", **kargs):
         i += [(a_addr, b_addr - 2)]
     for a, b in i.intervals:
         # print hex(a), hex(b)
-        vm.add_memory_page(a, PAGE_READ | PAGE_WRITE, "\x00" * (b + 2 - a),
-                           repr(name))
+        vm.map_memory_page(a, PAGE_READ | PAGE_WRITE, b + 2 - a, repr(name))
 
     for r_vaddr, data in all_data.items():
         vm.set_mem(r_vaddr, data)
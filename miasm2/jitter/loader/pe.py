@@ -1,6 +1,8 @@
 import os
 import struct
 import logging
+import tempfile
+import cPickle
 from collections import defaultdict
 
 from elfesteem import pe
@@ -8,7 +10,8 @@ from elfesteem import cstruct
 from elfesteem import *
 
 from miasm2.jitter.csts import *
-from miasm2.jitter.loader.utils import canon_libname_libfunc, libimp
+from miasm2.jitter.loader.utils import canon_libname_libfunc, libimp, \
+    vm_map_data
 
 log = logging.getLogger('loader_pe')
 hnd = logging.StreamHandler()
@@ -101,12 +104,15 @@ def get_export_name_addr_list(e):
     return out
 
 
-def vm_load_pe(vm, fdata, align_s=True, load_hdr=True, name="", **kargs):
+def vm_load_pe(vm, fdata, align_s=True, load_hdr=True, name="",
+               fstream=None, **kargs):
     """Load a PE in memory (@vm) from a data buffer @fdata
     @vm: VmMngr instance
     @fdata: data buffer to parse
     @align_s: (optional) If False, keep gaps between section
     @load_hdr: (optional) If False, do not load the NThdr in memory
+    @fstream: (optional) file @fdata has been read from. If set, aligned
+    sections are mapped from it instead of being copied
     Return the corresponding PE instance.
 
     Extra arguments are passed to PE instanciation.
@@ -117,6 +123,12 @@ def vm_load_pe(vm, fdata, align_s=True, load_hdr=True, name="", **kargs):
     # Parse and build a PE instance
     pe = pe_init.PE(fdata, **kargs)
 
+    def file_offset(data, offset):
+        """Return @offset if @data can be mapped from @fstream at @offset"""
+        if fstream is None or fdata[offset:offset + len(data)] != data:
+            return None
+        return offset
+
     # Check if all section are aligned
     aligned = True
     for section in pe.SHList:
@@ -133,10 +145,14 @@ def vm_load_pe(vm, fdata, align_s=True, load_hdr=True, name="", **kargs):
             min_len = min(pe.SHList[0].addr, 0x1000)
 
             # Get and pad the pe_hdr
-            pe_hdr = pe.content[:hdr_len] + max(
-                0, (min_len - hdr_len)) * "\x00"
-            vm.add_memory_page(pe.NThdr.ImageBase, PAGE_READ | PAGE_WRITE,
-                               pe_hdr, "%r: PE Header" % name)
+            pe_hdr = pe.content[:hdr_len]
+            vm_map_data(vm, pe.NThdr.ImageBase, PAGE_READ | PAGE_WRITE,
+                        pe_hdr, len(pe_hdr) + max(0, min_len - hdr_len),
+                        "%r: PE Header" % name, fstream,
+                        file_offset(pe_hdr, 0))
+
+        # Sections offsets in file, before alignment
+        offsets = [section.offset for section in pe.SHList]
 
         # Align sections size
         if align_s:
@@ -154,14 +170,14 @@ def vm_load_pe(vm, fdata, align_s=True, load_hdr=True, name="", **kargs):
             last_section.size = (last_section.size + 0xfff) & 0xfffff000
 
         # Pad sections with null bytes and map them
-        for section in pe.SHList:
+        for section, offset in zip(pe.SHList, offsets):
             data = str(section.data)
-            data += "\x00" * (section.size - len(data))
             attrib = PAGE_READ
             if section.flags & 0x80000000:
                 attrib |= PAGE_WRITE
-            vm.add_memory_page(pe.rva2virt(section.addr), attrib, data,
-                               "%r: %r" % (name, section.name))
+            vm_map_data(vm, pe.rva2virt(section.addr), attrib, data,
+                        section.size, "%r: %r" % (name, section.name),
+                        fstream, file_offset(data, offset))
 
         return pe
 
@@ -191,9 +207,7 @@ def vm_load_pe(vm, fdata, align_s=True, load_hdr=True, name="", **kargs):
               (max_addr - min_addr))
 
     # Create only one big section containing the whole PE
-    vm.add_memory_page(min_addr,
-                       PAGE_READ | PAGE_WRITE,
-                       (max_addr - min_addr) * "\x00")
+    vm.map_memory_page(min_addr, PAGE_READ | PAGE_WRITE, max_addr - min_addr)
 
     # Copy each sections content in memory
     for section in pe.SHList:
@@ -218,7 +232,8 @@ def vm_load_pe_lib(vm, fname_in, libs, lib_path_base, **kargs):
 
     fname = os.path.join(lib_path_base, fname_in)
     with open(fname) as fstream:
-        pe = vm_load_pe(vm, fstream.read(), name=fname_in, **kargs)
+        pe = vm_load_pe(vm, fstream.read(), name=fname_in, fstream=fstream,
+                        **kargs)
     libs.add_export_lib(pe, fname_in)
     return pe
 
@@ -236,6 +251,167 @@ def vm_load_pe_libs(vm, libs_name, libs, lib_path_base, **kargs):
             for fname in libs_name}
 
 
+class LazyPE(object):
+    """PE instance of a loaded module, parsed on first attribute access"""
+
+    def __init__(self, fname, name, **kargs):
+        """
+        @fname: module path
+        @name: module name
+        Extra arguments are passed to vm_load_pe
+        """
+        self._fname = fname
+        self._name = name
+        self._kargs = kargs
+        self._pe = None
+
+    def _load(self):
+        if self._pe is None:
+            # Build the PE instance as vm_load_pe would, in a throwaway vm
+            from miasm2.jitter.VmMngr import Vm
+            with open(self._fname) as fstream:
+                self._pe = vm_load_pe(Vm(), fstream.read(), name=self._name,
+                                      fstream=fstream, **self._kargs)
+        return self._pe
+
+    def __getattr__(self, attr):
+        if attr.startswith("_"):
+            raise AttributeError(attr)
+        return getattr(self._load(), attr)
+
+    def __str__(self):
+        return str(self._load())
+
+
+# Loader image cache file: magic, index offset, pages content aligned on
+# LOADER_CACHE_ALIGN, then the pickled index
+LOADER_CACHE_MAGIC = "MIASMLDC"
+LOADER_CACHE_VERSION = 1
+LOADER_CACHE_ALIGN = 0x1000
+
+
+def _loader_cache_key(libs_name, libs, lib_path_base, kargs):
+    """Return a key identifying the loading of @libs_name"""
+    files = []
+    for fname in libs_name:
+        stat = os.stat(os.path.join(lib_path_base, fname))
+        files.append((fname, stat.st_size, stat.st_mtime))
+    return (LOADER_CACHE_VERSION, files, libs.libbase_ad,
+            sorted(kargs.items()))
+
+
+def _load_loader_cache(vm, libs, fstream, key):
+    """Map the loader image cache @fstream in @vm and restore @libs. Return
+    the cached modules as a list of (name, path), or None if the cache does
+    not match @key"""
+    header = fstream.read(len(LOADER_CACHE_MAGIC) + 8)
+    if len(header) != len(LOADER_CACHE_MAGIC) + 8 or \
+            not header.startswith(LOADER_CACHE_MAGIC):
+        return None
+    fstream.seek(struct.unpack("<Q", header[len(LOADER_CACHE_MAGIC):])[0])
+    try:
+        index = cPickle.load(fstream)
+    except Exception:
+        return None
+    if index["key"] != key:
+        return None
+    for addr, size, access, name, offset in index["pages"]:
+        vm.map_memory_page(addr, access, size, name, fstream, offset, size)
+    libs.__dict__.update(index["libs"])
+    return index["modules"]
+
+
+def _write_loader_cache(cache_path, key, pages, libs, modules):
+    """Write the loader image cache @cache_path
+    @key: cache key
+    @pages: list of (addr, size, access, name, data) to cache
+    @libs: libimp_pe instance
+    @modules: list of (name, path) of cached modules
+    """
+    state = dict(libs.__dict__)
+    del state["all_exported_lib"]
+
+    # Write in a temporary file, then move it, for concurrent sandboxes
+    fdesc, fname_tmp = tempfile.mkstemp(
+        dir=os.path.dirname(os.path.abspath(cache_path)))
+    with os.fdopen(fdesc, "wb") as fstream:
+        offset = LOADER_CACHE_ALIGN
+        index_pages = []
+        for addr, size, access, name, data in pages:
+            fstream.seek(offset)
+            fstream.write(data)
+            index_pages.append((addr, size, access, name, offset))
+            offset += (size + LOADER_CACHE_ALIGN - 1) & ~(LOADER_CACHE_ALIGN - 1)
+        fstream.seek(offset)
+        cPickle.dump({"key": key,
+                      "pages": index_pages,
+                      "libs": state,
+                      "modules": modules},
+                     fstream, cPickle.HIGHEST_PROTOCOL)
+        fstream.seek(0)
+        fstream.write(LOADER_CACHE_MAGIC + struct.pack("<Q", offset))
+    os.rename(fname_tmp, cache_path)
+
+
+def vm_load_pe_libs_cached(vm, libs_name, libs, lib_path_base, cache_path,
+                           **kargs):
+    """Call vm_load_pe_libs on @libs_name and preload_pe on the loaded
+    libraries, through the loader image cache @cache_path.
+
+    The cache contains the libraries pages and the @libs state. It is built
+    on first use, and rebuilt if a library or the loading parameters change.
+    Then, the libraries pages are mapped copy-on-write from the cache,
+    without parsing them.
+
+    @vm: VmMngr instance
+    @libs_name: list of str
+    @libs: libimp_pe instance, with no library loaded yet
+    @lib_path_base: DLLs relative path
+    @cache_path: loader image cache path
+    Return a dictionary Filename -> PE instances. Cached PE instances are
+    LazyPE instances.
+    Extra arguments are passed to vm_load_pe_lib
+    """
+    if libs.name2off:
+        log.warning("Libraries already loaded, loader cache is not used")
+        modules = vm_load_pe_libs(vm, libs_name, libs, lib_path_base,
+                                  **kargs)
+        for pe_obj in modules.itervalues():
+            preload_pe(vm, pe_obj, libs)
+        return modules
+
+    key = _loader_cache_key(libs_name, libs, lib_path_base, kargs)
+    try:
+        with open(cache_path, "rb") as fstream:
+            modules = _load_loader_cache(vm, libs, fstream, key)
+    except IOError:
+        modules = None
+    if modules is not None:
+        name2module = {}
+        for name, fname in modules:
+            pe_obj = LazyPE(fname, name, **kargs)
+            libs.all_exported_lib.append(pe_obj)
+            name2module[name] = pe_obj
+        return name2module
+
+    # Build the cache
+    log.info('Building loader cache %r', cache_path)
+    addrs = set(page[0] for page in vm.get_memory_pages())
+    name2module = {}
+    for name in libs_name:
+        name2module[name] = vm_load_pe_lib(vm, name, libs, lib_path_base,
+                                           **kargs)
+    for pe_obj in name2module.itervalues():
+        preload_pe(vm, pe_obj, libs)
+    pages = [(addr, size, access, name, vm.get_mem(addr, size))
+             for addr, size, access, name in vm.get_memory_pages()
+             if addr not in addrs]
+    _write_loader_cache(cache_path, key, pages, libs,
+                        [(name, os.path.join(lib_path_base, name))
+                         for name in libs_name])
+    return name2module
+
+
 def vm_fix_imports_pe_libs(lib_imgs, libs, lib_path_base,
                            patch_vm_imp=True, **kargs):
     for e in lib_imgs.values():
@@ -486,7 +662,8 @@ def vm_load_pe_and_dependencies(vm, fname, name2module, runtime_lib,
                 with open(fname) as fstream:
                     log.info('Loading module name %r', fname)
                     pe_obj = vm_load_pe(
-                        vm, fstream.read(), name=fname, **kwargs)
+                        vm, fstream.read(), name=fname, fstream=fstream,
+                        **kwargs)
             except IOError:
                 log.error('Cannot open %s' % fname)
                 name2module[name] = None
@@ -7,6 +7,31 @@ log.addHandler(hnd)
 log.setLevel(logging.INFO)
 
 
+def vm_map_data(vm, addr, access, data, size=0, name="", fstream=None,
+                offset=None):
+    """Add a page of max(@size, len(@data)) bytes at @addr in @vm, starting
+    with @data and padded with null bytes. Host memory of the page is only
+    committed on first access
+    @vm: VmMngr instance
+    @addr: page address
+    @access: page access
+    @data: page content
+    @size: (optional) page minimum size
+    @name: (optional) page name
+    @fstream: (optional) file containing @data at @offset. If set, @data is
+    mapped copy-on-write from @fstream instead of being copied
+    @offset: (optional) offset of @data in @fstream
+    """
+    size = max(size, len(data))
+    if fstream is not None and offset is not None and data:
+        vm.map_memory_page(addr, access, size, name, fstream, offset,
+                           len(data))
+        return
+    vm.map_memory_page(addr, access, size, name)
+    if data:
+        vm.set_mem(addr, data)
+
+
 def canon_libname_libfunc(libname, libfunc):
     dn = libname.split('.')[0]
     if type(libfunc) == str:
@@ -0,0 +1,171 @@
+"""Reader of the binary execution traces recorded by `jitter.trace_start`
+
+A trace starts with a header ("MIASMTRC", version, flags and CPU state size as
+uint32), followed by packed records, in the byte order of the host which
+recorded it:
+- block: type (1), address (uint64)
+- memory access: type (2 for read, 3 for write), size (uint8), address
+  (uint64), value (uint64)
+- CPU state delta: type (4), size (uint8), offset (uint16), size bytes
+
+The CPU state deltas preceding a block are the modifications of the CPU state
+since the previous recorded block; the memory accesses following a block are
+the ones of this block.
+"""
+
+import struct
+from collections import namedtuple
+
+from miasm2.jitter.csts import TRACE_REGS, TRACE_MEM
+
+TRACE_MAGIC = "MIASMTRC"
+TRACE_VERSION = 1
+
+TRACE_RECORD_BLOCK = 1
+TRACE_RECORD_READ = 2
+TRACE_RECORD_WRITE = 3
+TRACE_RECORD_REGS = 4
+
+# Size of the biggest record
+TRACE_RECORD_MAX = 18
+
+# Recorded block at @addr; @regs is a dictionary CPU state offset -> bytes,
+# modified before the block, and @mem the list of its TraceAccess
+TraceBlock = namedtuple("TraceBlock", ["addr", "regs", "mem"])
+# Memory access of @size bytes
+TraceAccess = namedtuple("TraceAccess", ["is_write", "size", "addr", "value"])
+
+
+class TraceState(object):
+    """CPU state rebuilt from a trace. Register offsets are the ones of the
+    jitter CPU (`jitter.cpu_offsets`)"""
+
+    def __init__(self, size):
+        self.state = bytearray(size)
+
+    def update(self, regs):
+        """Apply the CPU state deltas @regs
+        @regs: dictionary offset -> bytes
+        """
+        for offset, value in regs.iteritems():
+            self.state[offset:offset + len(value)] = value
+
+    def get(self, offset, size=8):
+        """Return the (host order) integer of @size bytes at @offset"""
+        fmt = {1: "B", 2: "H", 4: "I", 8: "Q"}[size]
+        return struct.unpack_from("=" + fmt, buffer(self.state), offset)[0]
+
+
+class TraceReader(object):
+    """Stream the blocks of a trace file, reading it by chunks
+
+    Usage:
+    >>> with TraceReader("trace.bin") as trace:
+    ...     for block in trace:
+    ...         print hex(block.addr)
+    """
+
+    chunk_size = 0x100000
+
+    def __init__(self, filename):
+        """
+        @filename: trace file name
+        """
+        self.fdesc = open(filename, "rb")
+        header = self.fdesc.read(20)
+        if len(header) != 20 or header[:8] != TRACE_MAGIC:
+            self.fdesc.close()
+            raise ValueError("%s is not a trace" % filename)
+        version, self.flags, self.regs_size = struct.unpack("=III",
+                                                            header[8:])
+        if version != TRACE_VERSION:
+            self.fdesc.close()
+            raise ValueError("Unsupported trace version %d" % version)
+
+    @property
+    def has_regs(self):
+        "True if CPU state deltas are recorded"
+        return bool(self.flags & TRACE_REGS)
+
+    @property
+    def has_mem(self):
+        "True if memory accesses are recorded"
+        return bool(self.flags & TRACE_MEM)
+
+    def close(self):
+        self.fdesc.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def records(self):
+        """Iterate on the raw records of the trace, as tuples:
+        - (TRACE_RECORD_BLOCK, address)
+        - (TRACE_RECORD_READ or TRACE_RECORD_WRITE, size, address, value)
+        - (TRACE_RECORD_REGS, offset, bytes)
+        """
+        self.fdesc.seek(20)
+        data = ""
+        pos = 0
+        while True:
+            if len(data) - pos < TRACE_RECORD_MAX:
+                chunk = self.fdesc.read(self.chunk_size)
+                data = data[pos:] + chunk
+                pos = 0
+                if not data:
+                    return
+            rtype = ord(data[pos])
+            if rtype == TRACE_RECORD_BLOCK:
+                if pos + 9 > len(data):
+                    break
+                yield rtype, struct.unpack_from("=Q", data, pos + 1)[0]
+                pos += 9
+            elif rtype in (TRACE_RECORD_READ, TRACE_RECORD_WRITE):
+                if pos + 18 > len(data):
+                    break
+                size, addr, value = struct.unpack_from("=BQQ", data, pos + 1)
+                yield rtype, size, addr, value
+                pos += 18
+            elif rtype == TRACE_RECORD_REGS:
+                if pos + 4 > len(data):
+                    break
+                size, offset = struct.unpack_from("=BH", data, pos + 1)
+                if pos + 4 + size > len(data):
+                    break
+                yield rtype, offset, data[pos + 4:pos + 4 + size]
+                pos += 4 + size
+            else:
+                raise ValueError("Bad record type %d at offset 0x%x" %
+                                 (rtype, pos))
+        raise ValueError("Truncated trace")
+
+    def __iter__(self):
+        """Iterate on the TraceBlock instances of the trace"""
+        regs = {}
+        block = None
+        for record in self.records():
+            rtype = record[0]
+            if rtype == TRACE_RECORD_BLOCK:
+                if block is not None:
+                    yield block
+                block = TraceBlock(record[1], regs, [])
+                regs = {}
+            elif rtype == TRACE_RECORD_REGS:
+                regs[record[1]] = record[2]
+            elif block is not None:
+                block.mem.append(TraceAccess(rtype == TRACE_RECORD_WRITE,
+                                             *record[1:]))
+        if block is not None:
+            yield block
+
+    def states(self):
+        """Iterate on (TraceBlock, TraceState) for each block of the trace;
+        the TraceState is the CPU state at the block entry, updated in place
+        """
+        state = TraceState(self.regs_size)
+        for block in self:
+            state.update(block.regs)
+            yield block, state
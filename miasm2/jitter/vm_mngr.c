@@ -25,6 +25,9 @@
 #include <stdint.h>
 #include <inttypes.h>
 #include <math.h>
+#include <unistd.h>
+#include <sys/mman.h>
+#include <sys/stat.h>
 
 #include "queue.h"
 #include "vm_mngr.h"
@@ -165,6 +168,20 @@ struct memory_page_node * get_memory_page_from_address(vm_mngr_t* vm_mngr, uint6
 
 
 
+/* Mark chunks of @mpn covering [@ad, @ad + @size[ as written */
+void memory_page_set_dirty(struct memory_page_node * mpn, uint64_t ad, uint64_t size)
+{
+	uint64_t i, stop;
+
+	if (mpn->dirty == NULL || size == 0)
+		return;
+	i = (ad - mpn->ad) >> MEMORY_PAGE_POOL_MASK_BIT;
+	stop = (ad - mpn->ad + size - 1) >> MEMORY_PAGE_POOL_MASK_BIT;
+	for (; i <= stop; i++)
+		mpn->dirty[i] = 1;
+}
+
+
 static uint64_t memory_page_read(vm_mngr_t* vm_mngr, unsigned int my_size, uint64_t ad)
 {
 	struct memory_page_node * mpn;
@@ -281,6 +298,7 @@ static void memory_page_write(vm_mngr_t* vm_mngr, unsigned int my_size,
 
 	/* write fits in a page */
 	if (ad - mpn->ad + my_size/8 <= mpn->size){
+		memory_page_set_dirty(mpn, ad, my_size/8);
 		switch(my_size){
 		case 8:
 			*((unsigned char*)addr) = src&0xFF;
@@ -329,6 +347,7 @@ static void memory_page_write(vm_mngr_t* vm_mngr, unsigned int my_size,
 
 			addr = &((unsigned char*)mpn->ad_hp)[ad - mpn->ad];
 			*((unsigned char*)addr) = src&0xFF;
+			memory_page_set_dirty(mpn, ad, 1);
 			my_size -= 8;
 			src >>=8;
 			ad ++;
@@ -396,26 +415,32 @@ void dump_code_bloc(vm_mngr_t* vm_mngr)
 
 }
 
-void check_write_code_bloc(vm_mngr_t* vm_mngr, uint64_t my_size, uint64_t addr)
+/* Return 1 if [@addr, @addr + @size[ overlaps a code bloc */
+int is_code_bloc_in_range(vm_mngr_t* vm_mngr, uint64_t addr, uint64_t size)
 {
 	struct code_bloc_node * cbp;
 
-	if (!(addr + my_size/8 <= vm_mngr->code_bloc_pool_ad_min ||
-	      addr >=vm_mngr->code_bloc_pool_ad_max)){
-		LIST_FOREACH(cbp, &vm_mngr->code_bloc_pool, next){
-			if ((cbp->ad_start < addr + my_size/8) &&
-			    (addr < cbp->ad_stop)){
+	if (addr + size <= vm_mngr->code_bloc_pool_ad_min ||
+	    addr >= vm_mngr->code_bloc_pool_ad_max)
+		return 0;
+	LIST_FOREACH(cbp, &vm_mngr->code_bloc_pool, next){
+		if ((cbp->ad_start < addr + size) &&
+		    (addr < cbp->ad_stop))
+			return 1;
+	}
+	return 0;
+}
+
+void check_write_code_bloc(vm_mngr_t* vm_mngr, uint64_t my_size, uint64_t addr)
+{
+	if (is_code_bloc_in_range(vm_mngr, addr, my_size/8)){
 #ifdef DEBUG_MIASM_AUTOMOD_CODE
-				fprintf(stderr, "**********************************\n");
-				fprintf(stderr, "self modifying code %"PRIX64" %.8X\n",
-				       addr, my_size);
-				fprintf(stderr, "**********************************\n");
+		fprintf(stderr, "**********************************\n");
+		fprintf(stderr, "self modifying code %"PRIX64" %.8X\n",
+			addr, my_size);
+		fprintf(stderr, "**********************************\n");
 #endif
-				vm_mngr->exception_flags |= EXCEPT_CODE_AUTOMOD;
-
-				break;
-			}
-		}
+		vm_mngr->exception_flags |= EXCEPT_CODE_AUTOMOD;
 	}
 }
 
@@ -440,46 +465,62 @@ void vm_MEM_WRITE_08(vm_mngr_t* vm_mngr, uint64_t addr, unsigned char src)
 {
 	check_write_code_bloc(vm_mngr, 8, addr);
 	memory_page_write(vm_mngr, 8, addr, src);
+	if (vm_mngr->trace)
+		vm_trace_mem(vm_mngr, TRACE_RECORD_WRITE, 1, addr, src);
 }
 
 void vm_MEM_WRITE_16(vm_mngr_t* vm_mngr, uint64_t addr, unsigned short src)
 {
 	check_write_code_bloc(vm_mngr, 16, addr);
 	memory_page_write(vm_mngr, 16, addr, src);
+	if (vm_mngr->trace)
+		vm_trace_mem(vm_mngr, TRACE_RECORD_WRITE, 2, addr, src);
 }
 void vm_MEM_WRITE_32(vm_mngr_t* vm_mngr, uint64_t addr, unsigned int src)
 {
 	check_write_code_bloc(vm_mngr, 32, addr);
 	memory_page_write(vm_mngr, 32, addr, src);
+	if (vm_mngr->trace)
+		vm_trace_mem(vm_mngr, TRACE_RECORD_WRITE, 4, addr, src);
 }
 void vm_MEM_WRITE_64(vm_mngr_t* vm_mngr, uint64_t addr, uint64_t src)
 {
 	check_write_code_bloc(vm_mngr, 64, addr);
 	memory_page_write(vm_mngr, 64, addr, src);
+	if (vm_mngr->trace)
+		vm_trace_mem(vm_mngr, TRACE_RECORD_WRITE, 8, addr, src);
 }
 
 unsigned char vm_MEM_LOOKUP_08(vm_mngr_t* vm_mngr, uint64_t addr)
 {
     unsigned char ret;
     ret = memory_page_read(vm_mngr, 8, addr);
+    if (vm_mngr->trace)
+	    vm_trace_mem(vm_mngr, TRACE_RECORD_READ, 1, addr, ret);
     return ret;
 }
 unsigned short vm_MEM_LOOKUP_16(vm_mngr_t* vm_mngr, uint64_t addr)
 {
     unsigned short ret;
     ret = memory_page_read(vm_mngr, 16, addr);
+    if (vm_mngr->trace)
+	    vm_trace_mem(vm_mngr, TRACE_RECORD_READ, 2, addr, ret);
     return ret;
 }
 unsigned int vm_MEM_LOOKUP_32(vm_mngr_t* vm_mngr, uint64_t addr)
 {
     unsigned int ret;
     ret = memory_page_read(vm_mngr, 32, addr);
+    if (vm_mngr->trace)
+	    vm_trace_mem(vm_mngr, TRACE_RECORD_READ, 4, addr, ret);
     return ret;
 }
 uint64_t vm_MEM_LOOKUP_64(vm_mngr_t* vm_mngr, uint64_t addr)
 {
     uint64_t ret;
     ret = memory_page_read(vm_mngr, 64, addr);
+    if (vm_mngr->trace)
+	    vm_trace_mem(vm_mngr, TRACE_RECORD_READ, 8, addr, ret);
     return ret;
 }
 
@@ -533,6 +574,7 @@ int vm_write_mem(vm_mngr_t* vm_mngr, uint64_t addr, char *buffer, uint64_t size)
 
 	      len = MIN(size, mpn->size - (addr - mpn->ad));
 	      memcpy(mpn->ad_hp + (addr-mpn->ad), buffer, len);
+	      memory_page_set_dirty(mpn, addr, len);
 	      buffer += len;
 	      addr += len;
 	      size -= len;
@@ -541,6 +583,309 @@ int vm_write_mem(vm_mngr_t* vm_mngr, uint64_t addr, char *buffer, uint64_t size)
        return 0;
 }
 
+/*
+ * Search the @size bytes element @elem in memory from @addr, by steps of
+ * @size bytes, in at most @max_count elements. Set @count to the number of
+ * elements before it, or to @max_count if it is not found.
+ * Return -1 if unmapped memory is reached before
+ */
+int vm_find_elem(vm_mngr_t* vm_mngr, uint64_t addr, char* elem, uint64_t size,
+		 uint64_t max_count, uint64_t* count)
+{
+       struct memory_page_node * mpn;
+       unsigned char* ptr;
+       unsigned char* found;
+       char cur[8];
+       uint64_t len, i, filled = 0;
+
+       if (size == 0 || size > sizeof(cur)){
+	      PyErr_SetString(PyExc_ValueError, "Error: bad element size");
+	      return -1;
+       }
+
+       *count = 0;
+       while (*count < max_count){
+	      mpn = get_memory_page_from_address(vm_mngr, addr, 1);
+	      if (!mpn){
+		      PyErr_SetString(PyExc_RuntimeError, "Error: cannot find address");
+		      return -1;
+	      }
+	      ptr = (unsigned char*)mpn->ad_hp + (addr - mpn->ad);
+	      len = mpn->size - (addr - mpn->ad);
+
+	      if (size == 1){
+		      len = MIN(len, max_count - *count);
+		      found = memchr(ptr, elem[0], len);
+		      if (found){
+			      *count += found - ptr;
+			      return 0;
+		      }
+		      *count += len;
+		      addr += len;
+		      continue;
+	      }
+
+	      /* elements may be split across pages */
+	      for (i = 0; i < len; i++){
+		      cur[filled++] = ptr[i];
+		      if (filled < size)
+			      continue;
+		      if (!memcmp(cur, elem, size))
+			      return 0;
+		      filled = 0;
+		      (*count)++;
+		      if (*count >= max_count)
+			      return 0;
+	      }
+	      addr += len;
+       }
+
+       return 0;
+}
+
+int vm_fill_mem(vm_mngr_t* vm_mngr, uint64_t addr, unsigned char value,
+		uint64_t size)
+{
+       uint64_t len;
+       struct memory_page_node * mpn;
+
+       check_write_code_bloc(vm_mngr, size * 8, addr);
+
+       while (size){
+	      mpn = get_memory_page_from_address(vm_mngr, addr, 1);
+	      if (!mpn){
+		      PyErr_SetString(PyExc_RuntimeError, "Error: cannot find address");
+		      return -1;
+	      }
+
+	      len = MIN(size, mpn->size - (addr - mpn->ad));
+	      memset(mpn->ad_hp + (addr-mpn->ad), value, len);
+	      memory_page_set_dirty(mpn, addr, len);
+	      addr += len;
+	      size -= len;
+       }
+
+       return 0;
+}
+
+/*
+ * Compare @size bytes at @addr1 and @addr2, and set @result as memcmp does
+ */
+int vm_cmp_mem(vm_mngr_t* vm_mngr, uint64_t addr1, uint64_t addr2,
+	       uint64_t size, int* result)
+{
+       char* buf1;
+       char* buf2;
+
+       if (vm_read_mem(vm_mngr, addr1, &buf1, size) < 0)
+	      return -1;
+       if (vm_read_mem(vm_mngr, addr2, &buf2, size) < 0){
+	      free(buf1);
+	      return -1;
+       }
+       *result = memcmp(buf1, buf2, size);
+       free(buf1);
+       free(buf2);
+       return 0;
+}
+
+/*
+ * Return a new trace writing its records to @file, which it owns, or NULL on
+ * memory error. @ranges, if not NULL, must be allocated with malloc and is
+ * owned by the trace. @regs is the cpu state of @regs_size bytes if @flags
+ * has TRACE_REGS.
+ * The records are packed, in host byte order, after the header:
+ * "MIASMTRC", version, flags and regs_size as uint32
+ */
+vm_trace_t* vm_trace_new(FILE* file, unsigned int flags, size_t buffer_size,
+			 uint64_t sample, struct trace_range* ranges,
+			 size_t ranges_count, void* regs, size_t regs_size)
+{
+       vm_trace_t* trace;
+       uint32_t header[3];
+
+       trace = calloc(1, sizeof(vm_trace_t));
+       if (!trace)
+	      return NULL;
+       trace->buffer_size = MAX(buffer_size, 0x100);
+       trace->buffer = malloc(trace->buffer_size);
+       if (flags & TRACE_REGS)
+	      trace->regs_shadow = calloc(1, regs_size);
+       if (!trace->buffer || ((flags & TRACE_REGS) && !trace->regs_shadow)){
+	      free(trace->buffer);
+	      free(trace);
+	      return NULL;
+       }
+       trace->file = file;
+       trace->flags = flags;
+       trace->sample = sample ? sample : 1;
+       trace->ranges = ranges;
+       trace->ranges_count = ranges_count;
+       trace->regs = regs;
+       trace->regs_size = regs_size;
+
+       memcpy(trace->buffer, "MIASMTRC", 8);
+       header[0] = TRACE_VERSION;
+       header[1] = flags;
+       header[2] = regs_size;
+       memcpy(trace->buffer + 8, header, sizeof(header));
+       trace->buffer_pos = 8 + sizeof(header);
+       return trace;
+}
+
+/*
+ * Write the buffered records of @trace to its file. Return -1 on error
+ */
+int vm_trace_flush(vm_trace_t* trace)
+{
+       if (trace->buffer_pos &&
+	   fwrite(trace->buffer, trace->buffer_pos, 1, trace->file) != 1)
+	      trace->error = 1;
+       trace->buffer_pos = 0;
+       if (fflush(trace->file))
+	      trace->error = 1;
+       return trace->error ? -1 : 0;
+}
+
+/*
+ * Flush and free @trace, closing its file. Return -1 if a write failed
+ */
+int vm_trace_free(vm_trace_t* trace)
+{
+       int ret;
+
+       ret = vm_trace_flush(trace);
+       if (fclose(trace->file))
+	      ret = -1;
+       free(trace->buffer);
+       free(trace->regs_shadow);
+       free(trace->ranges);
+       free(trace);
+       return ret;
+}
+
+static void trace_write(vm_trace_t* trace, void* data, size_t size)
+{
+       memcpy(trace->buffer + trace->buffer_pos, data, size);
+       trace->buffer_pos += size;
+}
+
+/*
+ * Make room for a record in the buffer of @trace, and write its @type
+ */
+static void trace_record(vm_trace_t* trace, unsigned char type)
+{
+       if (trace->buffer_pos + TRACE_RECORD_MAX > trace->buffer_size)
+	      vm_trace_flush(trace);
+       trace_write(trace, &type, 1);
+}
+
+/*
+ * Record the cpu state words modified since the last recorded block as
+ * (type, size, offset as uint16, value) records
+ */
+static void trace_regs(vm_trace_t* trace)
+{
+       size_t offset;
+       unsigned char size;
+       uint16_t offset16;
+
+       for (offset = 0; offset < trace->regs_size; offset += TRACE_REGS_WORD){
+	      size = MIN(TRACE_REGS_WORD, trace->regs_size - offset);
+	      if (!memcmp(trace->regs + offset, trace->regs_shadow + offset,
+			  size))
+		      continue;
+	      memcpy(trace->regs_shadow + offset, trace->regs + offset, size);
+	      offset16 = offset;
+	      trace_record(trace, TRACE_RECORD_REGS);
+	      trace_write(trace, &size, 1);
+	      trace_write(trace, &offset16, 2);
+	      trace_write(trace, trace->regs + offset, size);
+       }
+}
+
+/*
+ * Called on the execution of the block at @addr: record it, as a (type,
+ * address) record preceded by the register deltas, if it is in the trace
+ * ranges and sampled
+ */
+void vm_trace_block(vm_mngr_t* vm_mngr, uint64_t addr)
+{
+       vm_trace_t* trace = vm_mngr->trace;
+       size_t i;
+
+       if (!trace)
+	      return;
+       trace->active = 0;
+       if (trace->ranges_count){
+	      for (i = 0; i < trace->ranges_count; i++)
+		      if (trace->ranges[i].start <= addr &&
+			  addr < trace->ranges[i].stop)
+			      break;
+	      if (i == trace->ranges_count)
+		      return;
+       }
+       if (trace->sample_count++ % trace->sample)
+	      return;
+       trace->active = 1;
+
+       if (trace->flags & TRACE_REGS)
+	      trace_regs(trace);
+       trace_record(trace, TRACE_RECORD_BLOCK);
+       trace_write(trace, &addr, 8);
+}
+
+/*
+ * Record a memory access of the current block, as a (type, size, address,
+ * value) record
+ * @record: TRACE_RECORD_READ or TRACE_RECORD_WRITE
+ * @size: access size, in bytes
+ */
+void vm_trace_mem(vm_mngr_t* vm_mngr, int record, unsigned int size,
+		  uint64_t addr, uint64_t value)
+{
+       vm_trace_t* trace = vm_mngr->trace;
+       unsigned char size8 = size;
+
+       if (!trace || !trace->active || !(trace->flags & TRACE_MEM))
+	      return;
+       trace_record(trace, record);
+       trace_write(trace, &size8, 1);
+       trace_write(trace, &addr, 8);
+       trace_write(trace, &value, 8);
+}
+
+/*
+ * Make room for at least @size block hit counters. Return -1 on memory error
+ */
+int vm_coverage_resize(vm_mngr_t* vm_mngr, uint64_t size)
+{
+       uint64_t* coverage;
+
+       if (size <= vm_mngr->coverage_size)
+	      return 0;
+       size = MAX(size, 2 * vm_mngr->coverage_size);
+       coverage = realloc(vm_mngr->coverage, size * sizeof(uint64_t));
+       if (!coverage){
+	      PyErr_NoMemory();
+	      return -1;
+       }
+       memset(coverage + vm_mngr->coverage_size, 0,
+	      (size - vm_mngr->coverage_size) * sizeof(uint64_t));
+       vm_mngr->coverage = coverage;
+       vm_mngr->coverage_size = size;
+       return 0;
+}
+
+/*
+ * Count a run of the block identified by @id
+ */
+void vm_coverage_hit(vm_mngr_t* vm_mngr, uint64_t id)
+{
+       if (id < vm_mngr->coverage_size)
+	      vm_mngr->coverage[id]++;
+}
+
 
 
 int is_mapped(vm_mngr_t* vm_mngr, uint64_t addr, uint64_t size)
@@ -1337,6 +1682,79 @@ struct memory_page_node * create_memory_page_node(uint64_t ad, unsigned int size
 	mpn->size = size;
 	mpn->access = access;
 	mpn->ad_hp = ad_hp;
+	mpn->dirty = NULL;
+	mpn->map_base = NULL;
+	mpn->map_size = 0;
+	strcpy(mpn->name, name);
+
+	return mpn;
+}
+
+/* Create a page of @size null bytes, whose host memory is only allocated on
+ * first write. If @fd is not -1, the first @length bytes of the page are a
+ * private mapping of the file @fd at @offset */
+struct memory_page_node * create_memory_page_node_mapped(uint64_t ad, uint64_t size, unsigned int access, char* name,
+							 int fd, uint64_t offset, uint64_t length)
+{
+	struct memory_page_node * mpn;
+	struct stat st;
+	uint64_t host_page, delta = 0, map_size, file_map_size;
+	unsigned char* base;
+
+	host_page = sysconf(_SC_PAGESIZE);
+	if (fd != -1) {
+		length = MIN(length, size);
+		if (fstat(fd, &st) || (uint64_t)st.st_size < offset + length) {
+			fprintf(stderr, "Error: cannot map file content\n");
+			return NULL;
+		}
+		delta = offset % host_page;
+	}
+	map_size = (delta + size + host_page - 1) & ~(host_page - 1);
+	if (map_size == 0)
+		map_size = host_page;
+
+	base = mmap(NULL, map_size, PROT_READ | PROT_WRITE,
+		    MAP_PRIVATE | MAP_ANONYMOUS, -1, 0);
+	if (base == MAP_FAILED) {
+		fprintf(stderr, "Error: cannot map %"PRIX64"\n", size);
+		return NULL;
+	}
+
+	if (fd != -1 && length) {
+		/* Overlay the file content on the first host pages */
+		file_map_size = (delta + length + host_page - 1) & ~(host_page - 1);
+		if (mmap(base, file_map_size, PROT_READ | PROT_WRITE,
+			 MAP_PRIVATE | MAP_FIXED, fd, offset - delta) == MAP_FAILED) {
+			munmap(base, map_size);
+			fprintf(stderr, "Error: cannot map file content\n");
+			return NULL;
+		}
+		/* The end of the last host page must stay null */
+		memset(base + delta + length, 0, file_map_size - delta - length);
+	}
+
+	mpn = malloc(sizeof(*mpn));
+	if (!mpn){
+		munmap(base, map_size);
+		fprintf(stderr, "Error: cannot alloc mpn\n");
+		return NULL;
+	}
+	mpn->name = malloc(strlen(name) + 1);
+	if (!mpn->name){
+		munmap(base, map_size);
+		free(mpn);
+		fprintf(stderr, "Error: cannot alloc\n");
+		return NULL;
+	}
+
+	mpn->ad = ad;
+	mpn->size = size;
+	mpn->access = access;
+	mpn->ad_hp = base + delta;
+	mpn->dirty = NULL;
+	mpn->map_base = base;
+	mpn->map_size = map_size;
 	strcpy(mpn->name, name);
 
 	return mpn;
@@ -1401,15 +1819,22 @@ void init_memory_breakpoint(vm_mngr_t* vm_mngr)
 }
 
 
+/* Free the content of @mpn */
+void free_memory_page_node(struct memory_page_node * mpn)
+{
+	if (mpn->map_base)
+		munmap(mpn->map_base, mpn->map_size);
+	else
+		free(mpn->ad_hp);
+	free(mpn->name);
+	free(mpn->dirty);
+}
+
 void reset_memory_page_pool(vm_mngr_t* vm_mngr)
 {
-	struct memory_page_node * mpn;
 	int i;
-	for (i=0;i<vm_mngr->memory_pages_number; i++) {
-		mpn = &vm_mngr->memory_pages_array[i];
-		free(mpn->ad_hp);
-		free(mpn->name);
-	}
+	for (i=0;i<vm_mngr->memory_pages_number; i++)
+		free_memory_page_node(&vm_mngr->memory_pages_array[i]);
 	free(vm_mngr->memory_pages_array);
 	vm_mngr->memory_pages_array = NULL;
 	vm_mngr->memory_pages_number = 0;
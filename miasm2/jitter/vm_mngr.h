@@ -57,6 +57,7 @@ LIST_HEAD(memory_breakpoint_info_head, memory_breakpoint_info);
 #define BREAKPOINT_WRITE 2
 
 #define BREAK_SIGALARM 1<<5
+#define BREAK_BLOCK_LIMIT 1<<6
 
 #define MAX_MEMORY_PAGE_POOL_TAB 0x100000
 #define MEMORY_PAGE_POOL_MASK_BIT 12
@@ -71,10 +72,60 @@ struct memory_page_node {
 	uint64_t access;
 	void* ad_hp;
 	char* name;
+	/* One byte per PAGE_SIZE chunk of the page, set if the chunk has been
+	 * written since the last snapshot / restore. NULL if untracked */
+	unsigned char* dirty;
+	/* Host mapping containing ad_hp if the page is mmap'ed, else NULL */
+	void* map_base;
+	uint64_t map_size;
 };
 
 
 
+/* Execution trace */
+#define TRACE_VERSION 1
+#define TRACE_REGS 1
+#define TRACE_MEM 2
+
+#define TRACE_RECORD_BLOCK 1
+#define TRACE_RECORD_READ 2
+#define TRACE_RECORD_WRITE 3
+#define TRACE_RECORD_REGS 4
+
+/* Biggest record: type, size, address, value */
+#define TRACE_RECORD_MAX 18
+/* Register deltas are recorded per TRACE_REGS_WORD bytes of the cpu state */
+#define TRACE_REGS_WORD 8
+
+struct trace_range {
+	uint64_t start;
+	uint64_t stop;
+};
+
+typedef struct {
+	FILE* file;
+	unsigned int flags;
+	/* Records are buffered, and written to file when the buffer is full */
+	unsigned char* buffer;
+	size_t buffer_size;
+	size_t buffer_pos;
+	/* Record one block out of sample blocks */
+	uint64_t sample;
+	uint64_t sample_count;
+	/* Only record blocks in these [start, stop[ ranges, if any */
+	struct trace_range* ranges;
+	size_t ranges_count;
+	/* Set if the current block is recorded */
+	int active;
+	/* Set if a write to file failed */
+	int error;
+	/* Cpu state, and its copy at the last recorded block */
+	unsigned char* regs;
+	unsigned char* regs_shadow;
+	size_t regs_size;
+}vm_trace_t;
+
+
 typedef struct {
 	int sex;
 	struct code_bloc_list_head code_bloc_pool;
@@ -90,6 +141,16 @@ typedef struct {
 	uint64_t exception_flags;
 	uint64_t exception_flags_new;
 	PyObject *addr2obj;
+
+	/* Identifier of the snapshot the dirty chunks are relative to */
+	uint64_t snapshot_id;
+
+	/* Execution trace, NULL if not tracing */
+	vm_trace_t* trace;
+
+	/* Block hit counters, indexed by block identifier */
+	uint64_t* coverage;
+	uint64_t coverage_size;
 }vm_mngr_t;
 
 
@@ -173,6 +234,23 @@ uint64_t MEM_LOOKUP_64_PASSTHROUGH(uint64_t addr);
 
 int vm_read_mem(vm_mngr_t* vm_mngr, uint64_t addr, char** buffer_ptr, uint64_t size);
 int vm_write_mem(vm_mngr_t* vm_mngr, uint64_t addr, char *buffer, uint64_t size);
+int vm_find_elem(vm_mngr_t* vm_mngr, uint64_t addr, char* elem, uint64_t size,
+		 uint64_t max_count, uint64_t* count);
+int vm_fill_mem(vm_mngr_t* vm_mngr, uint64_t addr, unsigned char value,
+		uint64_t size);
+int vm_cmp_mem(vm_mngr_t* vm_mngr, uint64_t addr1, uint64_t addr2,
+	       uint64_t size, int* result);
+
+vm_trace_t* vm_trace_new(FILE* file, unsigned int flags, size_t buffer_size,
+			 uint64_t sample, struct trace_range* ranges,
+			 size_t ranges_count, void* regs, size_t regs_size);
+int vm_trace_flush(vm_trace_t* trace);
+int vm_trace_free(vm_trace_t* trace);
+void vm_trace_block(vm_mngr_t* vm_mngr, uint64_t addr);
+void vm_trace_mem(vm_mngr_t* vm_mngr, int record, unsigned int size,
+		  uint64_t addr, uint64_t value);
+int vm_coverage_resize(vm_mngr_t* vm_mngr, uint64_t size);
+void vm_coverage_hit(vm_mngr_t* vm_mngr, uint64_t id);
 
 #define CC_P 1
 
@@ -266,6 +344,8 @@ struct code_bloc_node * create_code_bloc_node(uint64_t ad_start, uint64_t ad_sto
 void add_code_bloc(vm_mngr_t* vm_mngr, struct code_bloc_node* cbp);
 
 struct memory_page_node * create_memory_page_node(uint64_t ad, unsigned int size, unsigned int access, char* name);//memory_page* mp);
+struct memory_page_node * create_memory_page_node_mapped(uint64_t ad, uint64_t size, unsigned int access, char* name,
+							 int fd, uint64_t offset, uint64_t length);
 void init_memory_page_pool(vm_mngr_t* vm_mngr);
 void init_code_bloc_pool(vm_mngr_t* vm_mngr);
 void reset_memory_page_pool(vm_mngr_t* vm_mngr);
@@ -282,6 +362,9 @@ void remove_memory_breakpoint(vm_mngr_t* vm_mngr, uint64_t ad, unsigned int acce
 void add_memory_page(vm_mngr_t* vm_mngr, struct memory_page_node* mpn);
 
 void check_write_code_bloc(vm_mngr_t* vm_mngr, uint64_t my_size, uint64_t addr);
+int is_code_bloc_in_range(vm_mngr_t* vm_mngr, uint64_t addr, uint64_t size);
+void memory_page_set_dirty(struct memory_page_node * mpn, uint64_t ad, uint64_t size);
+void free_memory_page_node(struct memory_page_node * mpn);
 
 
 char* dump(vm_mngr_t* vm_mngr);
@@ -134,6 +134,69 @@ PyObject* vm_add_memory_page(VmMngr* self, PyObject* args)
 
 
 
+PyObject* vm_map_memory_page(VmMngr* self, PyObject* args)
+{
+	PyObject *addr;
+	PyObject *access;
+	PyObject *size;
+	PyObject *name=NULL;
+	PyObject *fileno=NULL;
+	PyObject *offset=NULL;
+	PyObject *length=NULL;
+	uint64_t page_addr;
+	uint64_t page_access;
+	uint64_t page_size;
+	uint64_t file_offset = 0;
+	uint64_t file_length = 0;
+	int fd = -1;
+	char* name_ptr;
+
+	struct memory_page_node * mpn;
+
+	if (!PyArg_ParseTuple(args, "OOO|OOOO", &addr, &access, &size, &name,
+			      &fileno, &offset, &length))
+		return NULL;
+
+	PyGetInt(addr, page_addr);
+	PyGetInt(access, page_access);
+	PyGetInt(size, page_size);
+
+	if (name == NULL) {
+		name_ptr = (char*)"";
+	} else {
+		if (!PyString_Check(name))
+			RAISE(PyExc_TypeError,"name must be str");
+		name_ptr = PyString_AsString(name);
+	}
+	if (fileno != NULL && fileno != Py_None) {
+		if (offset == NULL || length == NULL)
+			RAISE(PyExc_TypeError,"file offset and length are needed");
+		fd = PyObject_AsFileDescriptor(fileno);
+		if (fd == -1)
+			return NULL;
+		PyGetInt(offset, file_offset);
+		PyGetInt(length, file_length);
+	}
+
+	mpn = create_memory_page_node_mapped(page_addr, page_size, page_access,
+					     name_ptr, fd, file_offset,
+					     file_length);
+	if (mpn == NULL)
+		RAISE(PyExc_RuntimeError,"cannot create page");
+	if (is_mpn_in_tab(&self->vm_mngr, mpn)) {
+		free_memory_page_node(mpn);
+		free(mpn);
+		RAISE(PyExc_TypeError,"known page in memory");
+	}
+
+	add_memory_page(&self->vm_mngr, mpn);
+	free(mpn);
+
+	Py_INCREF(Py_None);
+	return Py_None;
+}
+
+
 PyObject* vm_set_mem_access(VmMngr* self, PyObject* args)
 {
 	PyObject *addr;
@@ -224,6 +287,414 @@ PyObject* vm_get_mem(VmMngr* self, PyObject* args)
 }
 
 
+/*
+ * Parse (addr[, max_count]) from @args. max_count defaults to no limit
+ */
+static int vm_parse_addr_max(PyObject* args, uint64_t* addr,
+			     uint64_t* max_count)
+{
+       PyObject *py_addr;
+       PyObject *py_max = Py_None;
+
+       if (!PyArg_ParseTuple(args, "O|O", &py_addr, &py_max))
+	      return -1;
+       if (!PyInt_Check(py_addr) && !PyLong_Check(py_addr)) {
+	      PyErr_SetString(PyExc_TypeError, "arg must be int");
+	      return -1;
+       }
+       *addr = PyInt_AsUnsignedLongLongMask(py_addr);
+       *max_count = (uint64_t)-1;
+       if (py_max == Py_None)
+	      return 0;
+       if (!PyInt_Check(py_max) && !PyLong_Check(py_max)) {
+	      PyErr_SetString(PyExc_TypeError, "arg must be int");
+	      return -1;
+       }
+       *max_count = PyInt_AsUnsignedLongLongMask(py_max);
+       return 0;
+}
+
+/*
+ * Read the string of @size bytes characters at @addr, up to its null
+ * character or @max_count characters
+ */
+static PyObject* vm_get_str_elem(VmMngr* self, PyObject* args, uint64_t size)
+{
+       uint64_t addr, max_count, count;
+       char end[2] = {0, 0};
+       char* buf_out;
+       PyObject *obj_out;
+
+       if (vm_parse_addr_max(args, &addr, &max_count) < 0)
+	      return NULL;
+       if (vm_find_elem(&self->vm_mngr, addr, end, size, max_count, &count) < 0)
+	      return NULL;
+       if (vm_read_mem(&self->vm_mngr, addr, &buf_out, count * size) < 0)
+	      return NULL;
+       obj_out = PyString_FromStringAndSize(buf_out, count * size);
+       free(buf_out);
+       return obj_out;
+}
+
+/*
+ * Return the length of the string of @size bytes characters at @addr, up to
+ * @max_count characters
+ */
+static PyObject* vm_str_elem_len(VmMngr* self, PyObject* args, uint64_t size)
+{
+       uint64_t addr, max_count, count;
+       char end[2] = {0, 0};
+
+       if (vm_parse_addr_max(args, &addr, &max_count) < 0)
+	      return NULL;
+       if (vm_find_elem(&self->vm_mngr, addr, end, size, max_count, &count) < 0)
+	      return NULL;
+       return PyLong_FromUnsignedLongLong(count);
+}
+
+PyObject* vm_strlen(VmMngr* self, PyObject* args)
+{
+       return vm_str_elem_len(self, args, 1);
+}
+
+PyObject* vm_wcslen(VmMngr* self, PyObject* args)
+{
+       return vm_str_elem_len(self, args, 2);
+}
+
+PyObject* vm_get_cstr(VmMngr* self, PyObject* args)
+{
+       return vm_get_str_elem(self, args, 1);
+}
+
+PyObject* vm_get_wstr(VmMngr* self, PyObject* args)
+{
+       return vm_get_str_elem(self, args, 2);
+}
+
+PyObject* vm_find_byte(VmMngr* self, PyObject* args)
+{
+       PyObject *py_addr;
+       PyObject *py_value;
+       PyObject *py_max = Py_None;
+       uint64_t addr, value, max_count, count;
+       char elem;
+
+       if (!PyArg_ParseTuple(args, "OO|O", &py_addr, &py_value, &py_max))
+	      return NULL;
+       PyGetInt(py_addr, addr);
+       PyGetInt(py_value, value);
+       max_count = (uint64_t)-1;
+       if (py_max != Py_None)
+	      PyGetInt(py_max, max_count);
+       elem = (char)value;
+
+       if (vm_find_elem(&self->vm_mngr, addr, &elem, 1, max_count, &count) < 0)
+	      return NULL;
+       if (count == max_count)
+	      return PyInt_FromLong(-1);
+       return PyLong_FromUnsignedLongLong(count);
+}
+
+PyObject* vm_memset(VmMngr* self, PyObject* args)
+{
+       PyObject *py_addr;
+       PyObject *py_value;
+       PyObject *py_size;
+       uint64_t addr, value, size;
+
+       if (!PyArg_ParseTuple(args, "OOO", &py_addr, &py_value, &py_size))
+	      return NULL;
+       PyGetInt(py_addr, addr);
+       PyGetInt(py_value, value);
+       PyGetInt(py_size, size);
+
+       if (vm_fill_mem(&self->vm_mngr, addr, (unsigned char)value, size) < 0)
+	      return NULL;
+
+       Py_INCREF(Py_None);
+       return Py_None;
+}
+
+PyObject* vm_memcmp(VmMngr* self, PyObject* args)
+{
+       PyObject *py_addr1;
+       PyObject *py_addr2;
+       PyObject *py_size;
+       uint64_t addr1, addr2, size;
+       int result;
+
+       if (!PyArg_ParseTuple(args, "OOO", &py_addr1, &py_addr2, &py_size))
+	      return NULL;
+       PyGetInt(py_addr1, addr1);
+       PyGetInt(py_addr2, addr2);
+       PyGetInt(py_size, size);
+
+       if (vm_cmp_mem(&self->vm_mngr, addr1, addr2, size, &result) < 0)
+	      return NULL;
+       return PyInt_FromLong(result < 0 ? -1 : (result > 0 ? 1 : 0));
+}
+
+/* Head of JitCpu instances, see JitCore.h */
+typedef struct {
+	PyObject_HEAD
+	PyObject *pyvm;
+	PyObject *jitter;
+	void* cpu;
+} JitCpu_head;
+
+/*
+ * Return 0 if @py_cpu is a JitCpu instance whose CPU state is at least
+ * @cpu_size bytes long. Else, set an exception and return -1
+ */
+static int check_jitcpu(PyObject* py_cpu, uint64_t cpu_size)
+{
+       const char* tp_name = Py_TYPE(py_cpu)->tp_name;
+       size_t name_len = strlen(tp_name);
+       PyObject* snapshot;
+       Py_ssize_t size;
+
+       /* Each architecture module defines its own JitCpu type */
+       if (Py_TYPE(py_cpu)->tp_basicsize != sizeof(JitCpu_head) ||
+	   name_len < 7 || strcmp(tp_name + name_len - 7, ".JitCpu")){
+	      PyErr_SetString(PyExc_TypeError, "cpu must be a JitCpu instance");
+	      return -1;
+       }
+
+       snapshot = PyObject_CallMethod(py_cpu, "snapshot", NULL);
+       if (!snapshot)
+	      return -1;
+       size = PyString_Size(snapshot);
+       Py_DECREF(snapshot);
+       if (size < 0)
+	      return -1;
+       if (cpu_size > (uint64_t)size){
+	      PyErr_SetString(PyExc_TypeError, "cpu_size exceeds the cpu state");
+	      return -1;
+       }
+       return 0;
+}
+
+static int trace_stop(VmMngr* self)
+{
+       int ret;
+
+       if (!self->vm_mngr.trace)
+	      return 0;
+       ret = vm_trace_free(self->vm_mngr.trace);
+       self->vm_mngr.trace = NULL;
+       Py_CLEAR(self->trace_cpu);
+       return ret;
+}
+
+/*
+ * trace_start(filename, flags, buffer_size, sample, ranges[, cpu, cpu_size])
+ * Record executed blocks in filename, see vm_trace_new. ranges is a list of
+ * (start, stop) addresses. cpu, a JitCpu instance whose state is cpu_size
+ * bytes long, is needed for TRACE_REGS
+ */
+PyObject* py_vm_trace_start(VmMngr* self, PyObject* args)
+{
+       char* fname;
+       unsigned int flags;
+       PyObject *py_buffer_size;
+       PyObject *py_sample;
+       PyObject *py_ranges;
+       PyObject *py_cpu = Py_None;
+       PyObject *py_cpu_size = NULL;
+       PyObject *item;
+       uint64_t buffer_size, sample, cpu_size = 0;
+       struct trace_range* ranges = NULL;
+       Py_ssize_t i, ranges_count;
+       void* regs = NULL;
+       FILE* file;
+       vm_trace_t* trace;
+
+       if (!PyArg_ParseTuple(args, "sIOOO|OO", &fname, &flags, &py_buffer_size,
+			     &py_sample, &py_ranges, &py_cpu, &py_cpu_size))
+	      return NULL;
+       PyGetInt(py_buffer_size, buffer_size);
+       PyGetInt(py_sample, sample);
+
+       if (flags & TRACE_REGS){
+	      if (py_cpu == Py_None || py_cpu_size == NULL)
+		      RAISE(PyExc_ValueError, "a cpu is needed to trace registers");
+	      PyGetInt(py_cpu_size, cpu_size);
+	      if (cpu_size > 0x10000)
+		      RAISE(PyExc_ValueError, "cpu state too big");
+	      if (check_jitcpu(py_cpu, cpu_size) < 0)
+		      return NULL;
+	      regs = ((JitCpu_head*)py_cpu)->cpu;
+       }
+
+       ranges_count = PySequence_Length(py_ranges);
+       if (ranges_count < 0)
+	      return NULL;
+       if (ranges_count){
+	      ranges = malloc(ranges_count * sizeof(struct trace_range));
+	      if (!ranges)
+		      return PyErr_NoMemory();
+       }
+       for (i = 0; i < ranges_count; i++){
+	      item = PySequence_GetItem(py_ranges, i);
+	      if (!item ||
+		  !PyArg_ParseTuple(item, "KK", &ranges[i].start,
+				    &ranges[i].stop)){
+		      Py_XDECREF(item);
+		      free(ranges);
+		      return NULL;
+	      }
+	      Py_DECREF(item);
+       }
+
+       file = fopen(fname, "wb");
+       if (!file){
+	      free(ranges);
+	      return PyErr_SetFromErrnoWithFilename(PyExc_IOError, fname);
+       }
+       trace = vm_trace_new(file, flags, buffer_size, sample, ranges,
+			    ranges_count, regs, cpu_size);
+       if (!trace){
+	      fclose(file);
+	      free(ranges);
+	      return PyErr_NoMemory();
+       }
+
+       if (trace_stop(self) < 0)
+	      PyErr_WarnEx(PyExc_RuntimeWarning, "previous trace is incomplete",
+			   1);
+       self->vm_mngr.trace = trace;
+       if (flags & TRACE_REGS){
+	      Py_INCREF(py_cpu);
+	      self->trace_cpu = py_cpu;
+       }
+
+       Py_INCREF(Py_None);
+       return Py_None;
+}
+
+PyObject* py_vm_trace_stop(VmMngr* self, PyObject* args)
+{
+       if (trace_stop(self) < 0)
+	      RAISE(PyExc_IOError, "cannot write trace");
+       Py_INCREF(Py_None);
+       return Py_None;
+}
+
+PyObject* py_vm_trace_flush(VmMngr* self, PyObject* args)
+{
+       if (self->vm_mngr.trace && vm_trace_flush(self->vm_mngr.trace) < 0)
+	      RAISE(PyExc_IOError, "cannot write trace");
+       Py_INCREF(Py_None);
+       return Py_None;
+}
+
+PyObject* py_vm_trace_is_active(VmMngr* self, PyObject* args)
+{
+       return PyBool_FromLong(self->vm_mngr.trace != NULL);
+}
+
+PyObject* py_vm_trace_block(VmMngr* self, PyObject* args)
+{
+       PyObject *py_addr;
+       uint64_t addr;
+
+       if (!PyArg_ParseTuple(args, "O", &py_addr))
+	      return NULL;
+       PyGetInt(py_addr, addr);
+
+       vm_trace_block(&self->vm_mngr, addr);
+       Py_INCREF(Py_None);
+       return Py_None;
+}
+
+PyObject* py_vm_coverage_resize(VmMngr* self, PyObject* args)
+{
+       PyObject *py_size;
+       uint64_t size;
+
+       if (!PyArg_ParseTuple(args, "O", &py_size))
+	      return NULL;
+       PyGetInt(py_size, size);
+
+       if (vm_coverage_resize(&self->vm_mngr, size) < 0)
+	      return NULL;
+       Py_INCREF(Py_None);
+       return Py_None;
+}
+
+PyObject* py_vm_coverage_hit(VmMngr* self, PyObject* args)
+{
+       PyObject *py_id;
+       uint64_t id;
+
+       if (!PyArg_ParseTuple(args, "O", &py_id))
+	      return NULL;
+       PyGetInt(py_id, id);
+
+       vm_coverage_hit(&self->vm_mngr, id);
+       Py_INCREF(Py_None);
+       return Py_None;
+}
+
+/*
+ * Return the list of the block hit counters
+ */
+PyObject* vm_get_coverage(VmMngr* self, PyObject* args)
+{
+       PyObject *counters;
+       PyObject *count;
+       uint64_t i;
+
+       counters = PyList_New(self->vm_mngr.coverage_size);
+       if (!counters)
+	      return NULL;
+       for (i = 0; i < self->vm_mngr.coverage_size; i++){
+	      count = PyLong_FromUnsignedLongLong(self->vm_mngr.coverage[i]);
+	      if (!count){
+		      Py_DECREF(counters);
+		      return NULL;
+	      }
+	      PyList_SET_ITEM(counters, i, count);
+       }
+       return counters;
+}
+
+PyObject* vm_reset_coverage(VmMngr* self, PyObject* args)
+{
+       if (self->vm_mngr.coverage)
+	      memset(self->vm_mngr.coverage, 0,
+		     self->vm_mngr.coverage_size * sizeof(uint64_t));
+       Py_INCREF(Py_None);
+       return Py_None;
+}
+
+/*
+ * trace_mem(is_write, size, addr, value): record a memory access of @size
+ * bytes
+ */
+PyObject* py_vm_trace_mem(VmMngr* self, PyObject* args)
+{
+       int is_write;
+       unsigned int size;
+       PyObject *py_addr;
+       PyObject *py_value;
+       uint64_t addr, value;
+
+       if (!PyArg_ParseTuple(args, "iIOO", &is_write, &size, &py_addr,
+			     &py_value))
+	      return NULL;
+       PyGetInt(py_addr, addr);
+       PyGetInt(py_value, value);
+
+       vm_trace_mem(&self->vm_mngr,
+		    is_write ? TRACE_RECORD_WRITE : TRACE_RECORD_READ,
+		    size, addr, value);
+       Py_INCREF(Py_None);
+       return Py_None;
+}
+
+
 PyObject* vm_add_memory_breakpoint(VmMngr* self, PyObject* args)
 {
 	PyObject *ad;
@@ -367,6 +838,10 @@ PyObject* vm_get_all_memory(VmMngr* self, PyObject* args)
 		PyDict_SetItemString(dict2, "access", o);
 		Py_DECREF(o);
 
+		o = PyString_FromString(mpn->name);
+		PyDict_SetItemString(dict2, "name", o);
+		Py_DECREF(o);
+
 		o = PyInt_FromLong((long)mpn->ad);
 		PyDict_SetItem(dict, o, dict2);
 		Py_DECREF(o);
@@ -375,6 +850,266 @@ PyObject* vm_get_all_memory(VmMngr* self, PyObject* args)
 	return dict;
 }
 
+/* Return the (address, size, access, name) of the memory pages */
+PyObject* vm_get_memory_pages(VmMngr* self, PyObject* args)
+{
+	struct memory_page_node * mpn;
+	PyObject *pages;
+	PyObject *page;
+	int i;
+
+	pages = PyTuple_New(self->vm_mngr.memory_pages_number);
+	if (pages == NULL)
+		return NULL;
+
+	for (i=0;i<self->vm_mngr.memory_pages_number; i++) {
+		mpn = &self->vm_mngr.memory_pages_array[i];
+		page = Py_BuildValue("(KKKs)",
+				     (unsigned PY_LONG_LONG)mpn->ad,
+				     (unsigned PY_LONG_LONG)mpn->size,
+				     (unsigned PY_LONG_LONG)mpn->access,
+				     mpn->name);
+		if (page == NULL) {
+			Py_DECREF(pages);
+			return NULL;
+		}
+		PyTuple_SET_ITEM(pages, i, page);
+	}
+	return pages;
+}
+
+
+/* Snapshot identifiers, unique among VmMngr instances */
+static uint64_t vm_snapshot_counter = 0;
+
+PyObject* vm_snapshot(VmMngr* self, PyObject* args)
+{
+	struct memory_page_node * mpn;
+	PyObject *pages;
+	PyObject *page;
+	uint64_t chunks;
+	int i;
+
+	pages = PyTuple_New(self->vm_mngr.memory_pages_number);
+	if (pages == NULL)
+		return NULL;
+
+	for (i=0;i<self->vm_mngr.memory_pages_number; i++) {
+		mpn = &self->vm_mngr.memory_pages_array[i];
+
+		/* Start tracking writes from now */
+		chunks = (mpn->size + PAGE_SIZE - 1) >> MEMORY_PAGE_POOL_MASK_BIT;
+		if (mpn->dirty == NULL) {
+			mpn->dirty = calloc(chunks + 1, 1);
+			if (mpn->dirty == NULL) {
+				Py_DECREF(pages);
+				return PyErr_NoMemory();
+			}
+		} else
+			memset(mpn->dirty, 0, chunks);
+
+		page = Py_BuildValue("(KKKss#)",
+				     (unsigned PY_LONG_LONG)mpn->ad,
+				     (unsigned PY_LONG_LONG)mpn->size,
+				     (unsigned PY_LONG_LONG)mpn->access,
+				     mpn->name,
+				     mpn->ad_hp, (int)mpn->size);
+		if (page == NULL) {
+			Py_DECREF(pages);
+			return NULL;
+		}
+		PyTuple_SET_ITEM(pages, i, page);
+	}
+
+	self->vm_mngr.snapshot_id = ++vm_snapshot_counter;
+	return Py_BuildValue("(KKN)",
+			     (unsigned PY_LONG_LONG)self->vm_mngr.snapshot_id,
+			     (unsigned PY_LONG_LONG)self->vm_mngr.exception_flags,
+			     pages);
+}
+
+/* Record [@addr, @addr + @size[ in @modified if it overlaps a code bloc */
+static int vm_restore_modified(vm_mngr_t* vm_mngr, PyObject* modified,
+			       uint64_t addr, uint64_t size)
+{
+	PyObject *o;
+	int ret;
+
+	if (size == 0 || !is_code_bloc_in_range(vm_mngr, addr, size))
+		return 0;
+	o = Py_BuildValue("(KK)", (unsigned PY_LONG_LONG)addr,
+			  (unsigned PY_LONG_LONG)size);
+	if (o == NULL)
+		return -1;
+	ret = PyList_Append(modified, o);
+	Py_DECREF(o);
+	return ret;
+}
+
+PyObject* vm_restore(VmMngr* self, PyObject* args)
+{
+	vm_mngr_t* vm_mngr = &self->vm_mngr;
+	PyObject *pages;
+	PyObject *modified;
+	struct memory_page_node * mpn;
+	struct memory_page_node * pages_array;
+	unsigned PY_LONG_LONG snapshot_id, exception_flags;
+	unsigned PY_LONG_LONG ad, size, access, prev_ad = 0;
+	uint64_t chunks, start, stop, offset, len;
+	char *name, *data;
+	int data_len;
+	int incremental, pages_number, i, cur, err = 0;
+
+	if (!PyArg_ParseTuple(args, "(KKO!)", &snapshot_id, &exception_flags,
+			      &PyTuple_Type, &pages))
+		return NULL;
+
+	/* Check the snapshot before modifying anything */
+	pages_number = PyTuple_GET_SIZE(pages);
+	for (i = 0; i < pages_number; i++) {
+		if (!PyArg_ParseTuple(PyTuple_GET_ITEM(pages, i), "KKKss#",
+				      &ad, &size, &access, &name,
+				      &data, &data_len))
+			return NULL;
+		if ((uint64_t)data_len != size || (i && ad <= prev_ad))
+			RAISE(PyExc_ValueError, "invalid snapshot");
+		prev_ad = ad;
+	}
+
+	modified = PyList_New(0);
+	if (modified == NULL)
+		return NULL;
+	pages_array = calloc(pages_number + 1, sizeof(*pages_array));
+	if (pages_array == NULL) {
+		Py_DECREF(modified);
+		return PyErr_NoMemory();
+	}
+
+	/* Allocate the pages to create and the missing dirty chunks maps
+	 * before modifying anything, so that the VM is left untouched on
+	 * failure. The name of pages_array[i] is only set for created pages */
+	cur = 0;
+	for (i = 0; i < pages_number; i++) {
+		PyArg_ParseTuple(PyTuple_GET_ITEM(pages, i), "KKKss#",
+				 &ad, &size, &access, &name, &data, &data_len);
+		while (cur < vm_mngr->memory_pages_number &&
+		       vm_mngr->memory_pages_array[cur].ad < ad)
+			cur++;
+		mpn = NULL;
+		if (cur < vm_mngr->memory_pages_number &&
+		    vm_mngr->memory_pages_array[cur].ad == ad) {
+			mpn = &vm_mngr->memory_pages_array[cur++];
+			if (mpn->size != size)
+				mpn = NULL;
+		}
+		if (mpn == NULL) {
+			mpn = create_memory_page_node(ad, size, access, name);
+			if (mpn == NULL)
+				goto nomem;
+			pages_array[i] = *mpn;
+			free(mpn);
+		} else if (mpn->dirty != NULL)
+			continue;
+		chunks = (size + PAGE_SIZE - 1) >> MEMORY_PAGE_POOL_MASK_BIT;
+		pages_array[i].dirty = calloc(chunks + 1, 1);
+		if (pages_array[i].dirty == NULL)
+			goto nomem;
+		memset(pages_array[i].dirty, 1, chunks);
+	}
+
+	/* Only chunks written since the snapshot have to be copied back if
+	 * the VM state is relative to it */
+	incremental = (snapshot_id == vm_mngr->snapshot_id);
+	cur = 0;
+	for (i = 0; i < pages_number; i++) {
+		PyArg_ParseTuple(PyTuple_GET_ITEM(pages, i), "KKKss#",
+				 &ad, &size, &access, &name, &data, &data_len);
+
+		/* Drop pages added since the snapshot */
+		while (cur < vm_mngr->memory_pages_number &&
+		       vm_mngr->memory_pages_array[cur].ad < ad) {
+			mpn = &vm_mngr->memory_pages_array[cur++];
+			err |= vm_restore_modified(vm_mngr, modified,
+						   mpn->ad, mpn->size);
+			free_memory_page_node(mpn);
+		}
+
+		mpn = NULL;
+		if (cur < vm_mngr->memory_pages_number &&
+		    vm_mngr->memory_pages_array[cur].ad == ad) {
+			mpn = &vm_mngr->memory_pages_array[cur++];
+			if (mpn->size != size) {
+				err |= vm_restore_modified(vm_mngr, modified,
+							   mpn->ad, mpn->size);
+				free_memory_page_node(mpn);
+				mpn = NULL;
+			}
+		}
+
+		chunks = (size + PAGE_SIZE - 1) >> MEMORY_PAGE_POOL_MASK_BIT;
+		if (mpn == NULL) {
+			/* Page removed or replaced since the snapshot, created
+			 * above with all its chunks to copy */
+			mpn = &pages_array[i];
+		} else if (mpn->dirty == NULL) {
+			/* Untracked page: copy it entirely */
+			mpn->dirty = pages_array[i].dirty;
+		}
+
+		mpn->access = access;
+		if (!incremental) {
+			memcpy(mpn->ad_hp, data, size);
+			err |= vm_restore_modified(vm_mngr, modified, ad, size);
+		} else {
+			/* Copy back runs of written chunks */
+			for (start = 0; start < chunks; start = stop) {
+				stop = start + 1;
+				if (!mpn->dirty[start])
+					continue;
+				while (stop < chunks && mpn->dirty[stop])
+					stop++;
+				offset = start << MEMORY_PAGE_POOL_MASK_BIT;
+				len = MIN(size, stop << MEMORY_PAGE_POOL_MASK_BIT) - offset;
+				memcpy(mpn->ad_hp + offset, data + offset, len);
+				err |= vm_restore_modified(vm_mngr, modified,
+							   ad + offset, len);
+			}
+		}
+		memset(mpn->dirty, 0, chunks);
+		pages_array[i] = *mpn;
+	}
+
+	/* Drop remaining pages added since the snapshot */
+	for (; cur < vm_mngr->memory_pages_number; cur++) {
+		mpn = &vm_mngr->memory_pages_array[cur];
+		err |= vm_restore_modified(vm_mngr, modified, mpn->ad, mpn->size);
+		free_memory_page_node(mpn);
+	}
+
+	free(vm_mngr->memory_pages_array);
+	vm_mngr->memory_pages_array = pages_array;
+	vm_mngr->memory_pages_number = pages_number;
+	vm_mngr->snapshot_id = snapshot_id;
+	vm_mngr->exception_flags = exception_flags;
+
+	if (err) {
+		Py_DECREF(modified);
+		return NULL;
+	}
+	return modified;
+
+nomem:
+	for (; i >= 0; i--) {
+		if (pages_array[i].name != NULL)
+			free_memory_page_node(&pages_array[i]);
+		else
+			free(pages_array[i].dirty);
+	}
+	free(pages_array);
+	Py_DECREF(modified);
+	return PyErr_NoMemory();
+}
+
 
 PyObject* vm_reset_memory_page_pool(VmMngr* self, PyObject* args)
 {
@@ -484,6 +1219,8 @@ VmMngr_dealloc(VmMngr* self)
     vm_reset_memory_page_pool(self, NULL);
     vm_reset_code_bloc_pool(self, NULL);
     vm_reset_memory_breakpoint(self, NULL);
+    trace_stop(self);
+    free(self->vm_mngr.coverage);
     self->ob_type->tp_free((PyObject*)self);
 }
 
@@ -533,8 +1270,44 @@ static PyMethodDef VmMngr_methods[] = {
 	 "X"},
 	{"get_mem", (PyCFunction)vm_get_mem, METH_VARARGS,
 	 "X"},
+	{"get_cstr", (PyCFunction)vm_get_cstr, METH_VARARGS,
+	 "X"},
+	{"get_wstr", (PyCFunction)vm_get_wstr, METH_VARARGS,
+	 "X"},
+	{"strlen", (PyCFunction)vm_strlen, METH_VARARGS,
+	 "X"},
+	{"wcslen", (PyCFunction)vm_wcslen, METH_VARARGS,
+	 "X"},
+	{"find_byte", (PyCFunction)vm_find_byte, METH_VARARGS,
+	 "X"},
+	{"memset", (PyCFunction)vm_memset, METH_VARARGS,
+	 "X"},
+	{"memcmp", (PyCFunction)vm_memcmp, METH_VARARGS,
+	 "X"},
+	{"trace_start", (PyCFunction)py_vm_trace_start, METH_VARARGS,
+	 "X"},
+	{"trace_stop", (PyCFunction)py_vm_trace_stop, METH_NOARGS,
+	 "X"},
+	{"trace_flush", (PyCFunction)py_vm_trace_flush, METH_NOARGS,
+	 "X"},
+	{"trace_is_active", (PyCFunction)py_vm_trace_is_active, METH_NOARGS,
+	 "X"},
+	{"trace_block", (PyCFunction)py_vm_trace_block, METH_VARARGS,
+	 "X"},
+	{"trace_mem", (PyCFunction)py_vm_trace_mem, METH_VARARGS,
+	 "X"},
+	{"coverage_resize", (PyCFunction)py_vm_coverage_resize, METH_VARARGS,
+	 "X"},
+	{"coverage_hit", (PyCFunction)py_vm_coverage_hit, METH_VARARGS,
+	 "X"},
+	{"get_coverage", (PyCFunction)vm_get_coverage, METH_NOARGS,
+	 "X"},
+	{"reset_coverage", (PyCFunction)vm_reset_coverage, METH_NOARGS,
+	 "X"},
 	{"add_memory_page",(PyCFunction)vm_add_memory_page, METH_VARARGS,
 	 "X"},
+	{"map_memory_page",(PyCFunction)vm_map_memory_page, METH_VARARGS,
+	 "X"},
 	{"add_memory_breakpoint",(PyCFunction)vm_add_memory_breakpoint, METH_VARARGS,
 	 "X"},
 	{"remove_memory_breakpoint",(PyCFunction)vm_remove_memory_breakpoint, METH_VARARGS,
@@ -545,6 +1318,12 @@ static PyMethodDef VmMngr_methods[] = {
 	 "X"},
 	{"get_all_memory",(PyCFunction)vm_get_all_memory, METH_VARARGS,
 	 "X"},
+	{"get_memory_pages",(PyCFunction)vm_get_memory_pages, METH_NOARGS,
+	 "X"},
+	{"snapshot",(PyCFunction)vm_snapshot, METH_NOARGS,
+	 "X"},
+	{"restore",(PyCFunction)vm_restore, METH_VARARGS,
+	 "X"},
 	{"reset_memory_page_pool", (PyCFunction)vm_reset_memory_page_pool, METH_VARARGS,
 	 "X"},
 	{"reset_memory_breakpoint", (PyCFunction)vm_reset_memory_breakpoint, METH_VARARGS,
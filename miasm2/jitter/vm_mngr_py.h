@@ -7,6 +7,8 @@ typedef struct {
 	PyObject_HEAD
 	PyObject *vmmngr;
 	vm_mngr_t vm_mngr;
+	/* JitCpu whose state is traced, if any */
+	PyObject *trace_cpu;
 } VmMngr;
 
 
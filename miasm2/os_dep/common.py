@@ -1,29 +1,27 @@
 import os
+import logging
 
 from miasm2.jitter.csts import PAGE_READ, PAGE_WRITE
 from miasm2.core.utils import get_caller_name
 
+log = logging.getLogger("os_dep")
+hnd = logging.StreamHandler()
+hnd.setFormatter(logging.Formatter("[%(levelname)s]: %(message)s"))
+log.addHandler(hnd)
+log.setLevel(logging.WARNING)
+
 BASE_SB_PATH = "file_sb"
 
 
 def get_str_ansi(jitter, ad_str, max_char=None):
-    l = 0
-    tmp = ad_str
-    while ((max_char is None or l < max_char) and
-           jitter.vm.get_mem(tmp, 1) != "\x00"):
-        tmp += 1
-        l += 1
-    return jitter.vm.get_mem(ad_str, l)
+    return jitter.vm.get_cstr(ad_str, max_char)
 
 
 def get_str_unic(jitter, ad_str, max_char=None):
-    l = 0
-    tmp = ad_str
-    while ((max_char is None or l < max_char) and
-           jitter.vm.get_mem(tmp, 2) != "\x00\x00"):
-        tmp += 2
-        l += 2
-    s = jitter.vm.get_mem(ad_str, l)
+    # @max_char is a bytes count
+    if max_char is not None:
+        max_char = (max_char + 1) / 2
+    s = jitter.vm.get_wstr(ad_str, max_char)
     # TODO: real unicode decoding
     s = s[::2]
     return s
@@ -40,13 +38,46 @@ def set_str_unic(s):
 
 class heap(object):
 
-    "Light heap simulation"
+    """Light heap simulation
+
+    Small allocations are carved out of arenas of arena_size bytes, in chunks
+    whose sizes are powers of two from min_chunk to max_chunk. Freed chunks
+    are kept in a free list per size, for reuse. Bigger allocations, and
+    allocations with specific permissions, are mapped in their own pages
+    ("regions"); freed regions lose their access rights until reused.
+
+    If redzone is set, each chunk is surrounded by red-zones of (at least)
+    this size, filled with redzone_byte, and checked on free and realloc.
+    """
 
     addr = 0x20000000
     align = 0x1000
     size = 32
     mask = (1 << size) - 1
 
+    arena_size = 0x100000
+    min_chunk = 0x10
+    max_chunk = 0x10000
+    redzone = 0
+    redzone_byte = 0xfd
+
+    def __init__(self, redzone=None):
+        """
+        @redzone: (optional) debug red-zones size, default is self.redzone
+        """
+        if redzone is not None:
+            self.redzone = redzone
+        # chunk address -> (size, chunk size, red-zone size)
+        self.chunks = {}
+        # chunk size -> free chunks base addresses
+        self.free_chunks = {}
+        # current arena free space
+        self.arena_cur = self.arena_end = 0
+        # region address -> size
+        self.regions = {}
+        # region size -> freed regions addresses
+        self.free_regions = {}
+
     def next_addr(self, size):
         """
         @size: the size to allocate
@@ -72,11 +103,170 @@ class heap(object):
         @perm: permission flags (PAGE_READ, PAGE_WRITE, PAGE_EXEC or any `|`
             combination of them); default is PAGE_READ|PAGE_WRITE
         """
-        addr = self.next_addr(size)
-        vm.add_memory_page(addr, perm, "\x00" * size,
-                           "Heap alloc by %s" % get_caller_name(2))
+        if perm == PAGE_READ | PAGE_WRITE:
+            return self.malloc(vm, size)
+        return self.map_region(vm, size, perm,
+                               "Heap alloc by %s" % get_caller_name(2))
+
+    def map_region(self, vm, size, perm=PAGE_READ | PAGE_WRITE,
+                   name="Heap region"):
+        """Map a zeroed region of @size bytes (rounded to pages), reusing a
+        freed region of the same size if any, and return its address
+        @vm: a VmMngr instance
+        @size: the size to allocate
+        @perm: permission flags
+        @name: memory page name
+        """
+        size = max(self.align, (size + self.align - 1) & ~(self.align - 1))
+        free = self.free_regions.get(size)
+        if free:
+            addr = free.pop()
+            vm.set_mem_access(addr, perm)
+            vm.memset(addr, 0, size)
+        else:
+            addr = self.next_addr(size)
+            vm.add_memory_page(addr, perm, "\x00" * size, name)
+        self.regions[addr] = size
         return addr
 
+    def unmap_region(self, vm, addr):
+        """Free the region at @addr: it is no longer accessible until reused.
+        Return False if @addr is not a region
+        @vm: a VmMngr instance
+        @addr: region address
+        """
+        size = self.regions.pop(addr, None)
+        if size is None:
+            return False
+        vm.set_mem_access(addr, 0)
+        self.free_regions.setdefault(size, []).append(addr)
+        return True
+
+    def chunk_size(self, size):
+        """Return the size of the chunk holding @size bytes, red-zones
+        included"""
+        size += 2 * self.redzone_size()
+        chunk_size = self.min_chunk
+        while chunk_size < size:
+            chunk_size <<= 1
+        return chunk_size
+
+    def redzone_size(self):
+        "Return the red-zone size, aligned on min_chunk"
+        return (self.redzone + self.min_chunk - 1) & ~(self.min_chunk - 1)
+
+    def malloc(self, vm, size):
+        """Allocate @size zeroed bytes and return their address
+        @vm: a VmMngr instance
+        @size: the size to allocate
+        """
+        redzone = self.redzone_size()
+        chunk_size = self.chunk_size(max(size, 1))
+        if chunk_size > self.max_chunk:
+            base = self.map_region(vm, chunk_size)
+            chunk_size = self.regions[base]
+        else:
+            free = self.free_chunks.get(chunk_size)
+            if free:
+                base = free.pop()
+                vm.memset(base, 0, chunk_size)
+            else:
+                if self.arena_cur + chunk_size > self.arena_end:
+                    self.arena_cur = self.next_addr(self.arena_size)
+                    self.arena_end = self.arena_cur + self.arena_size
+                    vm.add_memory_page(self.arena_cur,
+                                       PAGE_READ | PAGE_WRITE,
+                                       "\x00" * self.arena_size, "Heap arena")
+                base = self.arena_cur
+                self.arena_cur += chunk_size
+        addr = base + redzone
+        self.chunks[addr] = (size, chunk_size, redzone)
+        if redzone:
+            vm.memset(base, self.redzone_byte, redzone)
+            vm.memset(addr + size, self.redzone_byte,
+                      chunk_size - redzone - size)
+        return addr
+
+    def check_chunk(self, vm, addr):
+        """Raise a ValueError if the red-zones of the chunk at @addr have been
+        overwritten
+        @vm: a VmMngr instance
+        @addr: chunk address
+        """
+        size, chunk_size, redzone = self.chunks[addr]
+        if not redzone:
+            return
+        fill = chr(self.redzone_byte)
+        after = chunk_size - redzone - size
+        if (vm.get_mem(addr - redzone, redzone) != fill * redzone or
+                vm.get_mem(addr + size, after) != fill * after):
+            raise ValueError("heap corruption around chunk 0x%x (size 0x%x)" %
+                             (addr, size))
+
+    def check(self, vm):
+        """Check the red-zones of every allocated chunk (see check_chunk)
+        @vm: a VmMngr instance
+        """
+        for addr in self.chunks:
+            self.check_chunk(vm, addr)
+
+    def msize(self, addr):
+        """Return the size of the chunk at @addr, or None if it is not
+        allocated"""
+        chunk = self.chunks.get(addr)
+        return None if chunk is None else chunk[0]
+
+    def free(self, vm, addr):
+        """Free the chunk at @addr. Return False if @addr is not allocated
+        @vm: a VmMngr instance
+        @addr: chunk address
+        """
+        if addr not in self.chunks:
+            if addr:
+                log.warning("free of unknown chunk 0x%x", addr)
+            return False
+        self.check_chunk(vm, addr)
+        size, chunk_size, redzone = self.chunks.pop(addr)
+        base = addr - redzone
+        if chunk_size > self.max_chunk:
+            self.unmap_region(vm, base)
+        else:
+            if redzone:
+                # Poison freed chunks
+                vm.memset(base, self.redzone_byte, chunk_size)
+            self.free_chunks.setdefault(chunk_size, []).append(base)
+        return True
+
+    def realloc(self, vm, addr, size):
+        """Resize the chunk at @addr to @size bytes, moving it if needed, and
+        return its new address (0 on error, or if @size is 0)
+        @vm: a VmMngr instance
+        @addr: chunk address, or 0 to allocate a new chunk
+        @size: new size
+        """
+        if not addr:
+            return self.malloc(vm, size)
+        if addr not in self.chunks:
+            log.warning("realloc of unknown chunk 0x%x", addr)
+            return 0
+        if not size:
+            self.free(vm, addr)
+            return 0
+        self.check_chunk(vm, addr)
+        old_size, chunk_size, redzone = self.chunks[addr]
+        if size + 2 * redzone <= chunk_size:
+            # In place
+            self.chunks[addr] = (size, chunk_size, redzone)
+            if size > old_size:
+                vm.memset(addr + old_size, 0, size - old_size)
+            elif redzone:
+                vm.memset(addr + size, self.redzone_byte, old_size - size)
+            return addr
+        new_addr = self.malloc(vm, size)
+        vm.set_mem(new_addr, vm.get_mem(addr, min(old_size, size)))
+        self.free(vm, addr)
+        return new_addr
+
 
 def windows_to_sbpath(path):
     """Convert a Windows path to a valid filename within the sandbox
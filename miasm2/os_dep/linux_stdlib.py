@@ -53,7 +53,7 @@ def xxx_memset(jitter):
     byte c.'''
 
     ret_addr, args = jitter.func_args_stdcall(['dest', 'c', 'n'])
-    jitter.vm.set_mem(args.dest, chr(args.c & 0xFF) * args.n)
+    jitter.vm.memset(args.dest, args.c & 0xFF, args.n)
     return jitter.func_ret_stdcall(ret_addr, args.dest)
 
 
@@ -65,28 +65,18 @@ def xxx_puts(jitter):
     writes the string s and a trailing newline to stdout.
     '''
     ret_addr, args = jitter.func_args_stdcall(['s'])
-    index = args.s
-    char = jitter.vm.get_mem(index, 1)
-    while char != '\x00':
-        stdout.write(char)
-        index += 1
-        char = jitter.vm.get_mem(index, 1)
+    stdout.write(jitter.vm.get_cstr(args.s))
     stdout.write('\n')
     return jitter.func_ret_stdcall(ret_addr, 1)
 
 
 def get_fmt_args(jitter, fmt, cur_arg):
     output = ""
-    while True:
-        char = jitter.vm.get_mem(fmt, 1)
-        fmt += 1
-        if char == '\x00':
-            break
+    fmt = iter(jitter.vm.get_cstr(fmt))
+    for char in fmt:
         if char == '%':
             token = '%'
-            while True:
-                char = jitter.vm.get_mem(fmt, 1)
-                fmt += 1
+            for char in fmt:
                 token += char
                 if char.lower() in '%cdfsux':
                     break
@@ -138,8 +128,7 @@ def xxx_strcpy(jitter):
 
 def xxx_strlen(jitter):
     ret_ad, args = jitter.func_args_stdcall(["src"])
-    str_src = jitter.get_str_ansi(args.src)
-    jitter.func_ret_stdcall(ret_ad, len(str_src))
+    jitter.func_ret_stdcall(ret_ad, jitter.vm.strlen(args.src))
 
 
 def xxx_malloc(jitter):
@@ -148,8 +137,21 @@ def xxx_malloc(jitter):
     jitter.func_ret_stdcall(ret_ad, addr)
 
 
+def xxx_calloc(jitter):
+    ret_ad, args = jitter.func_args_stdcall(["nmemb", "msize"])
+    addr = linobjs.heap.alloc(jitter, args.nmemb * args.msize)
+    jitter.func_ret_stdcall(ret_ad, addr)
+
+
+def xxx_realloc(jitter):
+    ret_ad, args = jitter.func_args_stdcall(["ptr", "msize"])
+    addr = linobjs.heap.realloc(jitter.vm, args.ptr, args.msize)
+    jitter.func_ret_stdcall(ret_ad, addr)
+
+
 def xxx_free(jitter):
     ret_ad, args = jitter.func_args_stdcall(["ptr"])
+    linobjs.heap.free(jitter.vm, args.ptr)
     jitter.func_ret_stdcall(ret_ad, 0)
 
 
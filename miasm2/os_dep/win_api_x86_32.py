@@ -251,8 +251,21 @@ def kernel32_HeapAlloc(jitter):
 
 
 def kernel32_HeapFree(jitter):
-    ret_ad, _ = jitter.func_args_stdcall(["heap", "flags", "pmem"])
-    jitter.func_ret_stdcall(ret_ad, 1)
+    ret_ad, args = jitter.func_args_stdcall(["heap", "flags", "pmem"])
+    ret = 1 if not args.pmem or winobjs.heap.free(jitter.vm, args.pmem) else 0
+    jitter.func_ret_stdcall(ret_ad, ret)
+
+
+def kernel32_HeapReAlloc(jitter):
+    ret_ad, args = jitter.func_args_stdcall(["heap", "flags", "pmem", "size"])
+    alloc_addr = winobjs.heap.realloc(jitter.vm, args.pmem, args.size)
+    jitter.func_ret_stdcall(ret_ad, alloc_addr)
+
+
+def kernel32_HeapSize(jitter):
+    ret_ad, args = jitter.func_args_stdcall(["heap", "flags", "pmem"])
+    size = winobjs.heap.msize(args.pmem)
+    jitter.func_ret_stdcall(ret_ad, 0xffffffff if size is None else size)
 
 
 def kernel32_GlobalAlloc(jitter):
@@ -262,8 +275,11 @@ def kernel32_GlobalAlloc(jitter):
 
 
 def kernel32_LocalFree(jitter):
-    ret_ad, _ = jitter.func_args_stdcall(["lpvoid"])
-    jitter.func_ret_stdcall(ret_ad, 0)
+    ret_ad, args = jitter.func_args_stdcall(["lpvoid"])
+    if not args.lpvoid or winobjs.heap.free(jitter.vm, args.lpvoid):
+        jitter.func_ret_stdcall(ret_ad, 0)
+    else:
+        jitter.func_ret_stdcall(ret_ad, args.lpvoid)
 
 
 def kernel32_LocalAlloc(jitter):
@@ -273,8 +289,11 @@ def kernel32_LocalAlloc(jitter):
 
 
 def kernel32_GlobalFree(jitter):
-    ret_ad, _ = jitter.func_args_stdcall(["addr"])
-    jitter.func_ret_stdcall(ret_ad, 0)
+    ret_ad, args = jitter.func_args_stdcall(["addr"])
+    if not args.addr or winobjs.heap.free(jitter.vm, args.addr):
+        jitter.func_ret_stdcall(ret_ad, 0)
+    else:
+        jitter.func_ret_stdcall(ret_ad, args.addr)
 
 
 def kernel32_IsDebuggerPresent(jitter):
@@ -736,9 +755,8 @@ def kernel32_VirtualAlloc(jitter):
         raise ValueError('unknown access dw!')
 
     if args.lpvoid == 0:
-        alloc_addr = winobjs.heap.next_addr(args.dwsize)
-        jitter.vm.add_memory_page(
-            alloc_addr, access_dict[args.flprotect], "\x00" * args.dwsize,
+        alloc_addr = winobjs.heap.map_region(
+            jitter.vm, args.dwsize, access_dict[args.flprotect],
             "Alloc in %s ret 0x%X" % (whoami(), ret_ad))
     else:
         all_mem = jitter.vm.get_all_memory()
@@ -746,10 +764,9 @@ def kernel32_VirtualAlloc(jitter):
             alloc_addr = args.lpvoid
             jitter.vm.set_mem_access(args.lpvoid, access_dict[args.flprotect])
         else:
-            alloc_addr = winobjs.heap.next_addr(args.dwsize)
             # alloc_addr = args.lpvoid
-            jitter.vm.add_memory_page(
-                alloc_addr, access_dict[args.flprotect], "\x00" * args.dwsize,
+            alloc_addr = winobjs.heap.map_region(
+                jitter.vm, args.dwsize, access_dict[args.flprotect],
                 "Alloc in %s ret 0x%X" % (whoami(), ret_ad))
 
     log.info('VirtualAlloc addr: 0x%x', alloc_addr)
@@ -757,8 +774,13 @@ def kernel32_VirtualAlloc(jitter):
 
 
 def kernel32_VirtualFree(jitter):
-    ret_ad, _ = jitter.func_args_stdcall(["lpvoid", "dwsize", "alloc_type"])
-    jitter.func_ret_stdcall(ret_ad, 0)
+    ret_ad, args = jitter.func_args_stdcall(["lpvoid", "dwsize", "alloc_type"])
+    # MEM_RELEASE
+    if args.alloc_type & 0x8000:
+        ret = 1 if winobjs.heap.unmap_region(jitter.vm, args.lpvoid) else 0
+    else:
+        ret = 1
+    jitter.func_ret_stdcall(ret_ad, ret)
 
 
 def user32_GetWindowLongA(jitter):
@@ -920,7 +942,7 @@ def kernel32_GetProcAddress(jitter):
     else:
         ad = 0
     log.info("GetProcAddress %r %r ret 0x%x", args.libbase, fname, ad)
-    jitter.add_breakpoint(ad, jitter.handle_lib)
+    jitter.handle_function(ad)
     jitter.func_ret_stdcall(ret_ad, ad)
 
 
@@ -1347,11 +1369,7 @@ def ntoskrnl_ExAllocatePoolWithTagPriority(jitter):
     ret_ad, args = jitter.func_args_stdcall(["pool_type",
                                              "nbr_of_bytes",
                                              "tag", "priority"])
-    alloc_addr = winobjs.heap.next_addr(args.nbr_of_bytes)
-    jitter.vm.add_memory_page(
-        alloc_addr, PAGE_READ | PAGE_WRITE, "\x00" * args.nbr_of_bytes,
-        "Alloc in %s ret 0x%X" % (whoami(), ret_ad))
-
+    alloc_addr = winobjs.heap.alloc(jitter, args.nbr_of_bytes)
     jitter.func_ret_stdcall(ret_ad, alloc_addr)
 
 
@@ -1411,22 +1429,21 @@ def kernel32_lstrcpyn(jitter):
     jitter.func_ret_stdcall(ret_ad, args.ptr_str1)
 
 
-def my_strlen(jitter, funcname, get_str, mylen):
+def my_strlen(jitter, funcname, mylen):
     ret_ad, args = jitter.func_args_stdcall(["src"])
-    src = get_str(jitter, args.src)
-    jitter.func_ret_stdcall(ret_ad, mylen(src))
+    jitter.func_ret_stdcall(ret_ad, mylen(args.src))
 
 
 def kernel32_lstrlenA(jitter):
-    my_strlen(jitter, whoami(), get_str_ansi, len)
+    my_strlen(jitter, whoami(), jitter.vm.strlen)
 
 
 def kernel32_lstrlenW(jitter):
-    my_strlen(jitter, whoami(), get_str_unic, len)
+    my_strlen(jitter, whoami(), jitter.vm.wcslen)
 
 
 def kernel32_lstrlen(jitter):
-    my_strlen(jitter, whoami(), get_str_ansi, len)
+    my_strlen(jitter, whoami(), jitter.vm.strlen)
 
 
 def my_lstrcat(jitter, funcname, get_str):
@@ -1701,9 +1718,8 @@ def ntdll_ZwAllocateVirtualMemory(jitter):
     if not args.flprotect in access_dict:
         raise ValueError('unknown access dw!')
 
-    alloc_addr = winobjs.heap.next_addr(dwsize)
-    jitter.vm.add_memory_page(
-        alloc_addr, access_dict[args.flprotect], "\x00" * dwsize,
+    alloc_addr = winobjs.heap.map_region(
+        jitter.vm, dwsize, access_dict[args.flprotect],
         "Alloc in %s ret 0x%X" % (whoami(), ret_ad))
     jitter.vm.set_mem(args.lppvoid, pck32(alloc_addr))
 
@@ -1713,8 +1729,11 @@ def ntdll_ZwAllocateVirtualMemory(jitter):
 def ntdll_ZwFreeVirtualMemory(jitter):
     ret_ad, args = jitter.func_args_stdcall(["handle", "lppvoid",
                                              "pdwsize", "alloc_type"])
-    # ad = upck32(jitter.vm.get_mem(args.lppvoid, 4))
+    ad = upck32(jitter.vm.get_mem(args.lppvoid, 4))
     # dwsize = upck32(jitter.vm.get_mem(args.pdwsize, 4))
+    # MEM_RELEASE
+    if args.alloc_type & 0x8000:
+        winobjs.heap.unmap_region(jitter.vm, ad)
     jitter.func_ret_stdcall(ret_ad, 0)
 
 
@@ -1735,10 +1754,7 @@ def ntdll_RtlAnsiStringToUnicodeString(jitter):
     s = ("\x00".join(s + "\x00"))
     l = len(s) + 1
     if args.alloc_str:
-        alloc_addr = winobjs.heap.next_addr(l)
-        jitter.vm.add_memory_page(
-            alloc_addr, PAGE_READ | PAGE_WRITE, "\x00" * l,
-            "Alloc in %s ret 0x%X" % (whoami(), ret_ad))
+        alloc_addr = winobjs.heap.alloc(jitter, l)
     else:
         alloc_addr = p_src
     jitter.vm.set_mem(alloc_addr, s)
@@ -1785,13 +1801,13 @@ def ntdll_LdrGetProcedureAddress(jitter):
 
 def ntdll_memset(jitter):
     ret_ad, args = jitter.func_args_stdcall(['addr', 'c', 'size'])
-    jitter.vm.set_mem(args.addr, chr(args.c) * args.size)
+    jitter.vm.memset(args.addr, args.c & 0xFF, args.size)
     jitter.func_ret_stdcall(ret_ad, args.addr)
 
 
 def msvcrt_memset(jitter):
     ret_ad, args = jitter.func_args_cdecl(['addr', 'c', 'size'])
-    jitter.vm.set_mem(args.addr, chr(args.c) * args.size)
+    jitter.vm.memset(args.addr, args.c & 0xFF, args.size)
     jitter.func_ret_cdecl(ret_ad, args.addr)
 
 
@@ -1804,9 +1820,7 @@ def msvcrt_memcpy(jitter):
 
 def msvcrt_memcmp(jitter):
     ret_ad, args = jitter.func_args_cdecl(['ps1', 'ps2', 'size'])
-    s1 = jitter.vm.get_mem(args.ps1, args.size)
-    s2 = jitter.vm.get_mem(args.ps2, args.size)
-    ret = cmp(s1, s2)
+    ret = jitter.vm.memcmp(args.ps1, args.ps2, args.size)
     jitter.func_ret_cdecl(ret_ad, ret)
 
 
@@ -2475,8 +2489,21 @@ def msvcrt_malloc(jitter):
     jitter.func_ret_cdecl(ret_ad, addr)
 
 
+def msvcrt_calloc(jitter):
+    ret_ad, args = jitter.func_args_cdecl(["num", "msize"])
+    addr = winobjs.heap.alloc(jitter, args.num * args.msize)
+    jitter.func_ret_cdecl(ret_ad, addr)
+
+
+def msvcrt_realloc(jitter):
+    ret_ad, args = jitter.func_args_cdecl(["ptr", "msize"])
+    addr = winobjs.heap.realloc(jitter.vm, args.ptr, args.msize)
+    jitter.func_ret_cdecl(ret_ad, addr)
+
+
 def msvcrt_free(jitter):
-    ret_ad, _ = jitter.func_args_cdecl(["ptr"])
+    ret_ad, args = jitter.func_args_cdecl(["ptr"])
+    winobjs.heap.free(jitter.vm, args.ptr)
     jitter.func_ret_cdecl(ret_ad, 0)
 
 
@@ -2753,6 +2780,4 @@ def msvcrt_fopen(jitter):
 
 def msvcrt_strlen(jitter):
     ret_ad, args = jitter.func_args_cdecl(["src"])
-
-    s = get_str_ansi(jitter, args.src)
-    jitter.func_ret_cdecl(ret_ad, len(s))
+    jitter.func_ret_cdecl(ret_ad, jitter.vm.strlen(args.src))
@@ -0,0 +1,79 @@
+from miasm2.arch.x86.arch import mn_x86
+from miasm2.arch.x86.disasm import dis_x86_32
+from miasm2.arch.x86.ira import ir_a_x86_32
+from miasm2.analysis.data_analysis import intra_bloc_flow_raw, \
+    inter_bloc_flow, DataFlowGraph
+from miasm2.core import parse_asm
+from miasm2.core.asmbloc import asm_resolve_final
+from miasm2.core.bin_stream import bin_stream_str
+from miasm2.core.graph import DiGraph
+
+
+ASM = '''
+main:
+    PUSH    EBP
+    MOV     EBP, ESP
+    MOV     ECX, DWORD PTR [EBP+0x8]
+    MOV     ESI, DWORD PTR [EBP+0xC]
+    XOR     EAX, EAX
+loop:
+    TEST    ECX, ECX
+    JZ      end
+    MOV     EDX, DWORD PTR [ESI+ECX*4]
+    ADD     EAX, EDX
+    CMP     EDX, 0x10
+    JA      big
+    DEC     ECX
+    JMP     loop
+big:
+    MOV     DWORD PTR [ESI], EAX
+    SUB     ECX, 2
+    JMP     loop
+end:
+    POP     EBP
+    RET
+'''
+
+blocks, symbol_pool = parse_asm.parse_txt(mn_x86, 32, ASM)
+symbol_pool.set_offset(symbol_pool.getby_name("main"), 0)
+patches = asm_resolve_final(mn_x86, blocks, symbol_pool)
+data = ["\x00"] * (max(offset + len(raw)
+                       for offset, raw in patches.iteritems()))
+for offset, raw in patches.iteritems():
+    data[offset:offset + len(raw)] = raw
+
+mdis = dis_x86_32(bin_stream_str("".join(data)))
+ir_arch = ir_a_x86_32(mdis.symbol_pool)
+for block in mdis.dis_multibloc(0):
+    ir_arch.add_bloc(block)
+head = mdis.symbol_pool.getby_offset(0)
+
+for link_exec_to_data in [True, False]:
+    # Reference
+    flow_graph = DiGraph()
+    for irb in ir_arch.blocs.values():
+        intra_bloc_flow_raw(ir_arch, flow_graph, irb)
+    inter_bloc_flow(ir_arch, flow_graph, head, link_exec_to_data)
+
+    data_flow = DataFlowGraph(ir_arch)
+    for irb in ir_arch.blocs.values():
+        data_flow.add_block(irb)
+        # Per block nodes
+        assert(set(data_flow.in_nodes(irb.label)) == set(irb.in_nodes))
+        assert(set(data_flow.out_nodes(irb.label)) == set(irb.out_nodes))
+    data_flow.link_blocks(head, link_exec_to_data)
+
+    exported = data_flow.to_digraph()
+    assert(exported.nodes() == flow_graph.nodes())
+    assert(len(exported.edges()) == len(flow_graph.edges()))
+    assert(set(exported.edges()) == set(flow_graph.edges()))
+
+    # Node ids API
+    for node in xrange(len(data_flow)):
+        name = data_flow.node(node)
+        assert(set(data_flow.node(succ)
+                   for succ in data_flow.successors(node)) ==
+               set(flow_graph.successors(name)))
+        assert(set(data_flow.node(pred)
+                   for pred in data_flow.predecessors(node)) ==
+               set(flow_graph.predecessors(name)))
@@ -1062,6 +1062,14 @@ for test_nb, test in enumerate([(G1_IRA, G1_INPUT),
         if not match_results(all_results, test_results[test_nb], flat_depnodes):
             FAILED.add(test_nb)
             # fds
+
+        # Same query, using the block summaries of the previous one
+        assert g_dep._summaries
+        all_results = set(unflatGraph(flatGraph(result.graph))
+                          for result in g_dep.get_from_depnodes(depnodes,
+                                                                heads))
+        if not match_results(all_results, test_results[test_nb], flat_depnodes):
+            FAILED.add(test_nb)
         continue
 
 if FAILED:
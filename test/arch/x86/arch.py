@@ -5,6 +5,7 @@ from miasm2.arch.x86.arch import mn_x86, deref_mem_ad, parse_ast, ast_int2expr,
     base_expr, rmarg, print_size
 from miasm2.arch.x86.sem import ir_x86_16, ir_x86_32, ir_x86_64
 from miasm2.core.bin_stream import bin_stream_str
+from miasm2.expression.simplifications import expr_simp
 
 filename = os.environ.get('PYTHONSTARTUP')
 if filename and os.path.isfile(filename):
@@ -2978,6 +2979,14 @@ for mode, s, l, in reg_tests:
     # print mn.args
 print 'TEST time', time.time() - ts
 
+# Test asm cache: prefixes are part of the key
+l = mn_x86.fromstring("ADD DWORD PTR [EAX], 0x1", 32)
+a = mn_x86.asm(l)
+assert mn_x86.asm(l) == a
+l_lock = mn_x86.fromstring("LOCK ADD DWORD PTR [EAX], 0x1", 32)
+a_lock = mn_x86.asm(l_lock)
+assert set(a_lock) == set("\xf0" + x for x in a)
+
 
 # speed test thumb
 o = ""
@@ -3015,3 +3024,16 @@ cProfile.run('profile_dis(o)')
 instr_bytes = '\x65\xc7\x00\x09\x00\x00\x00'
 inst = mn_x86.dis(instr_bytes, 32, 0)
 assert(inst.b == instr_bytes)
+
+# Arguments are simplified at decoding, with the passes enabled then
+inst = mn_x86.dis("\x8d\x44\x24\x04", 32, 0)
+late_simps = []
+def late_simp(e_s, expr):
+    late_simps.append(expr)
+    return expr
+expr_simp.enable_passes({m2_expr.ExprMem: [late_simp]})
+try:
+    assert(str(inst) == "LEA        EAX, DWORD PTR [ESP+0x4]")
+    assert(not late_simps)
+finally:
+    expr_simp.expr_simp_cb[m2_expr.ExprMem].remove(late_simp)
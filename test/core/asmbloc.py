@@ -306,3 +306,105 @@ assert len(solutions) == 1
 solution = solutions.pop()
 for jbbl, block in solution.iteritems():
     assert block.label.offset == int(jbbl._name, 16)
+
+# Test incremental assembly
+from miasm2.arch.x86.arch import mn_x86
+from miasm2.core.parse_asm import parse_txt
+from miasm2.core.asmbloc import AsmSession, asm_resolve_final
+
+ASM = '''
+main:
+    MOV    EAX, 0x1
+    JMP    lbl_end
+.dontsplit
+lbl_loop:
+    INC    EAX
+    JNZ    lbl_loop
+.dontsplit
+lbl_end:
+    RET
+'''
+blocks, symbol_pool = parse_txt(mn_x86, 32, ASM)
+symbol_pool.set_offset(symbol_pool.getby_name("main"), 0)
+session = AsmSession(mn_x86, blocks, symbol_pool)
+patches = session.assemble()
+assert patches == {0: "\xb8\x01\x00\x00\x00", 5: "\xeb\x03",
+                   7: "\x40", 8: "\x75\xfd", 0xa: "\xc3"}
+
+## Replace INC EAX by a bigger instruction: following blocks move
+lbl_loop = symbol_pool.getby_name("lbl_loop")
+block = blocks.label2block(lbl_loop)
+block.lines[0] = mn_x86.fromstring("ADD EAX, 0x12345678", 32)
+delta = session.update([block])
+assert delta == {5: "\xeb\x07", 7: "\x05\x78\x56\x34\x12", 0xc: "\x75\xf9",
+                 0xe: "\xc3"}
+assert session.patches == {0: "\xb8\x01\x00\x00\x00", 5: "\xeb\x07",
+                           7: "\x05\x78\x56\x34\x12", 0xc: "\x75\xf9",
+                           0xe: "\xc3"}
+
+## Result is the same as a full assembly
+blocks, symbol_pool = parse_txt(mn_x86, 32, ASM.replace("INC    EAX",
+                                                        "ADD EAX, 0x12345678"))
+symbol_pool.set_offset(symbol_pool.getby_name("main"), 0)
+assert asm_resolve_final(mn_x86, blocks, symbol_pool) == session.patches
+
+# Test linear sweep
+from miasm2.core.bin_stream import bin_stream_str
+data = "\x90\x40\xff\xff\x41\x75\xfa\xc3\x90\x0f"
+mdis = dis_x86_32(bin_stream_str(data))
+## Instructions: invalid opcodes are skipped
+instrs = list(mdis.dis_instr_linear(0))
+assert [instr.offset for instr in instrs] == [0, 1, 3, 6, 7, 8]
+assert [instr.name for instr in instrs] == ["NOP", "INC", "INC", "CLI", "RET",
+                                            "NOP"]
+## Sweep can be bounded
+assert [instr.offset for instr in mdis.dis_instr_linear(1, 3)] == [1]
+## Blocks: invalid offsets produce bad blocks
+blocks = list(mdis.dis_bloc_linear(0))
+assert [block.label.offset for block in blocks] == [0, 2, 3, 8, 9]
+assert [len(block.lines) for block in blocks] == [2, 0, 3, 1, 0]
+assert isinstance(blocks[1], asm_block_bad)
+assert isinstance(blocks[4], asm_block_bad)
+assert blocks[0].get_next() == blocks[1].label
+## The sweep does not record its offsets
+assert not mdis.job_done
+## Callback is run on each block
+seen = []
+mdis.dis_bloc_callback = lambda cur_bloc, **kwargs: seen.append(cur_bloc)
+blocks = list(mdis.dis_bloc_linear(0, 3))
+assert [block.label.offset for block in blocks] == [0, 2]
+assert seen == blocks
+## Labels created by the sweep do not stay in the symbol pool, and failures
+## are not logged as warnings
+import random
+import logging
+from miasm2.core.asmbloc import log_asmbloc
+random.seed(0)
+data = "".join(chr(random.randint(0, 255)) for _ in xrange(0x4000))
+mdis = dis_x86_32(bin_stream_str(data))
+named = mdis.symbol_pool.getby_name_create("named")
+mdis.symbol_pool.set_offset(named, 0)
+labels_count = len(mdis.symbol_pool.items)
+warnings = []
+class WarningsHandler(logging.Handler):
+    def emit(self, record):
+        if record.levelno >= logging.WARNING:
+            warnings.append(record)
+handler = WarningsHandler()
+log_asmbloc.addHandler(handler)
+try:
+    blocks = list(mdis.dis_bloc_linear(0))
+finally:
+    log_asmbloc.removeHandler(handler)
+assert len(blocks) > 100
+assert any(isinstance(block, asm_block_bad) for block in blocks)
+assert not warnings
+assert len(mdis.symbol_pool.items) == labels_count
+assert mdis.symbol_pool.getby_offset(0) is named
+assert blocks[0].label is named
+## A sweep stopped early does not leave labels either
+sweep = mdis.dis_bloc_linear(0)
+for _ in xrange(10):
+    next(sweep)
+sweep.close()
+assert len(mdis.symbol_pool.items) == labels_count
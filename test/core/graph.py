@@ -151,6 +151,44 @@ assert(idoms == {3: 6,
                  8: 4,
                  9: 4})
 
+idoms = g1.compute_immediate_postdominators(6)
+assert(idoms == {1: 2,
+                 2: 6,
+                 3: 5,
+                 4: 5,
+                 5: 2})
+
+tree = g2.compute_dominator_tree(5)
+assert(tree.nodes() == set([3, 4, 5, 6, 7, 8, 9]))
+assert(sorted(tree.edges()) == [(3, 4), (4, 7), (4, 8), (4, 9), (5, 6),
+                                (6, 3)])
+
+# Dominators on a generated graph, compared with the naive fixed point
+import random
+rnd = random.Random(0)
+g_rnd = DiGraph()
+for node in xrange(300):
+    g_rnd.add_node(node)
+    for _ in xrange(rnd.randint(1, 3)):
+        g_rnd.add_edge(node, rnd.randint(0, 299))
+dominators = dict((node, set(g_rnd.reachable_sons(0)))
+                  for node in g_rnd.reachable_sons(0))
+dominators[0] = set([0])
+changed = True
+while changed:
+    changed = False
+    for node in dominators:
+        if node == 0:
+            continue
+        new_dom = set.intersection(*[dominators[pred] for pred in
+                                     g_rnd.predecessors_iter(node)
+                                     if pred in dominators])
+        new_dom.add(node)
+        if new_dom != dominators[node]:
+            dominators[node] = new_dom
+            changed = True
+assert(g_rnd.compute_dominators(0) == dominators)
+
 frontier = g1.compute_dominance_frontier(1)
 assert(frontier == {2: set([2]),
                     3: set([5]),
@@ -193,6 +231,38 @@ assert(sccs == {frozenset({6}),
                 frozenset({3}),
                 frozenset({1, 2, 4, 5, 9})})
 
+# Loop nesting forest
+forest = g3.compute_loop_nesting_forest(1)
+assert(forest == {
+    1: DiGraph.Loop(1, frozenset([1]), frozenset([2]), None, 1, True),
+    2: DiGraph.Loop(2, frozenset([2, 4, 5, 9]), frozenset(), 1, 2, True),
+    # 7 <-> 8 is entered from 3 by both nodes
+    7: DiGraph.Loop(7, frozenset([7, 8]), frozenset(), None, 1, False),
+})
+assert(g3.compute_loop_body(1, 1) == set([1, 2, 4, 5, 9]))
+assert(g3.compute_loop_body(1, 2) == set([2, 4, 5, 9]))
+
+# Forest is cached until the graph is modified
+assert(g3.compute_loop_nesting_forest(1) == forest)
+g3.add_edge(6, 6)
+forest = g3.compute_loop_nesting_forest(1)
+assert(forest[6] == DiGraph.Loop(6, frozenset([6]), frozenset(), None, 1,
+                                 True))
+g3.del_edge(6, 6)
+assert(6 not in g3.compute_loop_nesting_forest(1))
+
+# Long chains do not recurse
+chain = DiGraph()
+for node in xrange(100000):
+    chain.add_edge(node, node + 1)
+chain.add_edge(100000, 0)
+chain.add_edge(50000, 50000)
+forest = chain.compute_loop_nesting_forest(0)
+assert(set(forest) == set([0, 50000]))
+assert(forest[50000].parent == 0)
+assert(forest[50000].depth == 2)
+assert(len(chain.compute_loop_body(0, 0)) == 100001)
+
 # Equality
 graph = DiGraph()
 graph.add_edge(1, 2)
@@ -218,6 +288,23 @@ for edge in graph3.edges():
 assert graph4.nodes() == graph.nodes().union(graph3.nodes())
 assert sorted(graph4.edges()) == sorted(graph.edges() + graph3.edges())
 
+# Multiple edges
+graph5 = DiGraph()
+graph5.add_edge(1, 2)
+graph5.add_edge(1, 2)
+graph5.add_uniq_edge(1, 2)
+graph5.add_edge(2, 2)
+assert graph5.has_edge(1, 2)
+assert sorted(graph5.edges()) == [(1, 2), (1, 2), (2, 2)]
+graph5.del_edge(1, 2)
+assert graph5.has_edge(1, 2)
+assert graph5.successors(1) == [2]
+graph5.del_node(2)
+assert not graph5.has_edge(1, 2)
+assert graph5.edges() == []
+assert graph5.successors(1) == []
+assert graph5.predecessors(2) == []
+
 # MatchGraph
 
 ## Build a MatchGraph using MatchGraphJoker
@@ -285,3 +372,55 @@ assert sols[0] == {j1: 1,
                    j2: 2,
                    j3: 3}
 
+
+## Restrict solutions to some nodes
+graph.add_edge(5, 6)
+graph.add_edge(6, 7)
+assert len(list(matcher.match(graph))) == 2
+sols = list(matcher.match(graph, [7, 42]))
+assert len(sols) == 1
+assert sols[0] == {j1: 5,
+                   j2: 6,
+                   j3: 7}
+assert list(matcher.match(graph, [4])) == []
+
+## Match several patterns at once
+j4 = MatchGraphJoker(name="head", restrict_in=False, restrict_out=False)
+j5 = MatchGraphJoker(name="latch", restrict_in=False, restrict_out=False)
+looper = j4 >> j5 >> j4
+graph.add_edge(7, 6)
+sols = list(MatchGraph.match_patterns([matcher, looper], graph))
+assert [sol for pattern, sol in sols if pattern is matcher] == [{j1: 1,
+                                                                 j2: 2,
+                                                                 j3: 3}]
+sols = [sol for pattern, sol in sols if pattern is looper]
+assert len(sols) == 2
+assert set((sol[j4], sol[j5]) for sol in sols) == set([(6, 7), (7, 6)])
+
+# DiGraphSimplifier
+## Passes are notified of the nodes touched by the previous round
+graph = DiGraph()
+for node in xrange(10):
+    graph.add_edge(node, node + 1)
+parent = MatchGraphJoker(restrict_in=False)
+son = MatchGraphJoker(restrict_out=False)
+chain = parent >> son
+rounds = []
+
+def merge_one(dg, graph):
+    """Merge the first son of the chain found"""
+    rounds.append(dg.touched)
+    for sol in chain.match(graph, dg.touched):
+        for succ in graph.successors(sol[son]):
+            graph.add_edge(sol[parent], succ)
+        graph.del_node(sol[son])
+        break
+
+simplifier = DiGraphSimplifier()
+simplifier.enable_passes([merge_one])
+simplified = simplifier(graph)
+assert len(simplified.nodes()) == 1
+assert len(graph.nodes()) == 11
+assert rounds[0] is None
+assert all(len(touched) == 2 for touched in rounds[1:])
+assert simplifier.touched is None
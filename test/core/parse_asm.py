@@ -104,6 +104,31 @@ class TestParseAsm(unittest.TestCase):
         # split test
         assert(lbl2block[lbls[1]].get_next() is None)
 
+    def test_ParseLines(self):
+        from StringIO import StringIO
+        from miasm2.arch.x86.arch import mn_x86
+        from miasm2.core.parse_asm import parse_txt
+
+        ASM0 = '''
+            JMP   loc_00000000
+            INC   EAX
+        loc_00000000:
+            RET
+        '''
+
+        # Listing can be streamed from a file object
+        blocks, symbol_pool = parse_txt(mn_x86, 32, StringIO(ASM0))
+        labels = set(block.label.name for block in blocks)
+        # Generated labels must not collide with labels defined later
+        self.assertEqual(labels, set(['loc_00000000',
+                                      'loc_00000001',
+                                      'loc_00000002']))
+        lbl2block = {}
+        for block in blocks:
+            lbl2block[block.label.name] = block
+        dst = lbl2block['loc_00000001'].lines[0].args[0]
+        self.assertEqual(dst.name, symbol_pool.getby_name('loc_00000000'))
+
 if __name__ == '__main__':
     testsuite = unittest.TestLoader().loadTestsFromTestCase(TestParseAsm)
     report = unittest.TextTestRunner(verbosity=2).run(testsuite)
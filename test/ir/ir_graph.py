@@ -0,0 +1,138 @@
+from miasm2.arch.x86.arch import mn_x86
+from miasm2.arch.x86.disasm import dis_x86_32
+from miasm2.arch.x86.ira import ir_a_x86_32
+from miasm2.core import parse_asm
+from miasm2.core.asmbloc import asm_resolve_final, expr_is_label
+from miasm2.core.bin_stream import bin_stream_str
+from miasm2.core.graph import DiGraph
+from miasm2.expression.expression import ExprId, ExprInt
+
+
+ASM = '''
+main:
+    PUSH    EBP
+    MOV     EBP, ESP
+    MOV     ECX, DWORD PTR [EBP+0x8]
+    XOR     EAX, EAX
+loop:
+    TEST    ECX, ECX
+    JZ      end
+    ADD     EAX, ECX
+    CALL    func
+    DEC     ECX
+    JMP     loop
+end:
+    ; REP MOVSB
+    .byte 0xF3,0xA4
+    POP     EBP
+    RET
+func:
+    CMP     EAX, 0x10
+    JA      big
+    INC     EAX
+    RET
+big:
+    SHR     EAX, 1
+    RET
+'''
+
+blocks, symbol_pool = parse_asm.parse_txt(mn_x86, 32, ASM)
+symbol_pool.set_offset(symbol_pool.getby_name("main"), 0)
+patches = asm_resolve_final(mn_x86, blocks, symbol_pool)
+data = ["\x00"] * (max(offset + len(raw)
+                       for offset, raw in patches.iteritems()))
+for offset, raw in patches.iteritems():
+    data[offset:offset + len(raw)] = raw
+
+mdis = dis_x86_32(bin_stream_str("".join(data)))
+mdis.follow_call = True
+asm_blocks = sorted(mdis.dis_multibloc(0), key=lambda block: block.label.offset)
+
+
+def get_label(name):
+    """Return the disassembler label of the listing label @name"""
+    offset = symbol_pool.getby_name(name).offset
+    return mdis.symbol_pool.getby_offset(offset)
+
+
+def naive_graph(ir_arch):
+    """Rebuild the IR graph from scratch"""
+    graph = DiGraph()
+    for label, irb in ir_arch.blocs.iteritems():
+        graph.add_node(label)
+        for dst in ir_arch._dst_trackback(irb):
+            if isinstance(dst, ExprInt):
+                dst = ExprId(
+                    ir_arch.symbol_pool.getby_offset_create(int(dst.arg)))
+            if expr_is_label(dst):
+                graph.add_edge(label, dst.name)
+    return graph
+
+
+def naive_getby_offset(ir_arch, offset):
+    out = set()
+    for irb in ir_arch.blocs.values():
+        for line in irb.lines:
+            if line.offset <= offset < line.offset + line.l:
+                out.add(irb)
+    return out
+
+
+def check(ir_arch):
+    graph = ir_arch.graph
+    expected = naive_graph(ir_arch)
+    assert(graph.nodes() == expected.nodes())
+    assert(sorted(graph.edges()) == sorted(expected.edges()))
+    for offset in xrange(len(data) + 1):
+        assert(ir_arch.getby_offset(offset) ==
+               naive_getby_offset(ir_arch, offset))
+
+
+## Graph and offset index are updated as blocks are added
+ir_arch = ir_a_x86_32(mdis.symbol_pool)
+for block in asm_blocks:
+    ir_arch.add_bloc(block)
+    check(ir_arch)
+assert(len(ir_arch.blocs) > len(asm_blocks))
+
+## ... replaced
+label = get_label("loop")
+for block in asm_blocks:
+    if block.label == label:
+        ir_arch.add_bloc(block)
+check(ir_arch)
+
+irb = ir_arch.blocs[label]
+old_succs = set(ir_arch.graph.successors(label))
+end = get_label("end")
+irb.dst = ExprId(end, 32)
+ir_arch.blocs[label] = irb
+check(ir_arch)
+assert(ir_arch.graph.successors(label) == [end])
+assert(old_succs != set([end]))
+
+## ... or modified in place
+label = get_label("func")
+irb = ir_arch.blocs[label]
+assert(len(ir_arch.graph.successors(label)) == 2)
+irb.dst = ExprId(end, 32)
+ir_arch.add_bloc(asm_blocks[-1])
+check(ir_arch)
+assert(ir_arch.graph.successors(label) == [end])
+
+## ... and removed
+for label in list(ir_arch.blocs):
+    del ir_arch.blocs[label]
+    check(ir_arch)
+assert(not ir_arch.graph.nodes())
+
+## dst_trackback is cached until IRDst is modified
+ir_arch = ir_a_x86_32(mdis.symbol_pool)
+for block in asm_blocks:
+    ir_arch.add_bloc(block)
+for label, irb in ir_arch.blocs.iteritems():
+    assert(ir_arch.dst_trackback(irb) == ir_arch._dst_trackback(irb))
+    assert(ir_arch._dst_cache[label][0] is irb)
+irb = ir_arch.blocs[get_label("func")]
+irb.dst = ExprInt(0x1234, 32)
+assert(ir_arch.dst_trackback(irb) == set([ExprInt(0x1234, 32)]))
@@ -0,0 +1,66 @@
+from miasm2.arch.x86.arch import mn_x86
+from miasm2.arch.x86.ira import ir_a_x86_32
+from miasm2.core.asmbloc import asm_symbol_pool
+
+
+def lift(ir_arch, data, offset, cached=True):
+    instr = mn_x86.dis(data, 32)
+    instr.offset = offset
+    instr.dstflow2label(ir_arch.symbol_pool)
+    if cached:
+        return instr, ir_arch.instr2ir(instr)
+    return instr, ir_arch._instr2ir(instr)
+
+
+def assert_same_lifting(lifting1, lifting2):
+    assignblk1, extra1 = lifting1
+    assignblk2, extra2 = lifting2
+    assert(assignblk1 == assignblk2)
+    assert([(irb.label, irb.irs) for irb in extra1] ==
+           [(irb.label, irb.irs) for irb in extra2])
+
+
+ir_arch = ir_a_x86_32(asm_symbol_pool())
+ir_arch.lifting_cache.clear()
+
+## Same encoding, same offset
+for data in ["\x01\xd8",            # ADD EAX, EBX
+             "\xe8\x10\x00\x00\x00", # CALL rel
+             ]:
+    _, lifting = lift(ir_arch, data, 0x1000)
+    _, cached = lift(ir_arch, data, 0x1000)
+    assert_same_lifting(lifting, cached)
+
+## Relocation: CALL depends on its offset (return address, destination)
+call = "\xe8\x10\x00\x00\x00"
+for offset in [0x2000, 0x3000]:
+    lift(ir_arch, call, offset)
+key = ir_arch.lifting_cache_key(lift(ir_arch, call, 0x4000)[0])
+template = ir_arch.lifting_cache[key]
+assert(template.relocatable)
+assert(template.can_rebind(0x5000))
+_, cached = lift(ir_arch, call, 0x5000)
+_, reference = lift(ir_arch, call, 0x5000, cached=False)
+assert_same_lifting(cached, reference)
+
+## Generated labels are regenerated
+rep = "\xf3\xa4"
+_, (_, extra1) = lift(ir_arch, rep, 0x6000)
+_, (_, extra2) = lift(ir_arch, rep, 0x6000)
+assert(extra1 and extra2)
+assert(set(irb.label for irb in extra1).isdisjoint(irb.label
+                                                   for irb in extra2))
+
+## Lifting side effects on the instruction are replayed
+instr, _ = lift(ir_arch, rep, 0x6000)
+assert(instr.additional_info.except_on_instr)
+
+## Liftings cached by another ir instance use the ids of the current one
+ir_arch2 = ir_a_x86_32(asm_symbol_pool())
+_, (assignblk, extra) = lift(ir_arch2, call, 0x5000)
+assert(any(dst is ir_arch2.IRDst for dst in assignblk))
+assert(not any(dst is ir_arch.IRDst for dst in assignblk))
+_, (_, extra) = lift(ir_arch2, rep, 0x6000)
+for irb in extra:
+    for irs in irb.irs:
+        assert(not any(dst is ir_arch.IRDst for dst in irs))
@@ -0,0 +1,100 @@
+import os
+import sys
+import json
+import shutil
+import tempfile
+from StringIO import StringIO
+
+from miasm2.analysis.batch import load_manifest, run_batch, run_job
+from miasm2.jitter.jitcore import JitCore
+
+from helpers import make_pe
+
+jit_type = sys.argv[1] if len(sys.argv) > 1 else "gcc"
+
+
+SOURCES = {
+    "api": '''
+main:
+    CALL   DWORD PTR [GetTickCount]
+    RET
+''',
+    "loop": '''
+main:
+    INC    EAX
+    JMP    main
+''',
+}
+
+tmpdir = tempfile.mkdtemp()
+try:
+    fnames = {}
+    for name, source in SOURCES.iteritems():
+        fnames[name] = os.path.join(tmpdir, "%s.exe" % name)
+        with open(fnames[name], "wb") as fstream:
+            fstream.write(str(make_pe(
+                source, imports=[("kernel32.dll", ["GetTickCount"])])))
+
+    sandbox = "Sandbox_Win_x86_32"
+    manifest = [
+        {"id": "api", "fname": fnames["api"], "sandbox": sandbox},
+        {"id": "blocks", "fname": fnames["loop"], "sandbox": sandbox,
+         "max_blocks": 1000, "hit_counts": True},
+        {"id": "time", "fname": fnames["loop"], "sandbox": sandbox,
+         "max_time": 1},
+        {"id": "missing", "fname": os.path.join(tmpdir, "missing.exe"),
+         "sandbox": sandbox},
+        {"fname": fnames["api"], "sandbox": "Sandbox_Unknown"},
+    ]
+    for job in manifest:
+        job["options"] = ["-q"]
+    manifest = StringIO("# Test manifest\n\n" +
+                        "\n".join(json.dumps(job) for job in manifest))
+    jobs = list(load_manifest(manifest))
+    assert [job["id"] for job in jobs] == ["api", "blocks", "time",
+                                           "missing", 6]
+
+    output = StringIO()
+    assert run_batch(jobs, output, processes=2,
+                     jitter=jit_type) == len(jobs)
+
+    # Jitters without block budget reject max_blocks
+    JitCore.supports_max_blocks = False
+    try:
+        result = run_job(jobs[1], jitter=jit_type)
+    finally:
+        JitCore.supports_max_blocks = True
+    assert result["status"] == "error"
+    assert "max_blocks" in result["error"]
+finally:
+    shutil.rmtree(tmpdir)
+
+results = {}
+for line in output.getvalue().splitlines():
+    result = json.loads(line)
+    results[result["id"]] = result
+assert sorted(results) == sorted(job["id"] for job in jobs)
+
+result = results["api"]
+assert result["status"] == "exit"
+assert result["error"] is None
+assert result["exception"] == 0
+assert result["pc"] == 0x1337beef
+assert [name for _, name in result["api_calls"]] == ["kernel32_GetTickCount"]
+assert 0x401000 in result["coverage"]
+assert result["blocks"] is None
+assert result["hits"] is None
+
+result = results["blocks"]
+assert result["status"] == "block_limit"
+assert result["blocks"] == 1000
+assert result["coverage"] == [0x401000]
+assert result["hits"] == [[0x401000, 1000]]
+
+result = results["time"]
+assert result["status"] == "timeout"
+assert 1 <= result["time"] < 5
+
+assert results["missing"]["status"] == "error"
+assert "IOError" in results["missing"]["error"]
+assert results[6]["status"] == "error"
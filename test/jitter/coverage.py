@@ -0,0 +1,125 @@
+import sys
+import time
+import struct
+from StringIO import StringIO
+
+from miasm2.analysis.machine import Machine
+from miasm2.jitter.csts import PAGE_READ, PAGE_WRITE
+
+from helpers import assemble_at
+
+jit_type = sys.argv[1] if len(sys.argv) > 1 else "gcc"
+
+code_addr = 0x40000000
+count_addr = 0x60000000
+count = 0x100
+max_count = 0x100000
+
+ASM = '''
+main:
+    MOV    ECX, DWORD PTR [0x60000000]
+loop:
+    INC    EAX
+    LOOP   loop
+    CALL   func
+    RET
+func:
+    MOV    EBX, 0x1234
+    RET
+'''
+
+data, blocks, symbol_pool = assemble_at(ASM, code_addr, {"func": 0x100})
+loop_addr = symbol_pool.getby_name("loop").offset
+func_addr = symbol_pool.getby_name("func").offset
+# The first iteration is part of the main block
+call_addr = [line.offset for block in blocks for line in block.lines
+             if line.name == "CALL"][0]
+ret_addr = call_addr + 5
+
+
+def code_sentinelle(jitter):
+    jitter.run = False
+    jitter.pc = 0
+    return True
+
+myjit = Machine("x86_32").jitter(jit_type)
+myjit.init_stack()
+myjit.vm.add_memory_page(code_addr, PAGE_READ | PAGE_WRITE, data,
+                         "code")
+myjit.vm.add_memory_page(count_addr, PAGE_READ | PAGE_WRITE,
+                         struct.pack("<I", count))
+myjit.add_breakpoint(0x1337beef, code_sentinelle)
+
+
+def run():
+    myjit.push_uint32_t(0x1337beef)
+    myjit.init_run(code_addr)
+    myjit.continue_run()
+
+# Blocks jitted before coverage_start are counted once jitted again
+run()
+assert len(myjit.get_coverage()) == 0
+myjit.coverage_start()
+run()
+coverage = myjit.get_coverage()
+expected = {code_addr: 1, loop_addr: count - 1, call_addr: 1, func_addr: 1,
+            ret_addr: 1}
+assert coverage.counts == expected
+assert coverage.blocks[func_addr] == (6, 1)
+
+# Counters are kept across runs, until reset
+run()
+assert myjit.get_coverage().counts[loop_addr] == 2 * (count - 1)
+myjit.reset_coverage()
+assert set(myjit.get_coverage().counts.values()) == set([0])
+run()
+coverage = myjit.get_coverage()
+assert coverage.counts == expected
+
+# drcov export, with the memory pages as default modules
+fdesc = StringIO()
+coverage.write_drcov(fdesc)
+drcov = fdesc.getvalue()
+header, table = drcov.split("BB Table: 5 bbs\n")
+lines = header.splitlines()
+assert lines[:2] == ["DRCOV VERSION: 2", "DRCOV FLAVOR: drcov"]
+modules = [line.split(", ") for line in lines[4:]]
+assert lines[2] == "Module Table: version 2, count %d" % len(modules)
+code_module = [module for module in modules if module[-1] == "code"][0]
+assert int(code_module[1], 16) == code_addr
+module_id = int(code_module[0])
+entries = [struct.unpack("<IHH", table[i:i + 8])
+           for i in xrange(0, len(table), 8)]
+assert sorted(entries) == sorted((addr - code_addr,
+                                  coverage.blocks[addr][0], module_id)
+                                 for addr in expected)
+
+# lcov-like export, with explicit modules
+fdesc = StringIO()
+coverage.write_lcov(fdesc, [("loop.bin", code_addr, func_addr),
+                            ("func.bin", func_addr, func_addr + 0x100)])
+lcov = fdesc.getvalue().splitlines()
+assert lcov == ["TN:miasm", "SF:loop.bin"] + [
+    "DA:%d,%d" % (addr, expected[addr])
+    for addr in sorted([code_addr, loop_addr, call_addr, ret_addr])] + [
+    "LH:4", "LF:4", "end_of_record",
+    "TN:miasm", "SF:func.bin", "DA:%d,1" % func_addr, "LH:1", "LF:1",
+    "end_of_record"]
+
+# Overhead
+if jit_type != "python":
+    count = max_count
+    myjit.vm.set_mem(count_addr, struct.pack("<I", count))
+    myjit.reset_coverage()
+    start = time.time()
+    run()
+    time_coverage = time.time() - start
+    assert myjit.get_coverage().counts[loop_addr] == count - 1
+    myjit.jit.log_coverage = False
+    myjit.jit.clear_jitted_blocks()
+    run()
+    start = time.time()
+    run()
+    time_none = time.time() - start
+    print "%d blocks: no coverage %.3fs, coverage %.3fs" % (count, time_none,
+                                                          time_coverage)
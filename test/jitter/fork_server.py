@@ -0,0 +1,79 @@
+import os
+import sys
+import struct
+import tempfile
+
+from miasm2.analysis.sandbox import Sandbox_Win_x86_32, ForkServer
+
+from helpers import make_pe
+
+jit_type = sys.argv[1] if len(sys.argv) > 1 else "gcc"
+
+# Build a PE: counter += EBX; ECX selects an infinite loop or a bad access
+ASM = '''
+main:
+    MOV    EAX, DWORD PTR [data]
+    ADD    EAX, EBX
+    MOV    DWORD PTR [data], EAX
+    CMP    ECX, 1
+    JZ     forever
+    CMP    ECX, 2
+    JZ     crash
+    RET
+forever:
+    JMP    forever
+crash:
+    MOV    EAX, DWORD PTR [EAX]
+    RET
+'''
+
+pe = make_pe(ASM, offsets={"forever": 0x100, "crash": 0x200},
+             data_size=0x1000)
+counter = pe.rva2virt(pe.getsectionbyname("data").addr)
+
+fdesc, fname = tempfile.mkstemp(suffix=".exe")
+os.write(fdesc, str(pe))
+os.close(fdesc)
+
+try:
+    parser = Sandbox_Win_x86_32.parser()
+    parser.add_argument("filename")
+    options = parser.parse_args([fname, "-j", jit_type, "-q"])
+    sb = Sandbox_Win_x86_32(options.filename, options, globals())
+finally:
+    os.unlink(fname)
+
+server = ForkServer(sb, timeout=3)
+
+# Each job starts from the initial state
+for value in [1, 0x10, 0x100]:
+    result = server.submit(regs={"EBX": value, "ECX": 0},
+                           dump=[(counter, 4), (0, 4)])
+    assert result["status"] == "exit"
+    assert result["error"] is None
+    assert result["regs"]["RAX"] == value
+    assert result["memory"][(counter, 4)] == struct.pack("<I", value)
+    assert result["exception"] == 0
+    assert result["memory"][(0, 4)] is None
+    assert result["time"] >= 0
+
+# Memory set by the job
+result = server.submit(regs={"EBX": 1, "ECX": 0},
+                       memory=[(counter, "\x41\x00\x00\x00")],
+                       dump=[(counter, 4)])
+assert result["memory"][(counter, 4)] == "\x42\x00\x00\x00"
+
+# Failing and endless jobs do not kill the server
+result = server.submit(regs={"EBX": 0, "ECX": 2})
+assert result["status"] == "exception"
+assert result["regs"]["RIP"] != 0x1337beef
+result = server.submit(regs={"EBX": 0, "ECX": 1})
+assert result["status"] == "timeout"
+result = server.submit(regs={"EBX": 2, "ECX": 0})
+assert result["status"] == "exit"
+assert result["regs"]["RAX"] == 2
+
+server.close()
+
+# The parent sandbox is untouched
+assert sb.jitter.vm.get_mem(counter, 4) == "\x00" * 4
@@ -0,0 +1,73 @@
+"""Code builders shared by the jitter regression tests (not a test)"""
+
+from elfesteem import pe_init
+
+from miasm2.arch.x86.arch import mn_x86
+from miasm2.core import parse_asm
+from miasm2.core.asmbloc import asm_resolve_final
+
+
+def assemble(source, addrs):
+    """Assemble the x86 32 bits @source
+    @addrs: dictionary label name -> address, with at least 'main'
+    Return (blocks, symbol_pool, patches), @patches being a dictionary
+    address -> bytes
+    """
+    blocks, symbol_pool = parse_asm.parse_txt(mn_x86, 32, source)
+    for name, addr in addrs.iteritems():
+        symbol_pool.set_offset(symbol_pool.getby_name_create(name), addr)
+    patches = asm_resolve_final(mn_x86, blocks, symbol_pool)
+    return blocks, symbol_pool, patches
+
+
+def assemble_at(source, base, offsets=None):
+    """Assemble the x86 32 bits @source, with its 'main' label at @base
+    @offsets: (optional) dictionary label name -> offset from @base
+    Return (code, blocks, symbol_pool), @code being the bytes from @base
+    """
+    addrs = {"main": base}
+    for name, offset in (offsets or {}).iteritems():
+        addrs[name] = base + offset
+    blocks, symbol_pool, patches = assemble(source, addrs)
+    data = ["\x00"] * (max(addr + len(raw)
+                           for addr, raw in patches.iteritems()) - base)
+    for addr, raw in patches.iteritems():
+        data[addr - base:addr - base + len(raw)] = raw
+    return "".join(data), blocks, symbol_pool
+
+
+def make_pe(source, imports=None, offsets=None, data_size=0):
+    """Build an x86 32 bits PE running @source from its 'main' label
+    @imports: (optional) list of (dll name, [function names]). In @source,
+              each function name is a label on its IAT entry
+    @offsets: (optional) dictionary label name -> offset from 'main'
+    @data_size: (optional) size of a 'data' section, on the 'data' label
+    Return the PE instance
+    """
+    pe = pe_init.PE()
+    s_text = pe.SHList.add_section(name="text", addr=0x1000, rawsize=0x1000)
+    pe.Opthdr.AddressOfEntryPoint = s_text.addr
+    base = pe.rva2virt(s_text.addr)
+    addrs = {"main": base}
+    for name, offset in (offsets or {}).iteritems():
+        addrs[name] = base + offset
+
+    if data_size:
+        s_data = pe.SHList.add_section(name="data", rawsize=data_size)
+        addrs["data"] = pe.rva2virt(s_data.addr)
+
+    if imports:
+        s_iat = pe.SHList.add_section(name="iat", rawsize=0x100)
+        pe.DirImport.add_dlldesc([({"name": dll,
+                                    "firstthunk": s_iat.addr + 0x20 * i},
+                                   funcs)
+                                  for i, (dll, funcs) in enumerate(imports)])
+        s_imp = pe.SHList.add_section(name="imp", rawsize=len(pe.DirImport))
+        pe.DirImport.set_rva(s_imp.addr)
+        for dll, funcs in imports:
+            for func in funcs:
+                addrs[func] = pe.DirImport.get_funcvirt(dll, func)
+
+    for addr, raw in assemble(source, addrs)[2].iteritems():
+        pe.virt.set(addr, raw)
+    return pe
@@ -0,0 +1,63 @@
+import sys
+import shutil
+import tempfile
+
+from miasm2.analysis.machine import Machine
+from miasm2.jitter.csts import PAGE_READ, PAGE_WRITE
+
+from helpers import assemble_at
+
+# Several jitters of the same architecture in one process share the lifting
+# cache; each one must still JiT its blocks
+
+jit_type = sys.argv[1] if len(sys.argv) > 1 else "gcc"
+
+code_addr = 0x40000000
+
+data = assemble_at('''
+main:
+    MOV    ECX, 0x10
+    XOR    EAX, EAX
+loop:
+    ADD    EAX, ECX
+    MOVSB
+    LOOP   loop
+    CMP    EAX, 0x88
+    JZ     end
+    INC    EAX
+end:
+    RET
+''', code_addr)[0]
+
+
+def code_sentinelle(jitter):
+    jitter.run = False
+    jitter.pc = 0
+    return True
+
+
+def run():
+    myjit = Machine("x86_32").jitter(jit_type)
+    if jit_type == "gcc":
+        # Do not reuse blocks compiled for another jitter
+        myjit.jit.tempdir = tempdir
+    myjit.init_stack()
+    myjit.vm.add_memory_page(code_addr, PAGE_READ | PAGE_WRITE, data)
+    myjit.vm.add_memory_page(0x50000000, PAGE_READ | PAGE_WRITE,
+                             "\x00" * 0x100)
+    myjit.cpu.ESI = 0x50000000
+    myjit.cpu.EDI = 0x50000080
+    myjit.push_uint32_t(0x1337beef)
+    myjit.add_breakpoint(0x1337beef, code_sentinelle)
+    myjit.init_run(code_addr)
+    myjit.continue_run()
+    assert myjit.cpu.EAX == 0x88
+    assert myjit.cpu.EDI == 0x50000090
+
+
+for _ in xrange(2):
+    tempdir = tempfile.mkdtemp()
+    try:
+        run()
+    finally:
+        shutil.rmtree(tempdir)
@@ -0,0 +1,114 @@
+import os
+import sys
+import time
+import struct
+import tempfile
+
+from miasm2.analysis.sandbox import Sandbox_Win_x86_32
+
+from helpers import make_pe
+
+jit_type = sys.argv[1] if len(sys.argv) > 1 else "gcc"
+count = 200 if jit_type == "python" else 20000
+
+# Build a PE summing MulDiv(i, 3, 2) for i in [count, 1]
+pe = make_pe('''
+main:
+    XOR    EDI, EDI
+    MOV    ESI, %d
+loop:
+    PUSH   2
+    PUSH   3
+    PUSH   ESI
+    CALL   DWORD PTR [MulDiv]
+    ADD    EDI, EAX
+    DEC    ESI
+    JNZ    loop
+    MOV    EAX, EDI
+    RET
+''' % count, imports=[("kernel32.dll", ["MulDiv"])])
+expected = sum(i * 3 / 2 for i in xrange(1, count + 1))
+
+calls = []
+
+
+def kernel32_MulDiv(jitter):
+    ret_ad, args = jitter.func_args_stdcall(["number", "numerator",
+                                             "denominator"])
+    calls.append(args.number)
+    jitter.func_ret_stdcall(ret_ad,
+                            args.number * args.numerator / args.denominator)
+
+
+fdesc, fname = tempfile.mkstemp(suffix=".exe")
+os.write(fdesc, str(pe))
+os.close(fdesc)
+
+parser = Sandbox_Win_x86_32.parser()
+parser.add_argument("filename")
+options = parser.parse_args([fname, "-j", jit_type, "-q"])
+
+
+def muldiv_addr(sb):
+    """Return the address of MulDiv in @sb"""
+    for addr, name in sb.libs.fad2cname.iteritems():
+        if name == "kernel32_MulDiv":
+            return addr
+
+
+def run(stubs=True, breakpoint=None):
+    """Run the PE, through library stubs or the breakpoint path. Return the
+    sandbox and the run duration"""
+    del calls[:]
+    sb = Sandbox_Win_x86_32(options.filename, options, globals())
+    addr = muldiv_addr(sb)
+    assert addr in sb.jitter.jit.lib_stubs
+    if not stubs:
+        sb.jitter.jit.lib_stubs.clear()
+    if breakpoint is not None:
+        sb.jitter.add_breakpoint(addr, breakpoint)
+        assert addr not in sb.jitter.jit.lib_stubs
+    start = time.time()
+    sb.run()
+    duration = time.time() - start
+    assert sb.jitter.cpu.EAX == expected
+    assert calls == range(count, 0, -1)
+    return sb, duration
+
+
+try:
+    # Same result on both paths
+    _, time_stubs = run()
+    _, time_breakpoints = run(stubs=False)
+    print "%d calls: stubs %.3fs, breakpoints %.3fs" % (count, time_stubs,
+                                                        time_breakpoints)
+
+    # A user breakpoint on a library function disables its stub
+    hits = []
+
+    def on_muldiv(jitter):
+        hits.append(jitter.pc)
+        return True
+    sb, _ = run(breakpoint=on_muldiv)
+    assert len(hits) == count
+    sb.jitter.remove_breakpoints_by_callback(on_muldiv)
+    assert muldiv_addr(sb) in sb.jitter.jit.lib_stubs
+
+    # Stack arguments are read in C
+    sb = Sandbox_Win_x86_32(options.filename, options, globals())
+    cpu, vm = sb.jitter.cpu, sb.jitter.vm
+    cpu.RSP = 0x1234567800000000 | (sb.jitter.stack_base + 0x100)
+    sp = cpu.ESP
+    vm.set_mem(sp, struct.pack("<IIII", 0x401000, 1, 2, 0xffffffff))
+    assert sb.jitter.func_args_cdecl(3) == (0x401000, [1, 2, 0xffffffff])
+    assert cpu.ESP == sp + 4
+    cpu.ESP = sp
+    ret_ad, args = sb.jitter.func_args_stdcall(["a", "b", "c"])
+    assert ret_ad == 0x401000
+    assert (args.a, args.b, args.c) == (1, 2, 0xffffffff)
+    # Same types as struct.unpack
+    assert type(ret_ad) is type(args.c) is int
+    assert cpu.ESP == sp + 16
+    assert cpu.RSP >> 32 == 0x12345678
+finally:
+    os.unlink(fname)
@@ -0,0 +1,151 @@
+import os
+import shutil
+import tempfile
+
+from elfesteem import pe_init
+
+import miasm2.jitter.loader.pe as loader_pe
+from miasm2.jitter.loader.pe import vm_load_pe_libs, vm_load_pe_libs_cached, \
+    preload_pe, libimp_pe, LazyPE
+from miasm2.jitter.VmMngr import Vm
+from miasm2.jitter.csts import PAGE_READ, PAGE_WRITE
+
+
+def make_dll(name, base, exports, imports):
+    """Build a DLL @name at @base, exporting @exports and importing
+    @imports (list of (dll name, functions))"""
+    pe = pe_init.PE()
+    pe.NThdr.ImageBase = base
+    s_text = pe.SHList.add_section(name="text", addr=0x1000,
+                                   data="\xc3" * 0x100)
+    s_iat = pe.SHList.add_section(name="iat", rawsize=0x100)
+    if imports:
+        pe.DirImport.add_dlldesc([({"name": lib,
+                                    "firstthunk": s_iat.addr + 0x20 * i},
+                                   funcs)
+                                  for i, (lib, funcs) in enumerate(imports)])
+        s_imp = pe.SHList.add_section(name="imp", rawsize=len(pe.DirImport))
+        pe.DirImport.set_rva(s_imp.addr)
+    pe.DirExport.create(name)
+    for i, func in enumerate(exports):
+        pe.DirExport.add_name(func, s_text.addr + i)
+    s_exp = pe.SHList.add_section(name="exp", rawsize=len(pe.DirExport))
+    pe.DirExport.set_rva(s_exp.addr)
+    return str(pe)
+
+
+DLLS = [("a.dll", 0x7c000000, ["fa1", "fa2"], [("b.dll", ["fb1"])]),
+        ("b.dll", 0x7d000000, ["fb1"], [("a.dll", ["fa2"]),
+                                         ("z.dll", ["fz1"])]),
+        ]
+libs_name = [dll[0] for dll in DLLS]
+
+tmpdir = tempfile.mkdtemp()
+cache_path = os.path.join(tmpdir, "dll.cache")
+
+
+def load(cache=True, vm=None):
+    if vm is None:
+        vm = Vm()
+    libs = libimp_pe()
+    if cache:
+        modules = vm_load_pe_libs_cached(vm, libs_name, libs, tmpdir,
+                                         cache_path)
+    else:
+        modules = vm_load_pe_libs(vm, libs_name, libs, tmpdir)
+        for pe_obj in modules.itervalues():
+            preload_pe(vm, pe_obj, libs)
+    return vm, libs, modules
+
+
+def libs_state(libs):
+    state = dict(libs.__dict__)
+    del state["all_exported_lib"]
+    return state
+
+
+class NoParse(object):
+    """Forbid PE parsing"""
+
+    def __init__(self, *args, **kwargs):
+        raise AssertionError("PE must not be parsed")
+
+
+try:
+    for name, base, exports, imports in DLLS:
+        with open(os.path.join(tmpdir, name), "wb") as fstream:
+            fstream.write(make_dll(name, base, exports, imports))
+
+    # Reference load
+    vm_ref, libs_ref, modules_ref = load(cache=False)
+    memory = vm_ref.get_all_memory()
+    assert libs_ref.lib_imp2ad[0x7c000000]["fa1"] == 0x7c001000
+    assert "z.dll" in libs_ref.fake_libs
+
+    # Cache creation
+    vm, libs, modules = load()
+    assert os.path.exists(cache_path)
+    assert vm.get_all_memory() == memory
+    assert libs_state(libs) == libs_state(libs_ref)
+
+    # Cache use: same result, without parsing any PE
+    pe_class = loader_pe.pe_init.PE
+    loader_pe.pe_init.PE = NoParse
+    try:
+        vm, libs, modules = load()
+    finally:
+        loader_pe.pe_init.PE = pe_class
+    assert vm.get_all_memory() == memory
+    assert libs_state(libs) == libs_state(libs_ref)
+    assert sorted(modules) == sorted(libs_name)
+    assert all(isinstance(pe_obj, LazyPE) for pe_obj in modules.values())
+    assert len(libs.all_exported_lib) == len(libs_name)
+
+    ## Modules are parsed on demand
+    for name, pe_obj in modules.iteritems():
+        assert pe_obj.NThdr.ImageBase == modules_ref[name].NThdr.ImageBase
+        assert str(pe_obj) == str(modules_ref[name])
+
+    ## Writes in memory do not alter the cache
+    cache = open(cache_path, "rb").read()
+    vm.set_mem(0x7c001000, "\xcc" * 4)
+    assert open(cache_path, "rb").read() == cache
+    vm, libs, modules = load()
+    assert vm.get_all_memory() == memory
+
+    # A modified library invalidates the cache
+    fname = os.path.join(tmpdir, "a.dll")
+    with open(fname, "wb") as fstream:
+        fstream.write(make_dll("a.dll", 0x7c000000, ["fa1", "fa2", "fa3"],
+                               [("b.dll", ["fb1"])]))
+    vm, libs, modules = load()
+    assert not isinstance(modules["a.dll"], LazyPE)
+    assert "fa3" in libs.lib_imp2ad[0x7c000000]
+    vm, libs, modules = load()
+    assert isinstance(modules["a.dll"], LazyPE)
+    assert "fa3" in libs.lib_imp2ad[0x7c000000]
+
+    # Building the cache keeps the snapshots of the VM
+    os.unlink(cache_path)
+    vm = Vm()
+    vm.add_memory_page(0x10000, PAGE_READ | PAGE_WRITE, "\x00" * 0x4000)
+    vm.add_code_bloc(0x10000, 0x14000)
+    snapshot = vm.snapshot()
+    vm.set_mem(0x10000, "\xcc" * 4)
+    load(vm=vm)
+    assert os.path.exists(cache_path)
+    ## Incremental restore: only the written chunk is reported
+    assert vm.restore(snapshot) == [(0x10000, 0x1000)]
+    assert vm.get_mem(0x10000, 4) == "\x00" * 4
+    assert vm.get_memory_pages() == ((0x10000, 0x4000,
+                                      PAGE_READ | PAGE_WRITE, ""),)
+
+    # Corrupted caches are rebuilt
+    with open(cache_path, "wb") as fstream:
+        fstream.write("garbage")
+    vm, libs, modules = load()
+    assert not isinstance(modules["a.dll"], LazyPE)
+    vm, libs, modules = load()
+    assert isinstance(modules["a.dll"], LazyPE)
+finally:
+    shutil.rmtree(tmpdir)
@@ -0,0 +1,135 @@
+import os
+import sys
+import resource
+from pdb import pm
+
+from miasm2.analysis.machine import Machine
+from miasm2.jitter.csts import PAGE_READ, PAGE_WRITE
+
+from helpers import assemble_at
+
+jit_type = sys.argv[1] if len(sys.argv) > 1 else "gcc"
+
+code_addr = 0x40000000
+data_addr = 0x50000000
+data_size = 0x4000
+
+ASM = '''
+main:
+    MOV    ECX, 0x100
+loop:
+    MOV    DWORD PTR [ECX*4+0x50000000], ECX
+    LOOP   loop
+    MOV    DWORD PTR [0x50003000], 0x1337
+    MOV    EAX, patched
+    MOV    BYTE PTR [EAX+1], 0x2
+    CALL   patched
+    RET
+patched:
+    MOV    EAX, 0x1
+    RET
+'''
+
+data, _, symbol_pool = assemble_at(ASM, code_addr, {"patched": 0x100})
+patched_addr = symbol_pool.getby_name("patched").offset
+
+
+def code_sentinelle(jitter):
+    jitter.run = False
+    jitter.pc = 0
+    return True
+
+
+def run(myjit, addr):
+    myjit.push_uint32_t(0x1337beef)
+    myjit.init_run(addr)
+    myjit.continue_run()
+    assert myjit.run is False
+
+
+myjit = Machine("x86_32").jitter(jit_type)
+myjit.init_stack()
+myjit.vm.add_memory_page(code_addr, PAGE_READ | PAGE_WRITE, data)
+myjit.vm.add_memory_page(data_addr, PAGE_READ | PAGE_WRITE,
+                         "\x00" * data_size)
+myjit.add_breakpoint(0x1337beef, code_sentinelle)
+myjit.cpu.EBX = 0x1234
+
+# Take a snapshot
+snapshot = myjit.snapshot()
+memory = myjit.vm.get_all_memory()
+regs = myjit.cpu.get_gpreg()
+
+# Run: data and code are modified
+run(myjit, code_addr)
+assert myjit.cpu.EAX == 2
+assert myjit.vm.get_mem(data_addr + 4, 4) == "\x01\x00\x00\x00"
+assert myjit.vm.get_mem(data_addr + 0x3000, 4) == "\x37\x13\x00\x00"
+memory_run = myjit.vm.get_all_memory()
+regs_run = myjit.cpu.get_gpreg()
+assert memory_run != memory
+
+# Restore: memory and registers are back
+myjit.restore(snapshot)
+assert myjit.vm.get_all_memory() == memory
+assert myjit.cpu.get_gpreg() == regs
+
+## Code jitted from the patched memory must be discarded
+run(myjit, patched_addr)
+assert myjit.cpu.EAX == 1
+
+## The same run gives the same state
+myjit.restore(snapshot)
+run(myjit, code_addr)
+assert myjit.vm.get_all_memory() == memory_run
+assert myjit.cpu.get_gpreg() == regs_run
+
+# Pages added since the snapshot are removed, accesses are restored
+snapshot_run = myjit.snapshot()
+myjit.vm.add_memory_page(0x60000000, PAGE_READ, "A" * 0x10)
+myjit.vm.set_mem_access(data_addr, PAGE_READ)
+myjit.restore(snapshot)
+assert not myjit.vm.is_mapped(0x60000000, 1)
+assert myjit.vm.get_all_memory() == memory
+
+# Snapshots are not bound to the last one
+myjit.restore(snapshot_run)
+assert myjit.vm.get_all_memory() == memory_run
+assert myjit.cpu.get_gpreg() == regs_run
+myjit.vm.reset_memory_page_pool()
+myjit.restore(snapshot)
+assert myjit.vm.get_all_memory() == memory
+run(myjit, code_addr)
+assert myjit.vm.get_all_memory() == memory_run
+
+# Memory errors are raised, and leave the VM untouched
+vm_snapshot = myjit.vm.snapshot()
+big_size = 0x4000000
+big_page = (0x70000000, big_size, PAGE_READ, "big", "\x00" * big_size)
+pid = os.fork()
+if pid == 0:
+    status = 1
+    try:
+        # Leave room for less than another copy of the big page
+        vm_size = int(open("/proc/self/statm").read().split()[0])
+        vm_size *= resource.getpagesize()
+        resource.setrlimit(resource.RLIMIT_AS, (vm_size + big_size / 2,) * 2)
+        try:
+            myjit.vm.restore(vm_snapshot[:2] + (vm_snapshot[2] + (big_page,),))
+        except MemoryError:
+            if (not myjit.vm.is_mapped(big_page[0], 1) and
+                    myjit.vm.get_mem(data_addr, data_size) ==
+                    memory_run[data_addr]["data"]):
+                status = 0
+    finally:
+        os._exit(status)
+assert os.waitpid(pid, 0)[1] == 0
+del big_page
+
+# Invalid snapshots are rejected
+try:
+    myjit.cpu.restore("")
+    good = False
+except ValueError:
+    good = True
+assert good
@@ -0,0 +1,138 @@
+import os
+import sys
+import time
+import struct
+import tempfile
+
+from miasm2.analysis.machine import Machine
+from miasm2.jitter.csts import PAGE_READ, PAGE_WRITE
+from miasm2.jitter.trace import TraceReader
+
+from helpers import assemble_at
+
+jit_type = sys.argv[1] if len(sys.argv) > 1 else "gcc"
+
+code_addr = 0x40000000
+data_addr = 0x50000000
+count_addr = 0x60000000
+count = 0x100
+max_count = 0x100000
+
+ASM = '''
+main:
+    MOV    ECX, DWORD PTR [0x60000000]
+loop:
+    MOV    DWORD PTR [ECX*4+0x50000000], ECX
+    MOV    EAX, DWORD PTR [ECX*4+0x50000000]
+    LOOP   loop
+    CALL   func
+    RET
+func:
+    MOV    EBX, 0x1234
+    RET
+'''
+
+data, _, symbol_pool = assemble_at(ASM, code_addr, {"func": 0x100})
+loop_addr = symbol_pool.getby_name("loop").offset
+func_addr = symbol_pool.getby_name("func").offset
+
+
+def code_sentinelle(jitter):
+    jitter.run = False
+    jitter.pc = 0
+    return True
+
+myjit = Machine("x86_32").jitter(jit_type)
+myjit.init_stack()
+myjit.vm.add_memory_page(code_addr, PAGE_READ | PAGE_WRITE, data)
+myjit.vm.add_memory_page(data_addr, PAGE_READ | PAGE_WRITE,
+                         "\x00" * (max_count + 1) * 4)
+myjit.vm.add_memory_page(count_addr, PAGE_READ | PAGE_WRITE,
+                         struct.pack("<I", count))
+myjit.add_breakpoint(0x1337beef, code_sentinelle)
+
+
+def run(**kwargs):
+    """Run the code, tracing it with @kwargs, and return the trace reader"""
+    fdesc, fname = tempfile.mkstemp(suffix=".trace")
+    os.close(fdesc)
+    myjit.trace_start(fname, **kwargs)
+    myjit.push_uint32_t(0x1337beef)
+    myjit.init_run(code_addr)
+    myjit.continue_run()
+    myjit.trace_stop()
+    trace = TraceReader(fname)
+    os.unlink(fname)
+    return trace
+
+# Blocks, registers and memory accesses
+offsets = myjit.cpu_offsets
+with run(regs=True, mem=True, buffer_size=0x100) as trace:
+    assert trace.has_regs and trace.has_mem
+    # The first iteration is part of the main block
+    loops = 1
+    for block, state in trace.states():
+        mem = [tuple(access) for access in block.mem]
+        if block.addr == code_addr:
+            addr = data_addr + count * 4
+            assert mem == [(False, 4, count_addr, count),
+                           (True, 4, addr, count), (False, 4, addr, count)]
+        elif block.addr == loop_addr:
+            ecx = count - loops
+            assert state.get(offsets["RCX"]) & 0xffffffff == ecx
+            addr = data_addr + ecx * 4
+            assert mem == [(True, 4, addr, ecx), (False, 4, addr, ecx)]
+            loops += 1
+        elif block.addr == func_addr:
+            assert state.get(offsets["RIP"]) == func_addr
+            assert state.get(offsets["RBX"]) == 0
+    assert loops == count
+    # Last block is the RET following the CALL
+    assert state.get(offsets["RBX"]) == 0x1234
+
+# Address ranges
+with run(ranges=[(func_addr, func_addr + 1)]) as trace:
+    assert [(block.addr, block.regs, block.mem)
+            for block in trace] == [(func_addr, {}, [])]
+
+# Sampling
+with run(sample=16, ranges=[(loop_addr, loop_addr + 1)]) as trace:
+    assert len(list(trace)) == len(range(0, count - 1, 16))
+
+# Registers are only read from a JitCpu, within its state
+from miasm2.jitter.csts import TRACE_REGS
+fdesc, fname = tempfile.mkstemp(suffix=".trace")
+os.close(fdesc)
+small_cpu = Machine("msp430").jitter(jit_type).cpu
+for cpu, cpu_size in [(object(), 8), (myjit.vm, 8),
+                      (small_cpu, len(small_cpu.snapshot()) + 1)]:
+    try:
+        myjit.vm.trace_start(fname, TRACE_REGS, 0x100, 1, [], cpu, cpu_size)
+    except TypeError:
+        pass
+    else:
+        raise AssertionError("invalid cpu must be rejected")
+    assert not myjit.vm.trace_is_active()
+os.unlink(fname)
+
+# Big traces
+if jit_type != "python":
+    count = max_count
+    myjit.vm.set_mem(count_addr, struct.pack("<I", count))
+    myjit.push_uint32_t(0x1337beef)
+    myjit.init_run(code_addr)
+    start = time.time()
+    myjit.continue_run()
+    time_none = time.time() - start
+    start = time.time()
+    trace = run()
+    time_blocks = time.time() - start
+    start = time.time()
+    assert sum(1 for _ in trace) == count + 3
+    time_read = time.time() - start
+    start = time.time()
+    trace = run(regs=True, mem=True)
+    time_full = time.time() - start
+    print "%d blocks: no trace %.3fs, blocks %.3fs, full %.3fs, " \
+        "read blocks %.3fs" % (count, time_none, time_blocks, time_full,
+                               time_read)
@@ -0,0 +1,79 @@
+import os
+import tempfile
+
+from elfesteem import pe_init
+
+from miasm2.jitter.csts import PAGE_READ, PAGE_WRITE
+from miasm2.jitter.loader.pe import vm_load_pe
+from miasm2.jitter.loader.utils import vm_map_data
+from miasm2.jitter.VmMngr import Vm
+
+# Build a PE with sections whose raw data is shorter than their size
+pe = pe_init.PE()
+text = pe.SHList.add_section(name="text", addr=0x1000,
+                             data="\xcc" * 0x1234)
+data = pe.SHList.add_section(name="data", data="".join(chr(i & 0xff)
+                                                      for i in xrange(0x300)))
+bss = pe.SHList.add_section(name="bss", rawsize=0)
+pe.Opthdr.AddressOfEntryPoint = text.addr
+content = str(pe)
+
+fd, fname = tempfile.mkstemp()
+os.write(fd, content)
+os.close(fd)
+
+
+def load(**kwargs):
+    vm = Vm()
+    with open(fname) as fstream:
+        fdata = fstream.read()
+        if kwargs.pop("mapped", False):
+            kwargs["fstream"] = fstream
+        pe_obj = vm_load_pe(vm, fdata, **kwargs)
+    return vm, pe_obj
+
+
+try:
+    for kwargs in [{}, {"load_hdr": False}, {"align_s": False}]:
+        vm_copy, pe_copy = load(**kwargs)
+        vm_map, pe_map = load(mapped=True, **kwargs)
+        memory = vm_copy.get_all_memory()
+        assert vm_map.get_all_memory() == memory
+
+        # Sections are padded with null bytes
+        for section in pe_map.SHList:
+            addr = pe_map.rva2virt(section.addr)
+            raw = str(section.data)
+            assert memory[addr]["data"][:len(raw)] == raw
+            assert memory[addr]["data"][len(raw):].strip("\x00") == ""
+
+        # Guest writes do not reach the file
+        text_addr = pe_map.rva2virt(text.addr)
+        vm_map.set_mem(text_addr, "\x90" * 0x10)
+        assert vm_map.get_mem(text_addr, 0x11) == "\x90" * 0x10 + "\xcc"
+        assert open(fname).read() == content
+
+    # Header is mapped from the file
+    vm_map, pe_map = load(mapped=True)
+    hdr_addr = pe_map.NThdr.ImageBase
+    assert vm_map.get_mem(hdr_addr, 2) == "MZ"
+
+    # Not aligned PE: one big page, still equal to the copied one
+    with open(fname, "w") as fstream:
+        data.addr |= 0x10
+        fstream.write(str(pe))
+    vm_copy, _ = load()
+    vm_map, pe_map = load(mapped=True)
+    assert len(vm_map.get_all_memory()) == 1
+    assert vm_map.get_all_memory() == vm_copy.get_all_memory()
+    assert vm_map.get_mem(pe_map.rva2virt(data.addr), 3) == "\x00\x01\x02"
+finally:
+    os.unlink(fname)
+
+# Helper fallbacks
+vm = Vm()
+vm_map_data(vm, 0x1000, PAGE_READ | PAGE_WRITE, "abc", 0x10)
+assert vm.get_mem(0x1000, 0x10) == "abc" + "\x00" * 0xd
+vm_map_data(vm, 0x2000, PAGE_READ, "", 0x2000, "empty")
+assert vm.get_mem(0x2000, 0x2000) == "\x00" * 0x2000
+assert vm.get_all_memory()[0x2000]["access"] == PAGE_READ
@@ -0,0 +1,67 @@
+import time
+
+from miasm2.jitter.VmMngr import Vm
+from miasm2.jitter.csts import PAGE_READ, PAGE_WRITE
+from miasm2.core.types import get_str
+
+vm = Vm()
+vm.init_memory_page_pool()
+vm.init_code_bloc_pool()
+vm.init_memory_breakpoint()
+# Two contiguous pages, strings may cross their boundary
+vm.add_memory_page(0x1000, PAGE_READ | PAGE_WRITE, "\x00" * 0x1000)
+vm.add_memory_page(0x2000, PAGE_READ | PAGE_WRITE, "\x00" * 0x1000)
+
+# ANSI strings
+vm.set_mem(0x1ffd, "miasm\x00")
+assert vm.strlen(0x1ffd) == 5
+assert vm.strlen(0x1ffd, 3) == 3
+assert vm.get_cstr(0x1ffd) == "miasm"
+assert vm.get_cstr(0x1ffd, 2) == "mi"
+assert vm.get_cstr(0x2002) == ""
+assert vm.find_byte(0x1ffd, ord("s")) == 3
+assert vm.find_byte(0x1ffd, ord("z"), 6) == -1
+
+# Wide strings, with a character split across pages
+vm.set_mem(0x1ffb, "m\x00i\x00a\x00s\x00m\x00\x00\x00")
+assert vm.wcslen(0x1ffb) == 5
+assert vm.get_wstr(0x1ffb) == "miasm".encode("utf-16le")
+assert vm.get_wstr(0x1ffb, 2) == "mi".encode("utf-16le")
+assert get_str(vm, 0x1ffb, "utf-16le") == u"miasm"
+assert get_str(vm, 0x1ffb, "utf-16le", max_char=3) == u"mi"
+
+# Unterminated strings stop on unmapped memory
+vm.set_mem(0x2ffe, "ab")
+try:
+    vm.strlen(0x2ffe)
+except RuntimeError:
+    pass
+else:
+    raise AssertionError("unmapped memory must raise")
+assert vm.get_cstr(0x2ffe, 2) == "ab"
+
+# memset / memcmp
+vm.memset(0x1ff0, 0x41, 0x20)
+assert vm.get_mem(0x1fef, 0x22) == "\x00" + "A" * 0x20 + "\x00"
+assert vm.memcmp(0x1ff0, 0x1ff8, 0x10) == 0
+assert vm.memcmp(0x1ff0, 0x2008, 0x10) == 1
+assert vm.memcmp(0x2008, 0x1ff0, 0x10) == -1
+
+# Comparison with a byte per byte read
+vm.memset(0x1000, 0x42, 0x1800)
+
+
+def get_str_bytes(addr):
+    length = 0
+    while vm.get_mem(addr + length, 1) != "\x00":
+        length += 1
+    return vm.get_mem(addr, length)
+
+start = time.time()
+assert get_str_bytes(0x1000) == "B" * 0x1800
+time_python = time.time() - start
+start = time.time()
+assert vm.get_cstr(0x1000) == "B" * 0x1800
+time_c = time.time() - start
+print "0x1800 bytes string: get_cstr %.6fs, byte per byte %.6fs" % (time_c,
+                                                                   time_python)
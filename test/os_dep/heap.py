@@ -0,0 +1,93 @@
+from miasm2.jitter.VmMngr import Vm
+from miasm2.jitter.csts import PAGE_READ, PAGE_WRITE, PAGE_EXEC
+from miasm2.os_dep.common import heap
+
+
+def new_vm():
+    vm = Vm()
+    vm.init_memory_page_pool()
+    vm.init_code_bloc_pool()
+    vm.init_memory_breakpoint()
+    return vm
+
+# Chunks
+vm = new_vm()
+hp = heap()
+addr1 = hp.malloc(vm, 0x20)
+addr2 = hp.malloc(vm, 0x20)
+assert addr1 != addr2
+assert hp.msize(addr1) == 0x20
+vm.set_mem(addr1, "A" * 0x20)
+assert vm.get_mem(addr2, 0x20) == "\x00" * 0x20
+
+# Freed chunks are reused, zeroed
+assert hp.free(vm, addr1)
+assert hp.msize(addr1) is None
+assert not hp.free(vm, addr1)
+addr3 = hp.malloc(vm, 0x18)
+assert addr3 == addr1
+assert vm.get_mem(addr3, 0x18) == "\x00" * 0x18
+
+# Realloc keeps data
+vm.set_mem(addr3, "B" * 0x18)
+assert hp.realloc(vm, addr3, 0x20) == addr3
+assert vm.get_mem(addr3, 0x20) == "B" * 0x18 + "\x00" * 8
+addr4 = hp.realloc(vm, addr3, 0x100)
+assert addr4 != addr3
+assert hp.msize(addr4) == 0x100
+assert vm.get_mem(addr4, 0x20) == "B" * 0x18 + "\x00" * 8
+assert hp.msize(addr3) is None
+assert hp.realloc(vm, 0, 0x10) != 0
+assert hp.realloc(vm, addr4, 0) == 0
+assert hp.msize(addr4) is None
+
+# Big allocations and regions
+big = hp.malloc(vm, 0x20000)
+assert big in hp.regions
+assert hp.free(vm, big)
+assert big not in hp.regions
+assert hp.malloc(vm, 0x20000) == big
+assert vm.get_mem(big, 0x10) == "\x00" * 0x10
+
+region = hp.vm_alloc(vm, 0x1800, PAGE_READ | PAGE_EXEC)
+assert hp.regions[region] == 0x2000
+assert hp.unmap_region(vm, region)
+assert not hp.unmap_region(vm, region)
+assert vm.get_all_memory()[region]["access"] == 0
+assert hp.map_region(vm, 0x2000, PAGE_READ | PAGE_WRITE) == region
+assert vm.get_all_memory()[region]["access"] == PAGE_READ | PAGE_WRITE
+vm.set_mem(region, "C")
+
+# Red-zones
+vm = new_vm()
+hp = heap(redzone=8)
+addr = hp.malloc(vm, 0x20)
+vm.set_mem(addr, "D" * 0x20)
+hp.check(vm)
+vm.set_mem(addr + 0x20, "E")
+try:
+    hp.free(vm, addr)
+except ValueError:
+    pass
+else:
+    raise AssertionError("overflow must be detected")
+
+addr = hp.malloc(vm, 0x20)
+vm.set_mem(addr - 1, "F")
+try:
+    hp.realloc(vm, addr, 0x40)
+except ValueError:
+    pass
+else:
+    raise AssertionError("underflow must be detected")
+
+# Shrinking a chunk extends its red-zone
+addr = hp.malloc(vm, 0x20)
+assert hp.realloc(vm, addr, 0x10) == addr
+vm.set_mem(addr + 0x10, "G")
+try:
+    hp.check_chunk(vm, addr)
+except ValueError:
+    pass
+else:
+    raise AssertionError("overflow must be detected")
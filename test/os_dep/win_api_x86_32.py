@@ -48,6 +48,26 @@ class TestWinAPI(unittest.TestCase):
         lpMem = jit.cpu.EAX
         self.assertTrue(lpMem)
 
+        # LPVOID WINAPI HeapReAlloc(_In_ HANDLE hHeap, _In_ DWORD dwFlags, _In_ LPVOID lpMem, _In_ SIZE_T dwBytes);
+        jit.vm.set_mem(lpMem, "miasm")
+        jit.push_uint32_t(0x100)  # dwBytes
+        jit.push_uint32_t(lpMem)  # lpMem
+        jit.push_uint32_t(0)      # dwFlags
+        jit.push_uint32_t(0)      # hHeap
+        jit.push_uint32_t(0)      # @return
+        winapi.kernel32_HeapReAlloc(jit)
+        self.assertNotEqual(jit.cpu.EAX, lpMem)
+        lpMem = jit.cpu.EAX
+        self.assertEqual(jit.vm.get_mem(lpMem, 6), "miasm\x00")
+
+        # SIZE_T WINAPI HeapSize(_In_ HANDLE hHeap, _In_ DWORD dwFlags, _In_ LPCVOID lpMem);
+        jit.push_uint32_t(lpMem)  # lpMem
+        jit.push_uint32_t(0)      # dwFlags
+        jit.push_uint32_t(0)      # hHeap
+        jit.push_uint32_t(0)      # @return
+        winapi.kernel32_HeapSize(jit)
+        self.assertEqual(jit.cpu.EAX, 0x100)
+
         # BOOL WINAPI HeapFree(_In_ HANDLE hHeap, _In_ DWORD dwFlags, _In_ LPVOID lpMem);
         jit.push_uint32_t(lpMem)  # lpMem
         jit.push_uint32_t(0)      # dwFlags
@@ -72,6 +92,25 @@ class TestWinAPI(unittest.TestCase):
         hMem = jit.cpu.EAX
         self.assertFalse(hMem)
 
+        # LPVOID WINAPI VirtualAlloc(_In_opt_ LPVOID lpAddress, _In_ SIZE_T dwSize, _In_ DWORD flAllocationType, _In_ DWORD flProtect);
+        jit.push_uint32_t(0x40)   # flProtect
+        jit.push_uint32_t(0x1000) # flAllocationType
+        jit.push_uint32_t(0x1800) # dwSize
+        jit.push_uint32_t(0)      # lpAddress
+        jit.push_uint32_t(0)      # @return
+        winapi.kernel32_VirtualAlloc(jit)
+        lpAddress = jit.cpu.EAX
+        self.assertTrue(lpAddress)
+
+        # BOOL WINAPI VirtualFree(_In_ LPVOID lpAddress, _In_ SIZE_T dwSize, _In_ DWORD dwFreeType);
+        for ret in [1, 0]:
+            jit.push_uint32_t(0x8000)    # dwFreeType
+            jit.push_uint32_t(0)         # dwSize
+            jit.push_uint32_t(lpAddress) # lpAddress
+            jit.push_uint32_t(0)         # @return
+            winapi.kernel32_VirtualFree(jit)
+            self.assertEqual(jit.cpu.EAX, ret)
+
     def test_ProcessAndThreadFunctions(self):
 
         # HANDLE WINAPI GetCurrentProcess(void);
@@ -109,6 +148,56 @@ class TestWinAPI(unittest.TestCase):
         dwTime = jit.cpu.EAX
         self.assertTrue(dwTime)
 
+    def test_StringFunctions(self):
+
+        addr = jit.stack_base + 0x100
+        jit.vm.set_mem(addr, "miasm\x00m\x00i\x00a\x00s\x00m\x00\x00\x00")
+
+        # int WINAPI lstrlenA(_In_ LPCSTR lpString);
+        jit.push_uint32_t(addr)   # lpString
+        jit.push_uint32_t(0)      # @return
+        winapi.kernel32_lstrlenA(jit)
+        self.assertEqual(jit.cpu.EAX, 5)
+
+        # int WINAPI lstrlenW(_In_ LPCWSTR lpString);
+        jit.push_uint32_t(addr + 6)  # lpString
+        jit.push_uint32_t(0)         # @return
+        winapi.kernel32_lstrlenW(jit)
+        self.assertEqual(jit.cpu.EAX, 5)
+
+        # int WINAPI lstrcmpiW(_In_ LPCWSTR lpString1, _In_ LPCWSTR lpString2);
+        jit.push_uint32_t(addr + 6)  # lpString2
+        jit.push_uint32_t(addr + 6)  # lpString1
+        jit.push_uint32_t(0)         # @return
+        winapi.kernel32_lstrcmpiW(jit)
+        self.assertEqual(jit.cpu.EAX, 0)
+
+        # void *memset(void *dest, int c, size_t count);
+        jit.push_uint32_t(3)      # count
+        jit.push_uint32_t(0x41)   # c
+        jit.push_uint32_t(addr)   # dest
+        jit.push_uint32_t(0)      # @return
+        winapi.msvcrt_memset(jit)
+        jit.cpu.ESP += 12
+        self.assertEqual(jit.vm.get_mem(addr, 6), "AAAsm\x00")
+
+        # int memcmp(const void *buffer1, const void *buffer2, size_t count);
+        jit.push_uint32_t(2)         # count
+        jit.push_uint32_t(addr + 1)  # buffer2
+        jit.push_uint32_t(addr)      # buffer1
+        jit.push_uint32_t(0)         # @return
+        winapi.msvcrt_memcmp(jit)
+        jit.cpu.ESP += 12
+        self.assertEqual(jit.cpu.EAX, 0)
+        jit.vm.set_mem(addr + 2, "B")
+        jit.push_uint32_t(2)         # count
+        jit.push_uint32_t(addr + 1)  # buffer2
+        jit.push_uint32_t(addr)      # buffer1
+        jit.push_uint32_t(0)         # @return
+        winapi.msvcrt_memcmp(jit)
+        jit.cpu.ESP += 12
+        self.assertEqual(jit.cpu.EAX, 0xffffffff)
+
     def test_ToolHelpFunctions(self):
 
         # HANDLE WINAPI CreateToolhelp32Snapshot(_In_ DWORD dwFlags, _In_ DWORD th32ProcessID);
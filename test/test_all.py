@@ -234,6 +234,8 @@ for script in ["modint.py",
 ## IR
 for script in ["ir2C.py",
                "symbexec.py",
+               "lifting.py",
+               "ir_graph.py",
                ]:
     testset += RegressionTest([script], base_dir="ir")
 testset += RegressionTest(["analysis.py"], base_dir="ir",
@@ -249,6 +251,7 @@ testset += RegressionTest(["smt2.py"], base_dir="ir/translators",
 for script in ["win_api_x86_32.py",
                ]:
     testset += RegressionTest([script], base_dir="os_dep", tags=[TAGS['tcc']])
+testset += RegressionTest(["heap.py"], base_dir="os_dep")
 
 ## Analysis
 testset += RegressionTest(["depgraph.py"], base_dir="analysis",
@@ -267,6 +270,7 @@ testset += RegressionTest(["depgraph.py"], base_dir="analysis",
                                                         (12, 1), (13, 1),
                                                         (14, 1), (15, 1)))
                            for fname in fnames])
+testset += RegressionTest(["data_analysis.py"], base_dir="analysis")
 
 ## Degraph
 class TestDepgraph(RegressionTest):
@@ -278,6 +282,7 @@ class TestDepgraph(RegressionTest):
 
     def __init__(self, test_nb, implicit, base_addr, target_addr, elements,
                  *args, **kwargs):
+        jobs = kwargs.pop("jobs", None)
         super(TestDepgraph, self).__init__([self.launcher],
                                            *args, **kwargs)
         self.base_dir = os.path.join(self.base_dir, "analysis")
@@ -298,6 +303,8 @@ class TestDepgraph(RegressionTest):
             hex(target_addr)] + elements
         if implicit:
             self.command_line.append("-i")
+        if jobs:
+            self.command_line += ["-j", str(jobs)]
 
 # Depgraph emulation regression test
 test_args = [(0x401000, 0x40100d, ["EAX"]),
@@ -317,11 +324,31 @@ for i, test_args in enumerate(test_args):
     testset += test_dg
     testset += TestDepgraph(i, False, *test_args, depends=[test_dg])
     testset += TestDepgraph(i, True, *test_args, depends=[test_dg])
+    testset += TestDepgraph(i, True, *test_args, depends=[test_dg], jobs=2)
 
 ## Jitter
 for script in ["jitload.py",
                ]:
     testset += RegressionTest([script], base_dir="jitter", tags=[TAGS["tcc"]])
+testset += RegressionTest(["vm_load.py"], base_dir="jitter")
+testset += RegressionTest(["vm_str.py"], base_dir="jitter")
+testset += RegressionTest(["pe_cache.py"], base_dir="jitter")
+for jitter in ["tcc", "llvm", "python", "gcc"]:
+    tags = [TAGS[jitter]] if jitter in TAGS else []
+    testset += RegressionTest(["snapshot.py", jitter], base_dir="jitter",
+                              tags=tags)
+    testset += RegressionTest(["fork_server.py", jitter], base_dir="jitter",
+                              tags=tags)
+    testset += RegressionTest(["batch.py", jitter], base_dir="jitter",
+                              tags=tags)
+    testset += RegressionTest(["lib_stubs.py", jitter], base_dir="jitter",
+                              tags=tags)
+    testset += RegressionTest(["trace.py", jitter], base_dir="jitter",
+                              tags=tags)
+    testset += RegressionTest(["coverage.py", jitter], base_dir="jitter",
+                              tags=tags)
+    testset += RegressionTest(["jitters.py", jitter], base_dir="jitter",
+                              tags=tags)
 
 
 # Examples
@@ -428,6 +455,10 @@ for script, prods in [(["single_instr.py"], []),
                         "0x407570"], ["graph.dot"]),
                       (["full.py", Example.get_sample("box_upx.exe")],
                        ["graph_execflow.dot", "lines.dot"]),
+                      (["linear.py", Example.get_sample("box_upx.exe"),
+                        "x86_32"], []),
+                      (["linear.py", "-b", Example.get_sample("md5_arm"),
+                        "arml", "-s", "0x400", "-e", "0x800"], []),
                       ]:
     testset += ExampleDisassembler(script, products=prods)
 
@@ -525,7 +556,8 @@ class ExampleSymbolExec(Example):
 
 testset += ExampleSymbolExec(["single_instr.py"])
 for options, nb_sol, tag in [([], 8, []),
-                             (["-i", "--rename-args"], 12, [TAGS["z3"]])]:
+                             (["-i", "--rename-args"], 12, [TAGS["z3"]]),
+                             (["-j", "2", "--rename-args"], 12, [TAGS["z3"]])]:
     testset += ExampleSymbolExec(["depgraph.py",
                                   Example.get_sample("simple_test.bin"),
                                   "-m", "x86_32", "0x0", "0x8b",
@@ -535,7 +567,8 @@ for options, nb_sol, tag in [([], 8, []),
                                  tags=tag)
 
 for options, nb_sol, tag in [([], 4, []),
-                             (["-i", "--rename-args"], 4, [TAGS["z3"]])]:
+                             (["-i", "--rename-args"], 4, [TAGS["z3"]]),
+                             (["-j", "2", "--rename-args"], 4, [TAGS["z3"]])]:
     testset += ExampleSymbolExec(["depgraph.py",
                                   Example.get_sample("x86_32_if_reg.bin"),
                                   "-m", "x86_32", "0x0", "0x19",